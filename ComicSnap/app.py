@@ -1,206 +1,289 @@
 from flask import Flask, jsonify, request, g, render_template, session
-from werkzeug.security import generate_password_hash, check_password_hash
 import sqlite3
 from config import Config
 from raccomandazioni import SistemaRaccomandazione
+from vicini_approssimati import IndiceCondiviso, IndiceMinHash
+from fattorizzazione import ModelloCondiviso, MotoreFattorizzazione
+from matrice_rating import MatriceRating
+from candidati import (ArricchimentoComicVine, CandidatiCacheRicerche, CandidatiDaiVicini,
+                       CandidatiEditoriPreferiti)
+from cache_ricerche import CacheRicerche
+from profili import CacheProfili
+from metriche import LIMITI_ISTRUZIONI, RegistroMetriche
+from scritture import (ErroreScritturaScaduta, ScrittoreRaggruppato, esegui_scrittura, importa_letture,
+                       normalizza_lettura)
+from hash_password import ErroreSovraccarico, HashPassword
+import archivio_raccomandazioni
+import catalogo
+import migrazioni
+import somme_similarita
+from database import GestoreConnessioni
+from coalescenza import SingoloVolo, LeaseSQLite
 from datetime import datetime, timezone
 import jwt
 import functools
-import requests
+import comicvine
+from comicvine import ErroreComicVine, Volume
 import uuid
-import xml.etree.ElementTree as ET
+import time
+import json
+import os
+import re
+import cProfile
+from concurrent.futures import ThreadPoolExecutor
 
 # Inizializzazione dell'app Flask
 app = Flask(__name__)
 app.config.from_object(Config)
  
+# Eccezione sollevata quando l'header Authorization non contiene un token valido
+class ErroreAutenticazione(Exception):
+    pass
+
+# Verifica il token JWT contenuto nell'header Authorization ('Bearer <token>')
+# Restituisce l'ID dell'utente oppure solleva ErroreAutenticazione con il messaggio per il client
+# È condivisa dalle route Flask e da quelle servite in modalità ASGI (asgi.py)
+def verifica_token(token):
+    if not token:
+        raise ErroreAutenticazione('Token mancante')
+        
+    try:
+        # Estrae il token dalla stringa 'Bearer <token>'
+        token = token.split()[1]  
+        # Decodifica e verifica il token
+        data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
+    except jwt.ExpiredSignatureError:
+        raise ErroreAutenticazione('Token scaduto')
+    except jwt.InvalidTokenError:
+        raise ErroreAutenticazione('Token non valido')
+        
+    # Verifica scadenza token
+    exp_timestamp = data.get('exp')
+    if not exp_timestamp:
+        raise ErroreAutenticazione('Token non valido: manca scadenza')
+        
+    # Confronta il timestamp corrente con la scadenza del token
+    current_timestamp = datetime.now(timezone.utc).timestamp()
+    if current_timestamp > exp_timestamp:
+        raise ErroreAutenticazione('Token scaduto')
+    
+    return data['utente_id']
+
 # Middleware per verificare il token JWT
 # Si usa per far si che le route protette siano accessibili solo con un token valido
 def richiedi_auth(f):
     @functools.wraps(f)
     def decorated(*args, **kwargs):
-        token = request.headers.get('Authorization')
-        
-        if not token:
-            return jsonify({'message': 'Token mancante'}), 401
-            
         try:
-            # Estrae il token dalla stringa 'Bearer <token>'
-            token = token.split()[1]  
-            # Decodifica e verifica il token
-            data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
-            
-            # Verifica scadenza token
-            exp_timestamp = data.get('exp')
-            if not exp_timestamp:
-                return jsonify({'message': 'Token non valido: manca scadenza'}), 401
-                
-            # Confronta il timestamp corrente con la scadenza del token
-            current_timestamp = datetime.now(timezone.utc).timestamp()
-            if current_timestamp > exp_timestamp:
-                return jsonify({'message': 'Token scaduto'}), 401
-                
             # Memorizza l'ID utente nel contesto globale di Flask
-            g.utente_id = data['utente_id']
-        except jwt.ExpiredSignatureError:
-            return jsonify({'message': 'Token scaduto'}), 401
-        except jwt.InvalidTokenError:
-            return jsonify({'message': 'Token non valido'}), 401
+            g.utente_id = verifica_token(request.headers.get('Authorization'))
+        except ErroreAutenticazione as e:
+            return jsonify({'message': str(e)}), 401
             
         return f(*args, **kwargs)
     return decorated
 
+# Gestore delle connessioni SQLite: una connessione per thread, riusata tra le richieste
+gestore_db = GestoreConnessioni(
+    app.config['DATABASE_PATH'],
+    timeout_secondi=app.config['DB_BUSY_TIMEOUT_SECONDS'],
+    mmap_size=app.config['DB_MMAP_SIZE'],
+    cache_size_kb=app.config['DB_CACHE_SIZE_KB'],
+    istruzioni_in_cache=app.config['DB_CACHED_STATEMENTS']
+)
+
 # Funzione helper per la connessione al database SQLite
+# Restituisce la connessione del thread corrente, associata alla richiesta tramite g
 def connetti_db():
-    conn = sqlite3.connect(app.config['DATABASE_PATH'])
-    # Permette l'accesso alle colonne per nome invece che per indice
-    conn.row_factory = sqlite3.Row  
-    return conn
+    if 'db' not in g:
+        g.db = gestore_db.connessione()
+    return g.db
+
+# Scrittore in background che raggruppa in una transazione le scritture singole di più richieste
+# (solo con DB_GROUP_COMMIT); usa una connessione propria del suo thread
+scrittore_raggruppato = ScrittoreRaggruppato(
+    gestore_db.connessione,
+    intervallo_secondi=app.config['DB_GROUP_COMMIT_INTERVAL_MS'] / 1000,
+    scritture_max=app.config['DB_GROUP_COMMIT_MAX_WRITES'],
+    attesa_secondi=app.config['DB_BUSY_TIMEOUT_SECONDS']
+) if app.config['DB_GROUP_COMMIT'] else None
+
+# Alla fine di ogni richiesta la connessione torna al gestore senza essere chiusa
+@app.teardown_appcontext
+def rilascia_db(exception):
+    conn = g.pop('db', None)
+    if conn is not None:
+        gestore_db.rilascia(conn)
+
+# Metriche del processo, esposte in formato Prometheus su /metrics
+metriche = RegistroMetriche()
+metriche.registra_istogramma('richiesta_secondi', 'Durata delle richieste HTTP per route')
+metriche.registra_istogramma('richiesta_sql_istruzioni', 'Istruzioni SQL eseguite da una richiesta', LIMITI_ISTRUZIONI)
+metriche.registra_istogramma('richiesta_sql_secondi', 'Tempo speso nelle istruzioni SQL da una richiesta')
+metriche.registra_istogramma('raccomandazioni_fase_secondi', 'Durata delle fasi del calcolo delle raccomandazioni')
+metriche.registra_contatore('richieste_lente', 'Richieste più lente di SLOW_REQUEST_MS')
+
+# Inizio della misura di ogni richiesta: istante, istruzioni SQL già eseguite dalla connessione
+# del thread e, con SLOW_REQUEST_PROFILE_DIR, un profilo cProfile della richiesta
+@app.before_request
+def inizia_misura():
+    g.inizio_richiesta = time.perf_counter()
+    g.istruzioni_iniziali = gestore_db.istruzioni_thread()
+    if app.config['SLOW_REQUEST_PROFILE_DIR']:
+        profilo = cProfile.Profile()
+        try:
+            profilo.enable()
+            g.profilo_richiesta = profilo
+        except ValueError:
+            # Un altro profiler è già attivo (da Python 3.12 ne è ammesso uno solo per processo)
+            pass
+
+# Registra durata e istruzioni SQL della richiesta; le richieste più lente di SLOW_REQUEST_MS
+# vengono segnalate nel log dell'applicazione e, se profilate, il loro profilo viene salvato in
+# SLOW_REQUEST_PROFILE_DIR e il percorso del file aggiunto alla segnalazione
+@app.after_request
+def registra_misura(risposta):
+    inizio = g.pop('inizio_richiesta', None)
+    if inizio is None:
+        return risposta
+    durata = time.perf_counter() - inizio
+    profilo = g.pop('profilo_richiesta', None)
+    if profilo is not None:
+        profilo.disable()
+
+    istruzioni, tempo_sql = gestore_db.istruzioni_thread()
+    istruzioni_iniziali, tempo_sql_iniziale = g.pop('istruzioni_iniziali', (0, 0.0))
+    istruzioni, tempo_sql = max(istruzioni - istruzioni_iniziali, 0), max(tempo_sql - tempo_sql_iniziale, 0.0)
+    route = request.url_rule.rule if request.url_rule else 'sconosciuta'
+    metriche.osserva('richiesta_secondi', durata, route=route, metodo=request.method, stato=risposta.status_code)
+    metriche.osserva('richiesta_sql_istruzioni', istruzioni, route=route)
+    metriche.osserva('richiesta_sql_secondi', tempo_sql, route=route)
+
+    soglia = app.config['SLOW_REQUEST_MS']
+    if soglia > 0 and durata * 1000 >= soglia:
+        metriche.incrementa('richieste_lente', route=route)
+        messaggio = (f"Richiesta lenta: {request.method} {request.path} {risposta.status_code} in {durata * 1000:.1f} ms, "
+                     f"{istruzioni} istruzioni SQL in {tempo_sql * 1000:.1f} ms")
+        if profilo is not None:
+            cartella = app.config['SLOW_REQUEST_PROFILE_DIR']
+            os.makedirs(cartella, exist_ok=True)
+            nome = re.sub(r'[^A-Za-z0-9]+', '_', route).strip('_') or 'radice'
+            percorso = os.path.join(cartella, f"{time.time():.3f}_{request.method}_{nome}.prof")
+            profilo.dump_stats(percorso)
+            messaggio += f", profilo salvato in {percorso}"
+        app.logger.warning(messaggio)
+    return risposta
 
 # Inizializzazione del database
+# Crea le tabelle o aggiorna lo schema esistente tramite le migrazioni versionate
 def inizializza_db():
-    conn = connetti_db()
-    cursor = conn.cursor()
-    
-    # Creazione delle tabelle con relativi vincoli e relazioni
-    cursor.executescript('''
-        -- Tabella per gli utenti registrati
-        CREATE TABLE IF NOT EXISTS utenti (
-            id INTEGER PRIMARY KEY,
-            username TEXT NOT NULL UNIQUE,
-            password_hash TEXT NOT NULL,
-            data_registrazione DATETIME DEFAULT CURRENT_TIMESTAMP
-        );
-
-        -- Tabella per memorizzare le preferenze degli utenti sui fumetti
-        CREATE TABLE IF NOT EXISTS preferenze_utente (
-            id INTEGER PRIMARY KEY,
-            utente_id INTEGER,
-            comic_id TEXT NOT NULL,
-            genere TEXT NOT NULL,
-            peso REAL DEFAULT 1.0,
-            FOREIGN KEY (utente_id) REFERENCES utenti (id)
-        );
-
-        -- Tabella per tracciare i fumetti letti dagli utenti con valutazione
-        CREATE TABLE IF NOT EXISTS fumetti_letti (
-            id INTEGER PRIMARY KEY,
-            utente_id INTEGER,
-            comic_id TEXT NOT NULL,
-            rating INTEGER CHECK (rating >= 1 AND rating <= 5),
-            data_lettura DATETIME DEFAULT CURRENT_TIMESTAMP,
-            FOREIGN KEY (utente_id) REFERENCES utenti (id)
-        );
-        
-        -- Tabella principale dei fumetti con informazioni dettagliate
-        CREATE TABLE IF NOT EXISTS fumetti (
-            id TEXT PRIMARY KEY,
-            titolo TEXT NOT NULL,
-            url_copertina TEXT,
-            data_aggiunta DATETIME DEFAULT CURRENT_TIMESTAMP,
-            editore TEXT,
-            anno INTEGER
-        );
-    ''')
-    
-    conn.commit()
-    conn.close()
-
-# Funzione per cercare fumetti tramite l'API di ComicVine
-# Gestisce la paginazione (nonostante max_results sia hardcodato a 100) e il parsing dei risultati XML
+    with app.app_context():
+        conn = connetti_db()
+        migrazioni.applica_migrazioni(conn)
+        # Le somme per coppia di utenti vengono mantenute dai trigger solo se la similarità
+        # incrementale è attiva, altrimenti ogni rating pagherebbe un aggiornamento inutile
+        if app.config['RACCOMANDAZIONI_SIMILARITA_INCREMENTALE']:
+            somme_similarita.attiva_manutenzione(conn)
+        else:
+            somme_similarita.disattiva_manutenzione(conn)
+
+# Coalescenza delle richieste identiche in corso (stessa ricerca o raccomandazioni dello stesso utente)
+# Con COALESCING_LOCK_PATH vale anche tra processi worker diversi
+coalescenza = SingoloVolo(
+    LeaseSQLite(app.config['COALESCING_LOCK_PATH'], app.config['COALESCING_LOCK_TIMEOUT_SECONDS'])
+    if app.config['COALESCING_LOCK_PATH'] else None
+)
+
+# Cache condivisa dei risultati di ricerca (memoria + disco)
+# Su disco i volumi sono salvati come dizionari e ricostruiti alla lettura
+cache_ricerche = CacheRicerche(
+    app.config['SEARCH_CACHE_PATH'],
+    ttl_secondi=app.config['SEARCH_CACHE_TTL_SECONDS'],
+    ttl_obsoleto_secondi=app.config['SEARCH_CACHE_STALE_SECONDS'],
+    dimensione_max=app.config['SEARCH_CACHE_MAX_ENTRIES'],
+    codifica=lambda volumi: [v.a_dict() for v in volumi],
+    decodifica=lambda righe: [Volume(**r) for r in righe],
+    coalescenza=coalescenza
+)
+
+# Funzione per cercare fumetti, prima nel catalogo locale e poi tramite l'API di ComicVine
+# Se il catalogo ha abbastanza corrispondenze ComicVine non viene interrogato; altrimenti
+# i risultati di ComicVine (serviti dalla cache quando possibile) completano quelli locali.
+# In caso di errore dell'API senza risultati salvati restituisce i soli risultati locali
 def cerca_fumetti(query, genere_preferito=None):
-    base_url = "https://comicvine.gamespot.com/api/search/"
-    api_key = app.config['COMICVINE_API_KEY']
-    headers = {
-        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.101 Safari/537.36'
-    }
-
-    limit = 100
-    offset = 0
-    all_volumes = []
     max_results = app.config['MAX_SEARCH_RESULTS']
+    corrispondenze, simili = cerca_nel_catalogo(query, max_results)
+    if len(corrispondenze) >= min(max_results, app.config['CATALOG_MIN_RESULTS']):
+        return catalogo.unisci(corrispondenze, [], simili, max_results)
 
-    while len(all_volumes) < max_results:
-        params = {
-            'api_key': api_key,
-            'query': query,
-            'resources': 'volume',
-            'format': 'xml',
-            'limit': limit,
-            'offset': offset
-        }
-
-        response = requests.get(base_url, headers=headers, params=params)
-
-        if response.status_code == 200:
-            try:
-                root = ET.fromstring(response.text)
-                volumes = root.findall(".//volume")
-
-                for volume in volumes:
-                    # Verifica subito se il nome è presente e valido
-                    name_element = volume.find(".//name")
-                    if name_element is None or not name_element.text or name_element.text.strip() == "":
-                        continue
-
-                    volume_id = volume.get('id') or str(uuid.uuid4())
-                    
-                    # Estrazione degli autori
-                    autori = []
-                    writers = volume.findall(".//person[@role='writer']/name")
-                    for writer in writers:
-                        if writer.text and writer.text not in autori:
-                            autori.append(writer.text)
-                    
-                    if not autori:
-                        artists = volume.findall(".//person[@role='artist']/name")
-                        for artist in artists:
-                            if artist.text and artist.text not in autori:
-                                autori.append(artist.text)
-                    
-                    autori_str = ", ".join(autori) if autori else "Autore non specificato"
-                    
-                    # Estrazione e validazione degli altri campi
-                    deck_element = volume.find(".//deck")
-                    description = deck_element.text if deck_element is not None else "N/A"
-                    
-                    year_element = volume.find(".//start_year")
-                    year = year_element.text if year_element is not None else "N/A"
-                    
-                    publisher_element = volume.find(".//publisher/name")
-                    publisher = publisher_element.text if publisher_element is not None else "N/A"
-                    
-                    image_element = volume.find(".//image/small_url")
-                    image_url = image_element.text if image_element is not None else "N/A"
-
-                    volume_data = {
-                        "id": volume_id,
-                        "Nome del volume": name_element.text.strip(),
-                        "Descrizione": description,
-                        "Anno di pubblicazione": year,
-                        "Editore": publisher,
-                        "Immagine di copertina": image_url,
-                        "Autore": autori_str
-                    }
-
-                    all_volumes.append(volume_data)
-
-                    if len(all_volumes) >= max_results:
-                        break
-
-                if len(volumes) < limit:
-                    break
-
-                offset += limit
-
-            except ET.ParseError as e:
-                print(f"Errore di parsing XML: {e}")
-                break
-        else:
-            print(f"Errore nella richiesta API: {response.status_code}")
-            break
+    chiave = CacheRicerche.chiave(query, max_results)
+    try:
+        remoti = cache_ricerche.ottieni(chiave, lambda: _scarica_fumetti(query, max_results))
+    except ErroreComicVine as e:
+        print(e)
+        remoti = []
+    return catalogo.unisci(corrispondenze, remoti, simili, max_results)
+
+# Ricerca nel catalogo locale (indice full-text dei fumetti); restituisce le corrispondenze
+# e i titoli simili. Usa la connessione del thread, quindi funziona anche fuori da una richiesta
+def cerca_nel_catalogo(query, max_results):
+    try:
+        return catalogo.cerca(gestore_db.connessione(), query, max_results)
+    except sqlite3.Error as e:
+        print(f"Errore nella ricerca nel catalogo: {e}")
+        return [], []
 
-    return all_volumes
+# Aggiunge al catalogo locale i volumi scaricati da ComicVine
+# Un errore del database non deve far fallire la ricerca
+def aggiungi_al_catalogo(volumes):
+    conn = gestore_db.connessione()
+    try:
+        catalogo.aggiungi_volumi(conn, volumes)
+        conn.commit()
+    except sqlite3.Error as e:
+        print(f"Errore nell'aggiornamento del catalogo: {e}")
+        gestore_db.rilascia(conn)
+
+# Pool condiviso per lo scaricamento concorrente delle pagine di ComicVine:
+# la sua dimensione limita le richieste contemporanee verso l'host
+pool_comicvine = ThreadPoolExecutor(max_workers=app.config['COMICVINE_MAX_CONCURRENCY'],
+                                    thread_name_prefix='comicvine')
+
+# Interroga ComicVine gestendo la paginazione e il parsing dei risultati XML
+# La prima pagina indica il numero totale di risultati, le successive vengono
+# scaricate in parallelo e unite nello stesso ordine della paginazione sequenziale
+# Solleva ErroreComicVine se una pagina non può essere scaricata o letta
+def _scarica_fumetti(query, max_results):
+    limit = 100
+    all_volumes, totale = _scarica_pagina(query, 0, limit)
+    offset = limit
+
+    while len(all_volumes) < max_results and offset < totale:
+        # Pagine necessarie per arrivare a max_results (i volumi senza nome vengono scartati,
+        # quindi se ne mancano ancora il ciclo scarica un altro blocco)
+        mancanti = max_results - len(all_volumes)
+        offsets = list(range(offset, min(totale, offset + mancanti), limit))
+        pagine = pool_comicvine.map(lambda o: _scarica_pagina(query, o, limit), offsets)
+        for volumes, _ in pagine:
+            all_volumes.extend(volumes)
+        offset = offsets[-1] + limit
+
+    return all_volumes[:max_results]
+
+# Scarica e interpreta una singola pagina di risultati
+# Restituisce la lista dei volumi validi e il numero totale di risultati della ricerca
+def _scarica_pagina(query, offset, limit):
+    totale, volumes = comicvine.ottieni_client().cerca_volumi(query, limit, offset)
+    if totale is None:
+        # Senza il totale si prosegue finché le pagine sono piene
+        totale = offset + len(volumes) + (1 if len(volumes) == limit else 0)
+
+    # Nel catalogo finiscono solo i volumi con l'ID di ComicVine
+    aggiungi_al_catalogo(volumes)
+    for volume in volumes:
+        volume.id = volume.id or str(uuid.uuid4())
+
+    return volumes, totale
 
 # Route principale che serve la pagina index
 @app.route('/')
@@ -251,7 +334,6 @@ def aggiungi_fumetto_letto():
         cursor.execute("SELECT 1 FROM fumetti_letti WHERE utente_id = ? AND comic_id = ?", 
                       (g.utente_id, comic_id))
         if cursor.fetchone():
-            conn.close()
             return jsonify({"error": "Hai già aggiunto questo fumetto"}), 409
         
         # Inserisce o aggiorna i dati del fumetto nella tabella fumetti
@@ -265,14 +347,58 @@ def aggiungi_fumetto_letto():
             INSERT INTO fumetti_letti (utente_id, comic_id, rating) 
             VALUES (?, ?, ?)
         """, (g.utente_id, comic_id, rating))
+        archivio_raccomandazioni.segna_da_aggiornare(conn, g.utente_id)
         
         conn.commit()
-        conn.close()
         return jsonify({"message": "Fumetto aggiunto con successo"}), 200
     
+    except sqlite3.IntegrityError:
+        # Inserimento concorrente dello stesso fumetto (indice unico su utente e fumetto)
+        return jsonify({"error": "Hai già aggiunto questo fumetto"}), 409
     except sqlite3.Error as e:
         return jsonify({"error": "Errore interno del server"}), 500
 
+# Route per importare in blocco i fumetti letti (ad esempio da un'altra collezione)
+# Accetta un array JSON oppure un flusso NDJSON (Content-Type application/x-ndjson) di oggetti
+# con gli stessi campi di /aggiungi_fumetto_letto; tutto viene salvato in una sola transazione
+@app.route('/importa_fumetti_letti', methods=['POST'])
+@richiedi_auth
+def importa_fumetti_letti():
+    massimo = app.config['IMPORT_MAX_ITEMS']
+    if request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        # Le righe vengono lette man mano dal corpo della richiesta
+        elementi = []
+        for riga in request.stream:
+            if riga.strip():
+                try:
+                    elementi.append(json.loads(riga))
+                except ValueError:
+                    elementi.append(None)
+            if len(elementi) > massimo:
+                break
+    else:
+        elementi = request.get_json(silent=True)
+        if not isinstance(elementi, list):
+            return jsonify({"error": "Il corpo deve essere un array JSON o un flusso NDJSON"}), 400
+
+    if len(elementi) > massimo:
+        return jsonify({"error": f"Al massimo {massimo} fumetti per importazione"}), 413
+
+    # Gli elementi non validi vengono segnalati con la loro posizione, gli altri importati
+    letture, errori = [], []
+    for indice, elemento in enumerate(elementi):
+        try:
+            letture.append(normalizza_lettura(elemento))
+        except ValueError as e:
+            errori.append({"indice": indice, "error": str(e)})
+
+    try:
+        risultato = importa_letture(connetti_db(), g.utente_id, letture)
+    except sqlite3.Error as e:
+        print(f"Errore nell'importazione: {e}")
+        return jsonify({"error": "Errore interno del server"}), 500
+    return jsonify({**risultato, "errori": errori}), 200
+
 # Route per verificare se un fumetto è già stato letto dall'utente
 @app.route('/aggiungi_fumetto_letto/<comic_id>', methods=['GET'])
 @richiedi_auth
@@ -284,9 +410,7 @@ def verifica_fumetto_letto(comic_id):
         cursor.execute("SELECT 1 FROM fumetti_letti WHERE utente_id = ? AND comic_id = ?", 
                       (g.utente_id, comic_id))
         if cursor.fetchone():
-            conn.close()
             return jsonify({"error": "Fumetto già aggiunto"}), 409
-        conn.close()
         return jsonify({"message": "Fumetto non presente"}), 200
     except sqlite3.Error:
         return jsonify({"error": "Errore interno del server"}), 500
@@ -308,7 +432,6 @@ def get_fumetti_letti():
         """, (g.utente_id,))
         
         fumetti = cursor.fetchall()
-        conn.close()
         
         # Formatta i risultati per la risposta JSON
         fumetti_list = [
@@ -354,15 +477,16 @@ def aggiungi_preferito():
             return jsonify({"error": "Fumetto già nei preferiti"}), 400
         
         # Inserisce il nuovo fumetto preferito con peso personalizzato    
-        cursor.execute("""
+        esegui_scrittura(conn, scrittore_raggruppato, """
             INSERT INTO preferenze_utente (utente_id, comic_id, genere, peso)
             VALUES (?, ?, 'non_specificato', ?)
-        """, (g.utente_id, comic_id, peso))
-        
-        conn.commit()
-        conn.close()
+        """, (g.utente_id, comic_id, peso), utente_id=g.utente_id)
         return jsonify({"message": "Preferenza aggiunta con successo"}), 200
         
+    except sqlite3.IntegrityError:
+        return jsonify({"error": "Fumetto già nei preferiti"}), 400
+    except ErroreScritturaScaduta:
+        return risposta_sovraccarico()
     except sqlite3.Error as e:
         return jsonify({"error": "Errore del database"}), 500
 
@@ -382,12 +506,26 @@ def check_preferiti():
         """, (g.utente_id,))
         
         preferiti = [row['comic_id'] for row in cursor.fetchall()]
-        conn.close()
         
         return jsonify(preferiti), 200
     except sqlite3.Error as e:
         return jsonify({"error": "Errore del database"}), 500
 
+# Calcolo degli hash delle password in processi separati, per non bloccare le altre richieste
+# Con troppi calcoli in attesa login e registrazione rispondono subito 503
+hash_password = HashPassword(
+    app.config['PASSWORD_HASH_METHOD'],
+    processi=app.config['PASSWORD_HASH_WORKERS'],
+    coda_max=app.config['PASSWORD_HASH_QUEUE_MAX']
+)
+
+# Risposta per le richieste rifiutate quando la coda degli hash è piena
+# o quando una scrittura raggruppata non viene salvata in tempo
+def risposta_sovraccarico():
+    risposta = jsonify({'error': 'Servizio momentaneamente sovraccarico, riprova tra poco'})
+    risposta.headers['Retry-After'] = '1'
+    return risposta, 503
+
 # Route per la registrazione di nuovi utenti
 @app.route('/registrazione', methods=['POST'])
 def registra_utente():
@@ -398,14 +536,19 @@ def registra_utente():
     if not username or not password:
         return jsonify({'error': 'Username e password sono richiesti'}), 400
     
+    # Hash della password prima del salvataggio
+    try:
+        password_hash = hash_password.genera(password)
+    except ErroreSovraccarico:
+        return risposta_sovraccarico()
+    
     conn = connetti_db()
     cursor = conn.cursor()
     
     try:
-        # Hash della password prima del salvataggio
         cursor.execute(
             'INSERT INTO utenti (username, password_hash) VALUES (?, ?)',
-            (username, generate_password_hash(password))
+            (username, password_hash)
         )
         conn.commit()
         
@@ -425,8 +568,6 @@ def registra_utente():
         return jsonify({'token': token})
     except sqlite3.IntegrityError:
         return jsonify({'error': 'Username già in uso'}), 400
-    finally:
-        conn.close()
 
 # Route per il login degli utenti
 @app.route('/login', methods=['POST'])
@@ -440,10 +581,20 @@ def login():
     # Verifica le credenziali dell'utente
     cursor.execute('SELECT * FROM utenti WHERE username = ?', (username,))
     utente = cursor.fetchone()
-    conn.close()
     
     # Verifica password e genera token se corretta
-    if utente and check_password_hash(utente['password_hash'], password):
+    valida = False
+    if utente and password:
+        try:
+            valida, nuovo_hash = hash_password.verifica(utente['password_hash'], password)
+        except ErroreSovraccarico:
+            return risposta_sovraccarico()
+    
+    if valida:
+        # Aggiorna l'hash salvato con parametri di costo diversi da quelli configurati
+        if nuovo_hash is not None:
+            cursor.execute('UPDATE utenti SET password_hash = ? WHERE id = ?', (nuovo_hash, utente['id']))
+            conn.commit()
         token = jwt.encode(
             {
                 'utente_id': utente['id'],
@@ -481,18 +632,99 @@ def ottieni_raccomandazioni():
     return render_template('raccomandazioni.html')
 
 # Funzione helper per generare raccomandazioni
+# Il motore che ha prodotto le raccomandazioni e la durata del calcolo sono riportati nell'header
+# Server-Timing, per confrontare i motori
 def _get_raccomandazioni():
-    conn = connetti_db()
+    motore = request.args.get('motore') or app.config['RACCOMANDAZIONI_MOTORE']
+    if motore not in MOTORI_RACCOMANDAZIONE:
+        return jsonify({'error': f"Motore non valido, usare uno tra: {', '.join(MOTORI_RACCOMANDAZIONE)}"}), 400
     try:
-        # Utilizza il sistema di raccomandazione per generare suggerimenti
-        sistema_raccomandazione = SistemaRaccomandazione(conn)
-        raccomandazioni = sistema_raccomandazione.genera_raccomandazioni(g.utente_id)
-        return jsonify(raccomandazioni)
+        inizio = time.perf_counter()
+        raccomandazioni, motore_usato = raccomandazioni_utente(g.utente_id, motore)
+        risposta = jsonify(raccomandazioni)
+        risposta.headers['Server-Timing'] = intestazione_server_timing(motore_usato, inizio)
+        return risposta
     except Exception as e:
         print(f"Errore: {e}")
         return jsonify({'error': 'Errore nella generazione delle raccomandazioni'}), 500
-    finally:
-        conn.close()
+
+# Arricchimento opzionale del catalogo per le raccomandazioni: i dati mancanti vengono chiesti
+# a ComicVine in background e saranno usati dai calcoli successivi
+def _cerca_su_comicvine(query):
+    max_results = app.config['MAX_SEARCH_RESULTS']
+    cache_ricerche.ottieni(CacheRicerche.chiave(query, max_results), lambda: _scarica_fumetti(query, max_results))
+
+arricchimento = ArricchimentoComicVine(
+    gestore_db.connessione, cerca=_cerca_su_comicvine
+) if app.config['RACCOMANDAZIONI_ARRICCHIMENTO'] else None
+
+# Fonti locali dei candidati alle raccomandazioni: fumetti apprezzati dai vicini, catalogo
+# degli editori preferiti e ricerche già in cache; nessuna attende ComicVine
+def generatori_candidati(conn):
+    return [
+        CandidatiDaiVicini(conn, arricchimento),
+        CandidatiEditoriPreferiti(conn),
+        CandidatiCacheRicerche(cache_ricerche, app.config['MAX_SEARCH_RESULTS'], arricchimento),
+    ]
+
+# Indice approssimato degli utenti simili, condiviso tra le richieste (solo con RACCOMANDAZIONI_LSH)
+indice_vicini = IndiceCondiviso(
+    lambda: IndiceMinHash(MatriceRating.da_database(gestore_db.connessione()),
+                          bande=app.config['RACCOMANDAZIONI_LSH_BANDE'],
+                          righe_per_banda=app.config['RACCOMANDAZIONI_LSH_RIGHE']),
+    ttl_secondi=app.config['RACCOMANDAZIONI_LSH_TTL_SECONDI']
+) if app.config['RACCOMANDAZIONI_LSH'] else None
+
+# Profili dei gusti degli utenti in memoria, validati ad ogni lettura dalla loro versione nel database
+profili_utenti = CacheProfili(app.config['RACCOMANDAZIONI_PROFILI_CACHE']) if app.config['RACCOMANDAZIONI_PROFILI_CACHE'] > 0 else None
+
+# Motori di raccomandazione: filtraggio collaborativo di vicinato (SistemaRaccomandazione)
+# oppure modello fattorizzato addestrato offline da fattorizzazione.py
+MOTORE_VICINATO = 'vicinato'
+MOTORE_FATTORIZZAZIONE = 'fattorizzazione'
+MOTORI_RACCOMANDAZIONE = (MOTORE_VICINATO, MOTORE_FATTORIZZAZIONE)
+
+# Modello fattorizzato, ricaricato quando il job di addestramento ne pubblica uno nuovo
+modello_fattorizzato = ModelloCondiviso(app.config['RACCOMANDAZIONI_MODELLO_PATH'])
+
+def intestazione_server_timing(motore, inizio):
+    return f'raccomandazioni;desc="{motore}";dur={(time.perf_counter() - inizio) * 1000:.1f}'
+
+# Serve le raccomandazioni precalcolate se ancora valide, altrimenti le ricalcola e le salva
+# Con il motore di fattorizzazione le calcola ad ogni richiesta (un prodotto matrice-vettore);
+# gli utenti che il modello non conosce ancora ricevono quelle del motore di vicinato
+# Restituisce le raccomandazioni e il motore che le ha prodotte
+# Richiede un contesto dell'applicazione per la connessione al database
+def raccomandazioni_utente(utente_id, motore=None):
+    conn = connetti_db()
+
+    if (motore or app.config['RACCOMANDAZIONI_MOTORE']) == MOTORE_FATTORIZZAZIONE:
+        modello = modello_fattorizzato.ottieni()
+        if modello is not None and modello.contiene(utente_id):
+            motore_fattorizzazione = MotoreFattorizzazione(conn, modello, arricchimento, profili_utenti)
+            return motore_fattorizzazione.genera_raccomandazioni(utente_id), MOTORE_FATTORIZZAZIONE
+
+    def leggi():
+        return archivio_raccomandazioni.leggi_raccomandazioni(
+            conn, utente_id, app.config['RACCOMANDAZIONI_TTL_SECONDI'])
+
+    raccomandazioni = leggi()
+    if raccomandazioni is None:
+        # Utilizza il sistema di raccomandazione per generare suggerimenti;
+        # le richieste concorrenti dello stesso utente attendono lo stesso calcolo
+        sistema_raccomandazione = SistemaRaccomandazione(conn, vicini_max=app.config['RACCOMANDAZIONI_VICINI_MAX'],
+                                                         generatori=generatori_candidati(conn),
+                                                         filtraggio=app.config['RACCOMANDAZIONI_FILTRAGGIO'],
+                                                         similarita_incrementale=app.config['RACCOMANDAZIONI_SIMILARITA_INCREMENTALE'],
+                                                         indice_vicini=indice_vicini.ottieni() if indice_vicini else None,
+                                                         profili=profili_utenti,
+                                                         metriche=metriche)
+        raccomandazioni = coalescenza.esegui(
+            f'raccomandazioni|{utente_id}',
+            lambda: archivio_raccomandazioni.calcola_e_salva(conn, sistema_raccomandazione, utente_id),
+            ricontrolla=leggi
+        )
+    return raccomandazioni, MOTORE_VICINATO
 
 # Route per la pagina delle raccomandazioni
 @app.route('/raccomandazioni.html')
@@ -519,7 +751,6 @@ def aggiungi_autore_preferito():
         (g.utente_id, autore)
     )
     conn.commit()
-    conn.close()
     
     return jsonify({'message': 'Autore preferito aggiunto'}), 201
 
@@ -538,20 +769,34 @@ def registra_lettura():
     if not 1 <= rating <= 5:
         return jsonify({'error': 'Il rating deve essere tra 1 e 5'}), 400
     
-    conn = connetti_db()
-    cursor = conn.cursor()
-    
-    # Registra la lettura con la valutazione
-    cursor.execute('''
-        INSERT INTO fumetti_letti (utente_id, comic_id, rating)
-        VALUES (?, ?, ?)
-    ''', (g.utente_id, comic_id, rating))
-    
-    conn.commit()
-    conn.close()
+    # Registra la lettura con la valutazione (se il fumetto era già registrato ne aggiorna il rating)
+    try:
+        esegui_scrittura(connetti_db(), scrittore_raggruppato, '''
+            INSERT INTO fumetti_letti (utente_id, comic_id, rating)
+            VALUES (?, ?, ?)
+            ON CONFLICT (utente_id, comic_id) DO UPDATE SET
+                rating = excluded.rating,
+                data_lettura = CURRENT_TIMESTAMP
+        ''', (g.utente_id, comic_id, rating), utente_id=g.utente_id)
+    except ErroreScritturaScaduta:
+        return risposta_sovraccarico()
     
     return jsonify({'message': 'Lettura registrata con successo'})
 
+# Statistiche dei componenti condivisi, lette ad ogni esportazione delle metriche
+metriche.registra_statistiche('comicvine', lambda: comicvine.ottieni_client().statistiche())
+metriche.registra_statistiche('database', gestore_db.statistiche)
+metriche.registra_statistiche('cache_ricerche', cache_ricerche.statistiche)
+metriche.registra_statistiche('coalescenza', coalescenza.statistiche)
+metriche.registra_statistiche('hash_password', hash_password.statistiche)
+metriche.registra_statistiche('profili', lambda: profili_utenti.statistiche() if profili_utenti else None)
+metriche.registra_statistiche('scrittore', lambda: scrittore_raggruppato.statistiche() if scrittore_raggruppato else None)
+
+# Route per le metriche in formato testuale Prometheus
+@app.route('/metrics', methods=['GET'])
+def esporta_metriche():
+    return app.response_class(metriche.testo_prometheus(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
 # Avvio dell'applicazione in modalità debug
 if __name__ == '__main__':
     inizializza_db()  # Inizializza il database all'avvio
@@ -0,0 +1,182 @@
+import argparse
+import sqlite3
+import time
+from typing import List, Optional, Iterable
+
+import migrazioni
+from comicvine import Volume
+from raccomandazioni import FILTRAGGIO_UTENTI, SistemaRaccomandazione
+
+
+def segna_da_aggiornare(conn: sqlite3.Connection, utente_id: int):
+    """
+    Segna come da ricalcolare le raccomandazioni di un utente.
+    Va chiamata nella stessa transazione che modifica fumetti_letti o preferenze_utente.
+
+    Args:
+        conn: Connessione al database SQLite
+        utente_id: ID dell'utente i cui dati sono cambiati
+    """
+    conn.execute('''
+        INSERT INTO stato_raccomandazioni (utente_id, data_modifica) VALUES (?, ?)
+        ON CONFLICT (utente_id) DO UPDATE SET data_modifica = excluded.data_modifica
+    ''', (utente_id, time.time()))
+
+
+def leggi_raccomandazioni(conn: sqlite3.Connection, utente_id: int, ttl_secondi: float) -> Optional[List[Volume]]:
+    """
+    Legge le raccomandazioni precalcolate di un utente con una sola query indicizzata.
+
+    Args:
+        conn: Connessione al database SQLite
+        utente_id: ID dell'utente
+        ttl_secondi: Età massima delle raccomandazioni salvate
+    Returns:
+        Lista delle raccomandazioni ordinate per score, oppure None se mancano,
+        sono scadute o l'utente ha modificato i suoi dati dopo l'ultimo calcolo
+    """
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT s.data_calcolo, s.data_modifica,
+               r.comic_id, r.titolo, r.copertina, r.editore, r.anno, r.autore, r.score
+        FROM stato_raccomandazioni s
+        LEFT JOIN raccomandazioni r ON r.utente_id = s.utente_id
+        WHERE s.utente_id = ?
+        ORDER BY r.score DESC
+    ''', (utente_id,))
+    righe = cursor.fetchall()
+    if not righe:
+        return None
+
+    data_calcolo, data_modifica = righe[0][0], righe[0][1]
+    if data_calcolo is None or data_calcolo < time.time() - ttl_secondi:
+        return None
+    if data_modifica is not None and data_modifica >= data_calcolo:
+        return None
+
+    return [
+        Volume(id=comic_id, titolo=titolo, copertina=copertina, editore=editore, anno=anno, autore=autore, score=score)
+        for _, _, comic_id, titolo, copertina, editore, anno, autore, score in righe if comic_id is not None
+    ]
+
+
+def salva_raccomandazioni(conn: sqlite3.Connection, utente_id: int,
+                          raccomandazioni: List[Volume], data_calcolo: float):
+    """
+    Sostituisce le raccomandazioni salvate di un utente.
+
+    Args:
+        conn: Connessione al database SQLite
+        utente_id: ID dell'utente
+        raccomandazioni: Raccomandazioni prodotte da SistemaRaccomandazione
+        data_calcolo: Istante di inizio del calcolo; le modifiche successive lo rendono di nuovo obsoleto
+    """
+    cursor = conn.cursor()
+    cursor.execute('DELETE FROM raccomandazioni WHERE utente_id = ?', (utente_id,))
+    cursor.executemany('''
+        INSERT INTO raccomandazioni (utente_id, comic_id, score, titolo, copertina, editore, anno, autore)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ''', [(utente_id, r.id, r.score, r.titolo, r.copertina, r.editore, r.anno, r.autore) for r in raccomandazioni])
+    cursor.execute('''
+        INSERT INTO stato_raccomandazioni (utente_id, data_calcolo) VALUES (?, ?)
+        ON CONFLICT (utente_id) DO UPDATE SET data_calcolo = excluded.data_calcolo
+    ''', (utente_id, data_calcolo))
+    conn.commit()
+
+
+def calcola_e_salva(conn: sqlite3.Connection, sistema: SistemaRaccomandazione, utente_id: int) -> List[Volume]:
+    """
+    Genera le raccomandazioni di un utente e le salva nell'archivio.
+    Un risultato vuoto non viene salvato, perché può dipendere da un errore dell'API esterna.
+
+    Args:
+        conn: Connessione al database SQLite
+        sistema: Sistema di raccomandazione da usare per il calcolo
+        utente_id: ID dell'utente
+    Returns:
+        Le raccomandazioni generate
+    """
+    data_calcolo = time.time()
+    raccomandazioni = sistema.genera_raccomandazioni(utente_id)
+    if raccomandazioni:
+        salva_raccomandazioni(conn, utente_id, raccomandazioni, data_calcolo)
+    return raccomandazioni
+
+
+def utenti_da_aggiornare(conn: sqlite3.Connection, ttl_secondi: float, solo_modificati: bool = False) -> List[int]:
+    """
+    Restituisce gli utenti le cui raccomandazioni sono mancanti, scadute o obsolete.
+
+    Args:
+        conn: Connessione al database SQLite
+        ttl_secondi: Età massima delle raccomandazioni salvate
+        solo_modificati: Se True restituisce solo gli utenti che hanno modificato i propri dati
+    Returns:
+        Lista di ID degli utenti
+    """
+    cursor = conn.cursor()
+    if solo_modificati:
+        cursor.execute('''
+            SELECT utente_id FROM stato_raccomandazioni
+            WHERE data_modifica IS NOT NULL
+              AND (data_calcolo IS NULL OR data_modifica >= data_calcolo)
+        ''')
+    else:
+        cursor.execute('''
+            SELECT u.id FROM utenti u
+            LEFT JOIN stato_raccomandazioni s ON s.utente_id = u.id
+            WHERE s.data_calcolo IS NULL
+               OR s.data_calcolo < ?
+               OR s.data_modifica >= s.data_calcolo
+        ''', (time.time() - ttl_secondi,))
+    return [row[0] for row in cursor.fetchall()]
+
+
+def aggiorna_archivio(conn: sqlite3.Connection, utenti: Iterable[int], vicini_max: Optional[int] = None,
+                      filtraggio: str = FILTRAGGIO_UTENTI) -> int:
+    """
+    Ricalcola e salva le raccomandazioni degli utenti indicati.
+    La matrice dei rating viene costruita una sola volta per tutto il lotto.
+
+    Args:
+        conn: Connessione al database SQLite
+        utenti: ID degli utenti da aggiornare
+        vicini_max: Numero massimo di vicini per il filtraggio collaborativo
+        filtraggio: Filtraggio collaborativo da usare (vedi SistemaRaccomandazione)
+    Returns:
+        Numero di utenti per cui sono state salvate raccomandazioni
+    """
+    sistema = SistemaRaccomandazione(conn, vicini_max=vicini_max, filtraggio=filtraggio)
+    aggiornati = 0
+    for utente_id in utenti:
+        if calcola_e_salva(conn, sistema, utente_id):
+            aggiornati += 1
+    return aggiornati
+
+
+# Job batch: python archivio_raccomandazioni.py [--solo-modificati] [--utente ID ...]
+def main():
+    from config import Config
+
+    parser = argparse.ArgumentParser(description='Precalcola le raccomandazioni degli utenti')
+    parser.add_argument('--solo-modificati', action='store_true',
+                        help='Aggiorna solo gli utenti che hanno modificato letture o preferiti')
+    parser.add_argument('--utente', type=int, nargs='+', help='Aggiorna solo gli utenti indicati')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(Config.DATABASE_PATH)
+    try:
+        migrazioni.applica_migrazioni(conn)
+        utenti = args.utente or utenti_da_aggiornare(conn, Config.RACCOMANDAZIONI_TTL_SECONDI,
+                                                     solo_modificati=args.solo_modificati)
+        inizio = time.perf_counter()
+        aggiornati = aggiorna_archivio(conn, utenti, vicini_max=Config.RACCOMANDAZIONI_VICINI_MAX,
+                                       filtraggio=Config.RACCOMANDAZIONI_FILTRAGGIO)
+        print(f"Raccomandazioni aggiornate per {aggiornati}/{len(utenti)} utenti "
+              f"in {time.perf_counter() - inizio:.1f}s")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,183 @@
+import asyncio
+import time
+import uuid
+from urllib.parse import parse_qs
+
+from a2wsgi import WSGIMiddleware
+
+import comicvine
+import catalogo
+from app import (app, inizializza_db, verifica_token, raccomandazioni_utente, cache_ricerche, ErroreAutenticazione,
+                 cerca_nel_catalogo, aggiungi_al_catalogo, MOTORI_RACCOMANDAZIONE, intestazione_server_timing,
+                 metriche)
+from cache_ricerche import CacheRicerche
+from comicvine import ErroreComicVine
+
+# Modalità di esecuzione ASGI: uvicorn asgi:applicazione
+#
+# Le route che passano quasi tutto il tempo in attesa di ComicVine (/search e l'API di
+# /raccomandazioni) sono servite da coroutine: mentre attendono l'API esterna non occupano
+# alcun thread. Il database viene usato fuori dall'event loop tramite asyncio.to_thread;
+# tutte le altre route passano invariate all'applicazione Flask.
+
+# Le route Flask girano in un pool di thread dedicato
+flask_asgi = WSGIMiddleware(app, workers=app.config['ASGI_WSGI_WORKERS'])
+
+
+async def applicazione(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await _ciclo_di_vita(receive, send)
+        return
+
+    if scope['type'] == 'http' and scope['method'] == 'GET':
+        if scope['path'] == '/search':
+            await _misura('/search', _search, scope, send)
+            return
+        # Come in Flask, la pagina HTML di /raccomandazioni resta servita da Flask
+        if scope['path'] == '/raccomandazioni' and _header(scope, 'accept') == 'application/json':
+            await _misura('/raccomandazioni', _raccomandazioni, scope, send)
+            return
+
+    await flask_asgi(scope, receive, send)
+
+
+async def _misura(route, gestisci, scope, send):
+    # Durata delle route asincrone nello stesso istogramma delle route Flask; le loro istruzioni
+    # SQL girano in altri thread (asyncio.to_thread) e non vengono attribuite alla richiesta
+    inizio = time.perf_counter()
+    stato = 500
+
+    async def invia(messaggio):
+        nonlocal stato
+        if messaggio['type'] == 'http.response.start':
+            stato = messaggio['status']
+        await send(messaggio)
+
+    try:
+        await gestisci(scope, invia)
+    finally:
+        metriche.osserva('richiesta_secondi', time.perf_counter() - inizio, route=route, metodo=scope['method'],
+                         stato=stato)
+
+
+async def _search(scope, send):
+    query = parse_qs(scope['query_string'].decode('latin-1')).get('q', [''])[0]
+
+    if not query:
+        await _invia_json(send, {'error': 'Termine di ricerca mancante'}, 400)
+        return
+
+    await _invia_json(send, await cerca_fumetti_asincrono(query))
+
+
+async def _raccomandazioni(scope, send):
+    try:
+        utente_id = verifica_token(_header(scope, 'authorization'))
+    except ErroreAutenticazione as e:
+        await _invia_json(send, {'message': str(e)}, 401)
+        return
+
+    motore = parse_qs(scope['query_string'].decode('latin-1')).get('motore', [''])[0] or app.config['RACCOMANDAZIONI_MOTORE']
+    if motore not in MOTORI_RACCOMANDAZIONE:
+        await _invia_json(send, {'error': f"Motore non valido, usare uno tra: {', '.join(MOTORI_RACCOMANDAZIONE)}"}, 400)
+        return
+
+    try:
+        inizio = time.perf_counter()
+        raccomandazioni, motore_usato = await asyncio.to_thread(_raccomandazioni_in_contesto, utente_id, motore)
+    except Exception as e:
+        print(f"Errore: {e}")
+        await _invia_json(send, {'error': 'Errore nella generazione delle raccomandazioni'}, 500)
+        return
+    await _invia_json(send, raccomandazioni, intestazioni=[(b'server-timing', intestazione_server_timing(motore_usato, inizio).encode())])
+
+
+def _raccomandazioni_in_contesto(utente_id, motore):
+    # Il contesto fornisce la connessione del thread e la rilascia alla fine
+    with app.app_context():
+        return raccomandazioni_utente(utente_id, motore)
+
+
+async def cerca_fumetti_asincrono(query):
+    """
+    Versione asincrona di app.cerca_fumetti, con lo stesso catalogo, la stessa cache
+    e lo stesso ordine dei risultati.
+    """
+    max_results = app.config['MAX_SEARCH_RESULTS']
+    corrispondenze, simili = await asyncio.to_thread(cerca_nel_catalogo, query, max_results)
+    if len(corrispondenze) >= min(max_results, app.config['CATALOG_MIN_RESULTS']):
+        return catalogo.unisci(corrispondenze, [], simili, max_results)
+
+    chiave = CacheRicerche.chiave(query, max_results)
+    try:
+        remoti = await cache_ricerche.ottieni_asincrono(chiave, lambda: _scarica_fumetti_asincrono(query, max_results))
+    except ErroreComicVine as e:
+        print(e)
+        remoti = []
+    return catalogo.unisci(corrispondenze, remoti, simili, max_results)
+
+
+async def _scarica_fumetti_asincrono(query, max_results):
+    # Stessa paginazione di app._scarica_fumetti: le pagine successive alla prima vengono
+    # richieste insieme, al massimo COMICVINE_MAX_CONCURRENCY alla volta
+    limit = 100
+    all_volumes, totale = await _scarica_pagina_asincrona(query, 0, limit)
+    offset = limit
+    semaforo = asyncio.Semaphore(app.config['COMICVINE_MAX_CONCURRENCY'])
+
+    async def scarica(o):
+        async with semaforo:
+            return await _scarica_pagina_asincrona(query, o, limit)
+
+    while len(all_volumes) < max_results and offset < totale:
+        mancanti = max_results - len(all_volumes)
+        offsets = list(range(offset, min(totale, offset + mancanti), limit))
+        for volumes, _ in await asyncio.gather(*(scarica(o) for o in offsets)):
+            all_volumes.extend(volumes)
+        offset = offsets[-1] + limit
+
+    return all_volumes[:max_results]
+
+
+async def _scarica_pagina_asincrona(query, offset, limit):
+    totale, volumes = await comicvine.ottieni_client_asincrono().cerca_volumi(query, limit, offset)
+    if totale is None:
+        totale = offset + len(volumes) + (1 if len(volumes) == limit else 0)
+
+    await asyncio.to_thread(aggiungi_al_catalogo, volumes)
+    for volume in volumes:
+        volume.id = volume.id or str(uuid.uuid4())
+
+    return volumes, totale
+
+
+async def _ciclo_di_vita(receive, send):
+    while True:
+        messaggio = await receive()
+        if messaggio['type'] == 'lifespan.startup':
+            await asyncio.to_thread(inizializza_db)
+            await send({'type': 'lifespan.startup.complete'})
+        elif messaggio['type'] == 'lifespan.shutdown':
+            await comicvine.chiudi_client_asincrono()
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+def _header(scope, nome):
+    nome = nome.encode('latin-1')
+    for chiave, valore in scope['headers']:
+        if chiave.lower() == nome:
+            return valore.decode('latin-1')
+    return None
+
+
+async def _invia_json(send, dati, status=200, intestazioni=()):
+    # Serializza con il provider JSON di Flask, così le risposte sono identiche a quelle di jsonify
+    corpo = f"{app.json.dumps(dati)}\n".encode('utf-8')
+    await send({
+        'type': 'http.response.start',
+        'status': status,
+        'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(corpo)).encode()),
+                    *intestazioni]
+    })
+    await send({'type': 'http.response.body', 'body': corpo})
@@ -0,0 +1,2 @@
+# Script di benchmark per misurare le prestazioni del sistema di raccomandazione.
+# Si eseguono dalla cartella ComicSnap, ad esempio: python -m benchmark.similarita
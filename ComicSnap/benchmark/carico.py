@@ -0,0 +1,124 @@
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+# Prova di carico di /search con ComicVine lento: confronta il server sincrono (un thread
+# occupato per tutta la durata di ogni richiesta) con la modalità ASGI di asgi.py.
+# Uso (dalla cartella ComicSnap): python -m benchmark.carico [--richieste 200] [--latenza-ms 300]
+
+
+def avvia_comicvine_finto(latenza: float) -> ThreadingHTTPServer:
+    """Server locale che risponde come la risorsa search di ComicVine dopo `latenza` secondi."""
+    class Gestore(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_GET(self):
+            time.sleep(latenza)
+            query = parse_qs(urlparse(self.path).query)['query'][0]
+            corpo = json.dumps({
+                'number_of_total_results': 10,
+                'results': [{'id': i, 'name': f'{query} {i}', 'start_year': '2000',
+                             'publisher': {'name': 'Editore'}, 'image': {'small_url': None}, 'people': []}
+                            for i in range(10)]
+            }).encode()
+            self.send_response(200)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def log_message(self, *args):
+            pass
+
+    class Server(ThreadingHTTPServer):
+        # La coda di connessioni predefinita (5) farebbe attendere i client concorrenti
+        request_queue_size = 1024
+        daemon_threads = True
+
+    server = Server(('127.0.0.1', 0), Gestore)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def carico_wsgi(app, richieste: int, thread: int) -> float:
+    # Un pool di thread fissato simula i worker sincroni (ad esempio gunicorn con worker sync)
+    client = app.test_client()
+    with ThreadPoolExecutor(max_workers=thread) as pool:
+        inizio = time.perf_counter()
+        risposte = list(pool.map(lambda i: client.get(f'/search?q=wsgi-{i}'), range(richieste)))
+        durata = time.perf_counter() - inizio
+    assert all(r.status_code == 200 and len(r.json) == 10 for r in risposte)
+    return durata
+
+
+async def _richiesta_asgi(applicazione, percorso: str) -> dict:
+    messaggi = []
+
+    async def receive():
+        return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+    async def send(messaggio):
+        messaggi.append(messaggio)
+
+    scope = {'type': 'http', 'method': 'GET', 'path': percorso.split('?')[0],
+             'query_string': percorso.partition('?')[2].encode(), 'headers': []}
+    await applicazione(scope, receive, send)
+    return json.loads(messaggi[-1]['body'])
+
+
+async def carico_asgi(applicazione, richieste: int) -> float:
+    inizio = time.perf_counter()
+    risposte = await asyncio.gather(*(_richiesta_asgi(applicazione, f'/search?q=asgi-{i}') for i in range(richieste)))
+    durata = time.perf_counter() - inizio
+    assert all(len(r) == 10 for r in risposte)
+    return durata
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Prova di carico di /search: WSGI sincrono contro ASGI')
+    parser.add_argument('--richieste', type=int, default=200, help='Richieste concorrenti con query diverse')
+    parser.add_argument('--thread', type=int, default=8, help='Worker del server sincrono')
+    parser.add_argument('--latenza-ms', type=float, default=300, help='Latenza simulata di ComicVine')
+    args = parser.parse_args()
+
+    cartella = tempfile.mkdtemp()
+    server = avvia_comicvine_finto(args.latenza_ms / 1000)
+    os.environ.update({
+        'DATABASE_PATH': os.path.join(cartella, 'comicsnap.db'),
+        'SEARCH_CACHE_PATH': os.path.join(cartella, 'cache.db'),
+        'COMICVINE_API_KEY': 'prova',
+        'COMICVINE_REQUESTS_PER_HOUR': str(100 * args.richieste),
+        'COMICVINE_POOL_SIZE': str(args.richieste),
+    })
+    try:
+        import comicvine
+        comicvine.BASE_URL = f'http://127.0.0.1:{server.server_port}/api/'
+        from app import app
+        from asgi import applicazione
+
+        durata = carico_wsgi(app, args.richieste, args.thread)
+        print(f"WSGI ({args.thread} thread): {args.richieste / durata:8.1f} richieste/s  ({durata:.2f}s)")
+
+        async def esegui():
+            try:
+                return await carico_asgi(applicazione, args.richieste)
+            finally:
+                await comicvine.chiudi_client_asincrono()
+
+        durata = asyncio.run(esegui())
+        print(f"ASGI               : {args.richieste / durata:8.1f} richieste/s  ({durata:.2f}s)")
+    finally:
+        server.shutdown()
+        shutil.rmtree(cartella, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,241 @@
+import argparse
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import urlparse, parse_qsl
+
+from benchmark.formati_comicvine import in_xml, volume_completo
+
+# Sostituto locale di ComicVine per i benchmark: risponde alle risorse search, volumes e
+# publisher usate dall'applicazione, in JSON o XML secondo il parametro format, con volumi
+# sintetici oppure con risposte registrate. Latenza e risposte 429 sono configurabili.
+# Uso (dalla cartella ComicSnap): python -m benchmark.comicvine_locale [--porta 8081] [--latenza-ms 100],
+# avviando poi l'applicazione con COMICVINE_BASE_URL=http://127.0.0.1:8081/api/
+
+# Numero di editori dei volumi sintetici, come in volume_completo
+EDITORI = 40
+
+
+def nome_registrazione(risorsa: str, params: Dict[str, str]) -> str:
+    """
+    Nome del file di una risposta registrata: risorsa e hash dei parametri della query,
+    esclusa la chiave API, ad esempio 'search-3f2a9c1b0d4e.json'.
+    """
+    chiave = '&'.join(f'{k}={v}' for k, v in sorted(params.items()) if k != 'api_key')
+    formato = 'xml' if params.get('format') == 'xml' else 'json'
+    return f"{risorsa.replace('/', '_')}-{hashlib.sha1(chiave.encode()).hexdigest()[:12]}.{formato}"
+
+
+def _volume(i: int, campi: Optional[List[str]], nome: Optional[str] = None) -> dict:
+    volume = volume_completo(i)
+    if nome is not None:
+        volume['name'] = nome
+    if campi:
+        volume = {k: v for k, v in volume.items() if k in campi}
+    return volume
+
+
+def _corpo(risultati, totale: Optional[int], formato: str, tag: str = 'volume') -> bytes:
+    # Stessa struttura delle risposte di ComicVine, con l'intestazione di una richiesta riuscita
+    intestazione = {'error': 'OK', 'number_of_page_results': len(risultati) if isinstance(risultati, list) else 1,
+                    'number_of_total_results': totale, 'status_code': 1}
+    if formato != 'xml':
+        return json.dumps(dict(intestazione, results=risultati)).encode()
+    if isinstance(risultati, list):
+        contenuto = '<results>' + ''.join(in_xml(r, tag) for r in risultati) + '</results>'
+    else:
+        contenuto = in_xml(risultati, 'results')
+    return ('<?xml version="1.0" encoding="utf-8"?><response>'
+            + ''.join(in_xml(v, k) for k, v in intestazione.items() if v is not None)
+            + contenuto + '</response>').encode()
+
+
+def risposta_sintetica(risorsa: str, params: Dict[str, str], volumi: int) -> Tuple[int, bytes]:
+    """
+    Costruisce la risposta di ComicVine a una richiesta, deterministica a parità di parametri.
+
+    Args:
+        risorsa: Percorso della risorsa, ad esempio 'search' o 'publisher/4010-3'
+        params: Parametri della query
+        volumi: Numero di volumi del catalogo sintetico (ID da 1 a volumi)
+    Returns:
+        Tupla (codice HTTP, corpo)
+    """
+    formato = params.get('format', 'json')
+    campi = params['field_list'].split(',') if params.get('field_list') else None
+    limite = min(int(params.get('limit') or 10), 100)
+    offset = int(params.get('offset') or 0)
+
+    if risorsa == 'search':
+        # Ogni testo ha un numero di risultati e un insieme di volumi fissi
+        query = params.get('query', '')
+        seme = zlib.crc32(query.lower().encode())
+        totale = seme % 200
+        risultati = [_volume((seme + i) % volumi + 1, campi, f'{query} {i + 1}')
+                     for i in range(offset, min(offset + limite, totale))]
+        return 200, _corpo(risultati, totale, formato)
+
+    if risorsa == 'volumes':
+        filtro = params.get('filter', '')
+        if filtro.startswith('id:'):
+            ids = [int(i) for i in filtro[3:].split('|') if i.isdigit() and 1 <= int(i) <= volumi]
+        else:
+            # Gli altri filtri (ad esempio date_added) restituiscono l'intero catalogo
+            ids = list(range(1, volumi + 1))
+        pagina = ids[offset:offset + limite]
+        return 200, _corpo([_volume(i, campi) for i in pagina], len(ids), formato)
+
+    if risorsa.startswith('publisher/4010-') and risorsa[15:].isdigit():
+        editore = int(risorsa[15:])
+        elenco = [{'id': i, 'name': f'Volume {i}'} for i in range(editore or EDITORI, volumi + 1, EDITORI)]
+        # Il client chiede sempre questa risorsa in JSON
+        return 200, _corpo({'id': editore, 'name': f'Editore {editore}', 'volumes': elenco}, None, 'json')
+
+    corpo = json.dumps({'error': 'Object Not Found', 'status_code': 101, 'results': []}).encode()
+    return 404, corpo
+
+
+class ComicVineLocale:
+    """
+    Server HTTP locale che imita ComicVine. Ogni risposta viene ritardata di latenza_secondi
+    più una variazione casuale, e una quota delle richieste riceve 429 con l'header Retry-After
+    come quando si supera la quota di ComicVine. Se cartella_registrazioni contiene un file con
+    il nome restituito da nome_registrazione, il suo contenuto sostituisce la risposta sintetica.
+    """
+    def __init__(self, latenza_secondi: float = 0.1, variazione_secondi: float = 0, quota_429: float = 0,
+                 retry_after: int = 1, volumi: int = 10000, cartella_registrazioni: Optional[str] = None,
+                 seed: int = 0):
+        """
+        Args:
+            latenza_secondi: Ritardo minimo di ogni risposta
+            variazione_secondi: Ritardo aggiuntivo massimo, estratto uniformemente
+            quota_429: Frazione delle richieste a cui rispondere 429 (tra 0 e 1)
+            retry_after: Valore dell'header Retry-After delle risposte 429, in secondi
+            volumi: Numero di volumi del catalogo sintetico
+            cartella_registrazioni: Cartella con le risposte registrate, oppure None
+            seed: Seme dei numeri casuali di latenza e 429
+        """
+        self.latenza = latenza_secondi
+        self.variazione = variazione_secondi
+        self.quota_429 = quota_429
+        self.retry_after = retry_after
+        self.volumi = volumi
+        self.cartella_registrazioni = cartella_registrazioni
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._contatori = {'richieste': 0, 'risposte_429': 0, 'registrate': 0, 'sintetiche': 0}
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    @property
+    def url(self) -> str:
+        """URL base da assegnare a comicvine.BASE_URL."""
+        return f'http://127.0.0.1:{self._server.server_port}/api/'
+
+    def avvia(self, porta: int = 0) -> 'ComicVineLocale':
+        """Avvia il server in un thread in background (porta 0: scelta dal sistema)."""
+        sostituto = self
+
+        class Gestore(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                indirizzo = urlparse(self.path)
+                risorsa = indirizzo.path.strip('/')
+                if risorsa.startswith('api/'):
+                    risorsa = risorsa[4:]
+                codice, corpo, tipo, intestazioni = sostituto.rispondi(risorsa, dict(parse_qsl(indirizzo.query)))
+                self.send_response(codice)
+                self.send_header('Content-Type', tipo)
+                self.send_header('Content-Length', str(len(corpo)))
+                for nome, valore in intestazioni.items():
+                    self.send_header(nome, valore)
+                self.end_headers()
+                self.wfile.write(corpo)
+
+            def log_message(self, *args):
+                pass
+
+        class Server(ThreadingHTTPServer):
+            # La coda di connessioni predefinita (5) farebbe attendere i client concorrenti
+            request_queue_size = 1024
+            daemon_threads = True
+
+        self._server = Server(('127.0.0.1', porta), Gestore)
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def chiudi(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._server = None
+
+    def rispondi(self, risorsa: str, params: Dict[str, str]) -> Tuple[int, bytes, str, Dict[str, str]]:
+        """
+        Calcola la risposta a una richiesta, attendendo la latenza simulata.
+
+        Returns:
+            Tupla (codice HTTP, corpo, Content-Type, header aggiuntivi)
+        """
+        with self._lock:
+            ritardo = self.latenza + self._rng.uniform(0, self.variazione)
+            limitata = self._rng.random() < self.quota_429
+            self._contatori['richieste'] += 1
+        time.sleep(ritardo)
+
+        formato = 'xml' if params.get('format') == 'xml' else 'json'
+        tipo = 'application/xml' if formato == 'xml' else 'application/json'
+        if limitata:
+            with self._lock:
+                self._contatori['risposte_429'] += 1
+            corpo = json.dumps({'error': 'Rate limit exceeded', 'status_code': 107, 'results': []}).encode()
+            return 429, corpo, 'application/json', {'Retry-After': str(self.retry_after)}
+
+        if self.cartella_registrazioni:
+            percorso = os.path.join(self.cartella_registrazioni, nome_registrazione(risorsa, params))
+            if os.path.exists(percorso):
+                with open(percorso, 'rb') as f:
+                    corpo = f.read()
+                with self._lock:
+                    self._contatori['registrate'] += 1
+                return 200, corpo, tipo, {}
+
+        codice, corpo = risposta_sintetica(risorsa, params, self.volumi)
+        with self._lock:
+            self._contatori['sintetiche'] += 1
+        return codice, corpo, tipo, {}
+
+    def statistiche(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._contatori)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Sostituto locale di ComicVine per i benchmark')
+    parser.add_argument('--porta', type=int, default=8081)
+    parser.add_argument('--latenza-ms', type=float, default=100)
+    parser.add_argument('--variazione-ms', type=float, default=0)
+    parser.add_argument('--quota-429', type=float, default=0, help='Frazione delle richieste a cui rispondere 429')
+    parser.add_argument('--volumi', type=int, default=10000)
+    parser.add_argument('--registrazioni', help='Cartella con le risposte registrate')
+    args = parser.parse_args()
+
+    server = ComicVineLocale(args.latenza_ms / 1000, args.variazione_ms / 1000, args.quota_429,
+                             volumi=args.volumi, cartella_registrazioni=args.registrazioni).avvia(args.porta)
+    print(f'ComicVine locale su {server.url} (Ctrl+C per terminare)')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        print(server.statistiche())
+    finally:
+        server.chiudi()
+
+
+if __name__ == '__main__':
+    main()
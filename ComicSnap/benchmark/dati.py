@@ -0,0 +1,154 @@
+import argparse
+import bisect
+import itertools
+import random
+import sqlite3
+import time
+from typing import Dict, List
+
+from werkzeug.security import generate_password_hash
+
+import migrazioni
+import similarita_fumetti
+from somme_similarita import manutenzione_attiva, ricostruisci_somme
+from matrice_rating import MatriceRating
+
+# Generatore di un database sintetico con distribuzioni a legge di potenza: pochi fumetti ed
+# editori molto popolari e una lunga coda, pochi utenti molto attivi e molti con poche letture.
+# Uso (dalla cartella ComicSnap): python -m benchmark.dati percorso.db [--utenti 1000] [--fumetti 5000]
+
+# Password di tutti gli utenti generati (username utente<N>)
+PASSWORD = 'benchmark'
+
+# Parole dei titoli, usate anche dagli scenari per cercare nel catalogo
+PAROLE = ['Batman', 'Spider', 'Man', 'X-Men', 'Dylan', 'Dog', 'Tex', 'Naruto', 'Saga', 'Watchmen', 'Sandman',
+          'Hellboy', 'Akira', 'Berserk', 'Monster', 'Topolino', 'Diabolik', 'Zagor', 'Avengers', 'Flash',
+          'Lanterna', 'Verde', 'Nathan', 'Never', 'Martin', 'Mystere', 'One', 'Piece', 'Bleach', 'Dragon',
+          'Ball', 'Maus', 'Persepolis', 'Blacksad', 'Corto', 'Maltese', 'Valentina', 'Ken', 'Parker', 'Mister',
+          'No', 'Julia', 'Dampyr', 'Legs', 'Weaver', 'Brendon', 'Morgan', 'Lost', 'Orfani', 'Lazarus']
+
+# Trigger sospesi durante il caricamento: le somme che mantengono vengono ricalcolate alla fine
+# in un solo passaggio, invece di aggiornarle riga per riga
+_PREFISSI_TRIGGER = ('fumetti_letti_', 'preferenze_utente_')
+
+
+class _Zipf:
+    """Estrazione di indici 0..n-1 con probabilità proporzionale a 1 / (indice + 1) ** esponente."""
+    def __init__(self, n: int, esponente: float):
+        self.cumulati = list(itertools.accumulate(1 / (i + 1) ** esponente for i in range(n)))
+
+    def estrai(self, rng: random.Random) -> int:
+        return bisect.bisect_left(self.cumulati, rng.random() * self.cumulati[-1])
+
+
+def genera_database(percorso: str, utenti: int = 1000, fumetti: int = 5000, letture_medie: int = 30,
+                    editori: int = 50, quota_preferenze: float = 0.3, indice_fumetti: bool = True,
+                    seed: int = 42) -> Dict[str, int]:
+    """
+    Crea (o sostituisce i dati di) un database con lo schema corrente e dati sintetici.
+
+    Args:
+        percorso: Percorso del database SQLite
+        utenti: Numero di utenti
+        fumetti: Numero di fumetti nel catalogo
+        letture_medie: Numero medio di fumetti letti per utente
+        editori: Numero di editori
+        quota_preferenze: Quota di utenti con preferenze esplicite
+        indice_fumetti: Costruisce anche l'indice di similarità tra fumetti (similarita_fumetti.py)
+        seed: Seme dei numeri casuali, per database riproducibili
+    Returns:
+        Dizionario con il numero di righe generate per tabella
+    """
+    rng = random.Random(seed)
+    conn = sqlite3.connect(percorso)
+    migrazioni.applica_migrazioni(conn)
+    for tabella in ('preferenze_utente', 'fumetti_letti', 'raccomandazioni', 'stato_raccomandazioni',
+                    'similarita_fumetti', 'fumetti', 'utenti'):
+        conn.execute(f'DELETE FROM {tabella}')
+
+    trigger = conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger'").fetchall()
+    sospesi = [(nome, sql) for nome, sql in trigger if nome.startswith(_PREFISSI_TRIGGER)]
+    for nome, _ in sospesi:
+        conn.execute(f'DROP TRIGGER {nome}')
+
+    # Catalogo: editori e parole dei titoli con popolarità a legge di potenza
+    zipf_editori = _Zipf(editori, 1.1)
+    zipf_parole = _Zipf(len(PAROLE), 1.0)
+    conn.executemany('''
+        INSERT INTO fumetti (id, titolo, autore, url_copertina, editore, anno) VALUES (?, ?, ?, ?, ?, ?)
+    ''', ((str(i + 1),
+           f'{PAROLE[zipf_parole.estrai(rng)]} {PAROLE[zipf_parole.estrai(rng)]} {i + 1}',
+           f'Autore {rng.randrange(max(fumetti // 10, 1))}',
+           None,
+           f'Editore {zipf_editori.estrai(rng)}',
+           rng.randint(1960, 2024)) for i in range(fumetti)))
+
+    hash_password = generate_password_hash(PASSWORD, 'pbkdf2:sha256:1000')
+    conn.executemany('INSERT INTO utenti (id, username, password_hash) VALUES (?, ?, ?)',
+                     ((u, f'utente{u}', hash_password) for u in range(1, utenti + 1)))
+
+    # Letture: attività degli utenti con distribuzione di Pareto (media letture_medie), fumetti scelti
+    # per popolarità; il rating dipende dalla qualità del fumetto e dalla severità dell'utente
+    zipf_fumetti = _Zipf(fumetti, 0.9)
+    qualita = [rng.gauss(0, 0.7) for _ in range(fumetti)]
+    massimo = max(fumetti // 2, 1)
+    letture: List[tuple] = []
+    preferenze: List[tuple] = []
+    for utente in range(1, utenti + 1):
+        quante = min(massimo, max(1, int(rng.paretovariate(1.5) * letture_medie / 3)))
+        letti = set()
+        while len(letti) < quante:
+            letti.add(zipf_fumetti.estrai(rng))
+        severita = rng.gauss(0, 0.5)
+        for fumetto in letti:
+            rating = min(5, max(1, round(3.5 + qualita[fumetto] + severita + rng.gauss(0, 0.8))))
+            letture.append((utente, str(fumetto + 1), rating))
+        if rng.random() < quota_preferenze:
+            for fumetto in rng.sample(sorted(letti), min(len(letti), rng.randint(1, 5))):
+                preferenze.append((utente, str(fumetto + 1), round(rng.uniform(0.1, 1), 2)))
+    conn.executemany('INSERT INTO fumetti_letti (utente_id, comic_id, rating) VALUES (?, ?, ?)', letture)
+    conn.executemany('''
+        INSERT INTO preferenze_utente (utente_id, comic_id, genere, peso) VALUES (?, ?, 'non_specificato', ?)
+    ''', preferenze)
+
+    for _, sql in sospesi:
+        conn.execute(sql)
+    conn.execute('DELETE FROM profilo_utente_editori')
+    conn.execute(migrazioni.RICALCOLO_PROFILO_EDITORI)
+    conn.execute('DELETE FROM profilo_utente')
+    # Le somme per coppia servono solo se la similarità incrementale era già attiva sul database
+    if manutenzione_attiva(conn):
+        ricostruisci_somme(conn)
+    else:
+        conn.commit()
+
+    if indice_fumetti:
+        similarita_fumetti.salva_indice(conn, similarita_fumetti.calcola_indice(MatriceRating.da_database(conn)))
+
+    conteggi = {tabella: conn.execute(f'SELECT COUNT(*) FROM {tabella}').fetchone()[0]
+                for tabella in ('utenti', 'fumetti', 'fumetti_letti', 'preferenze_utente',
+                                'somme_similarita_utenti', 'similarita_fumetti')}
+    conn.close()
+    return conteggi
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Genera un database sintetico per i benchmark')
+    parser.add_argument('percorso', help='Database da creare')
+    parser.add_argument('--utenti', type=int, default=1000)
+    parser.add_argument('--fumetti', type=int, default=5000)
+    parser.add_argument('--letture', type=int, default=30, help='Fumetti letti in media da ogni utente')
+    parser.add_argument('--editori', type=int, default=50)
+    parser.add_argument('--quota-preferenze', type=float, default=0.3)
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    inizio = time.perf_counter()
+    conteggi = genera_database(args.percorso, args.utenti, args.fumetti, args.letture, args.editori,
+                               args.quota_preferenze, seed=args.seed)
+    print(', '.join(f'{tabella}: {righe}' for tabella, righe in conteggi.items()))
+    print(f'Generato in {time.perf_counter() - inizio:.1f}s')
+
+
+if __name__ == '__main__':
+    main()
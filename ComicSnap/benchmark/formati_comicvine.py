@@ -0,0 +1,111 @@
+import argparse
+import io
+import json
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape
+
+from comicvine import CAMPI_VOLUME, leggi_volumi_json, leggi_volumi_xml
+
+
+# Volume fittizio con tutti i campi restituiti da ComicVine quando field_list non è indicato
+def volume_completo(i: int) -> dict:
+    return {
+        'aliases': None,
+        'api_detail_url': f'https://comicvine.gamespot.com/api/volume/4050-{i}/',
+        'count_of_issues': i % 300,
+        'date_added': '2008-06-06 11:08:00',
+        'date_last_updated': '2023-01-01 10:00:00',
+        'deck': f'Descrizione breve del volume {i}',
+        'description': '<p>' + 'Lunga descrizione HTML del volume. ' * 40 + '</p>',
+        'first_issue': {'api_detail_url': 'x', 'id': 100000 + i, 'name': f'Primo numero {i}', 'issue_number': '1'},
+        'id': i,
+        'image': {k: f'https://comicvine.gamespot.com/a/uploads/{k}/{i}.jpg'
+                  for k in ('icon_url', 'medium_url', 'screen_url', 'screen_large_url', 'small_url',
+                            'super_url', 'thumb_url', 'tiny_url', 'original_url')},
+        'last_issue': {'api_detail_url': 'x', 'id': 200000 + i, 'name': f'Ultimo numero {i}', 'issue_number': '50'},
+        'name': f'Volume {i}',
+        'people': [{'id': j, 'name': f'Autore {j}', 'role': ('writer', 'artist', 'penciler')[j % 3]}
+                   for j in range(i % 5)],
+        'publisher': {'api_detail_url': 'x', 'id': i % 40, 'name': f'Editore {i % 40}'},
+        'site_detail_url': f'https://comicvine.gamespot.com/volume/4050-{i}/',
+        'start_year': str(1960 + i % 60),
+        'resource_type': 'volume'
+    }
+
+
+def in_xml(valore, tag: str) -> str:
+    if isinstance(valore, dict):
+        return f'<{tag}>' + ''.join(in_xml(v, k) for k, v in valore.items()) + f'</{tag}>'
+    if isinstance(valore, list):
+        return f'<{tag}>' + ''.join(
+            f'<person role="{p["role"]}">' + ''.join(in_xml(v, k) for k, v in p.items() if k != 'role') + '</person>'
+            for p in valore) + f'</{tag}>'
+    return f'<{tag}>{escape(str(valore)) if valore is not None else ""}</{tag}>'
+
+
+def crea_risposte(n_volumi: int, solo_campi_usati: bool = False):
+    volumi = [volume_completo(i) for i in range(n_volumi)]
+    if solo_campi_usati:
+        campi = CAMPI_VOLUME.split(',')
+        volumi = [{k: v for k, v in volume.items() if k in campi} for volume in volumi]
+    intestazione = {'error': 'OK', 'limit': n_volumi, 'offset': 0, 'number_of_page_results': n_volumi,
+                    'number_of_total_results': 10 * n_volumi, 'status_code': 1}
+    risposta_json = json.dumps(dict(intestazione, results=volumi)).encode()
+    risposta_xml = ('<?xml version="1.0" encoding="utf-8"?><response>'
+                    + ''.join(in_xml(v, k) for k, v in intestazione.items())
+                    + '<results>' + ''.join(in_xml(v, 'volume') for v in volumi) + '</results></response>').encode()
+    return risposta_xml, risposta_json
+
+
+# Parsing originale: albero completo e ricerche .// per ogni campo
+def leggi_xml_albero(contenuto: bytes):
+    root = ET.fromstring(contenuto.decode())
+    risultati = []
+    for volume in root.findall('.//volume'):
+        risultati.append((volume.find('.//id').text, volume.find('.//name').text,
+                          volume.find('.//deck').text, volume.find('.//start_year').text,
+                          volume.find('.//publisher/name').text, volume.find('.//image/small_url').text,
+                          [w.text for w in volume.findall(".//person[@role='writer']/name")]))
+    return risultati
+
+
+def misura(funzione, ripetizioni: int):
+    tempi = []
+    for _ in range(ripetizioni):
+        inizio = time.perf_counter()
+        funzione()
+        tempi.append(time.perf_counter() - inizio)
+    tracemalloc.start()
+    funzione()
+    _, picco = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return sorted(tempi)[len(tempi) // 2] * 1000, picco / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Confronto tra parsing XML e JSON delle risposte di ComicVine')
+    parser.add_argument('--volumi', type=int, nargs='+', default=[100, 1000])
+    parser.add_argument('--ripetizioni', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'volumi':>7} {'formato':<28} {'corpo (KB)':>11} {'tempo (ms)':>11} {'picco memoria (KB)':>19}")
+    for n_volumi in args.volumi:
+        risposta_xml, risposta_json = crea_risposte(n_volumi)
+        ridotta_xml, ridotta_json = crea_risposte(n_volumi, solo_campi_usati=True)
+        assert leggi_volumi_xml(io.BytesIO(risposta_xml)) == leggi_volumi_json(risposta_json)
+        scenari = [
+            ('xml, albero completo', risposta_xml, lambda: leggi_xml_albero(risposta_xml)),
+            ('xml, iterparse', risposta_xml, lambda: leggi_volumi_xml(io.BytesIO(risposta_xml))),
+            ('json', risposta_json, lambda: leggi_volumi_json(risposta_json)),
+            ('xml, iterparse, field_list', ridotta_xml, lambda: leggi_volumi_xml(io.BytesIO(ridotta_xml))),
+            ('json, field_list', ridotta_json, lambda: leggi_volumi_json(ridotta_json)),
+        ]
+        for nome, corpo, funzione in scenari:
+            tempo, picco = misura(funzione, args.ripetizioni)
+            print(f'{n_volumi:>7} {nome:<28} {len(corpo) / 1024:>11.0f} {tempo:>11.2f} {picco:>19.0f}')
+
+
+if __name__ == '__main__':
+    main()
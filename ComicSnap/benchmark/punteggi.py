@@ -0,0 +1,70 @@
+import argparse
+import random
+import time
+
+from comicvine import Volume
+from raccomandazioni import valuta_candidati
+
+EDITORI = [f'Editore {i}' for i in range(200)]
+
+
+# Candidati fittizi con editori, score collaborativi e preferenze distribuiti come nel catalogo
+def crea_dati(n_candidati: int, seed: int = 42):
+    rng = random.Random(seed)
+    candidati = [Volume(id=str(i), titolo=f'Volume {i}', editore=rng.choice(EDITORI)) for i in range(n_candidati)]
+    editori_preferiti = [(editore, round(rng.uniform(3, 5), 2)) for editore in rng.sample(EDITORI, 10)]
+    fumetti_letti = {str(i) for i in rng.sample(range(n_candidati), n_candidati // 10)}
+    punteggi = {str(i): rng.uniform(0, 20) for i in rng.sample(range(n_candidati), n_candidati // 2)}
+    preferenze = {str(i): rng.uniform(0, 1) for i in rng.sample(range(n_candidati), n_candidati // 100)}
+    return candidati, editori_preferiti, fumetti_letti, punteggi, preferenze
+
+
+# Versione precedente: scansione lineare degli editori, score su ogni candidato e ordinamento completo
+def valuta_ordinando(candidati, editori_preferiti, fumetti_letti, punteggi, preferenze, limite):
+    raccomandazioni = []
+    for volume in candidati:
+        if volume.id not in fumetti_letti:
+            score = 0
+            if volume.editore:
+                for ed_pref, rating_medio in editori_preferiti:
+                    if volume.editore == ed_pref:
+                        score += rating_medio
+            if volume.id in punteggi:
+                score += punteggi[volume.id]
+            if volume.id in preferenze:
+                score *= (1 + preferenze[volume.id])
+            volume.score = round(score, 2)
+            raccomandazioni.append(volume)
+    raccomandazioni.sort(key=lambda x: x.score, reverse=True)
+    return raccomandazioni[:limite]
+
+
+def misura(funzione, ripetizioni: int) -> float:
+    inizio = time.perf_counter()
+    for _ in range(ripetizioni):
+        funzione()
+    return (time.perf_counter() - inizio) / ripetizioni * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark della valutazione dei candidati alle raccomandazioni')
+    parser.add_argument('--candidati', type=int, nargs='+', default=[1_000, 10_000, 100_000])
+    parser.add_argument('--limite', type=int, default=10)
+    parser.add_argument('--ripetizioni', type=int, default=20)
+    args = parser.parse_args()
+
+    print(f"{'candidati':>10} {'ordinamento (ms)':>17} {'top-k (ms)':>11} {'uguali':>7}")
+    for n in args.candidati:
+        candidati, editori, letti, punteggi, preferenze = crea_dati(n)
+        attesi = [(v.id, v.score) for v in valuta_ordinando(candidati, editori, letti, punteggi, preferenze, args.limite)]
+        ottenuti = [(v.id, v.score) for v in valuta_candidati(candidati, dict(editori), letti, punteggi, preferenze,
+                                                              args.limite)]
+        ordinamento = misura(lambda: valuta_ordinando(candidati, editori, letti, punteggi, preferenze, args.limite),
+                             args.ripetizioni)
+        top_k = misura(lambda: valuta_candidati(candidati, dict(editori), letti, punteggi, preferenze, args.limite),
+                       args.ripetizioni)
+        print(f'{n:>10} {ordinamento:>17.2f} {top_k:>11.2f} {str(attesi == ottenuti):>7}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,241 @@
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from benchmark.dati import PAROLE, genera_database
+
+# Scenari riproducibili sulle route principali, con un database sintetico (benchmark/dati.py)
+# e ComicVine sostituito dal server locale (benchmark/comicvine_locale.py). Per ogni scenario
+# riporta throughput e latenze p50/p95/p99; i risultati si salvano in JSON e si confrontano
+# con quelli di un'esecuzione precedente.
+# Uso (dalla cartella ComicSnap):
+#   python -m benchmark.scenari [--utenti 1000] [--richieste 500] --output prima.json
+#   python -m benchmark.scenari ... --output dopo.json --confronta prima.json
+# Le variabili d'ambiente dell'applicazione già impostate (ad esempio DB_GROUP_COMMIT=true)
+# vengono mantenute, così si possono confrontare configurazioni diverse.
+
+# Richiesta da eseguire: (metodo, percorso, corpo JSON, utente autenticato oppure None)
+Richiesta = Tuple[str, str, Optional[Any], Optional[int]]
+
+
+def _richieste_search(rng: random.Random, n: int, utenti: int, fumetti: int,
+                      quota_nuove: float) -> List[Richiesta]:
+    # Parole del catalogo (risposte locali o dalla cache) e testi mai cercati (ComicVine)
+    richieste = []
+    for i in range(n):
+        query = rng.choice(PAROLE)
+        if rng.random() < quota_nuove:
+            query = f'{query} {rng.randrange(10 ** 9)}'
+        richieste.append(('GET', f'/search?q={query}', None, None))
+    return richieste
+
+
+def _richieste_raccomandazioni(rng: random.Random, n: int, utenti: int, fumetti: int,
+                               quota_nuove: float) -> List[Richiesta]:
+    return [('GET', '/raccomandazioni', None, rng.randint(1, utenti)) for _ in range(n)]
+
+
+def _richieste_fumetti_letti(rng: random.Random, n: int, utenti: int, fumetti: int,
+                             quota_nuove: float) -> List[Richiesta]:
+    return [('GET', '/fumetti_letti', None, rng.randint(1, utenti)) for _ in range(n)]
+
+
+def _richieste_scritture(rng: random.Random, n: int, utenti: int, fumetti: int,
+                         quota_nuove: float) -> List[Richiesta]:
+    # Tre letture registrate per ogni preferito aggiunto; i preferiti già presenti rispondono 400
+    richieste = []
+    for _ in range(n):
+        utente, comic_id = rng.randint(1, utenti), str(rng.randint(1, fumetti))
+        if rng.random() < 0.75:
+            richieste.append(('POST', '/fumetti-letti', {'comic_id': comic_id, 'rating': rng.randint(1, 5)}, utente))
+        else:
+            richieste.append(('POST', '/aggiungi_preferito', {'comic_id': comic_id, 'peso': 0.5}, utente))
+    return richieste
+
+
+SCENARI: Dict[str, Callable[..., List[Richiesta]]] = {
+    'search': _richieste_search,
+    'raccomandazioni': _richieste_raccomandazioni,
+    'fumetti_letti': _richieste_fumetti_letti,
+    'scritture': _richieste_scritture,
+}
+
+
+def percentili(durate: List[float]) -> Dict[str, float]:
+    """Percentili 50, 95 e 99 in millisecondi, calcolati come nelle statistiche dei componenti."""
+    valori = sorted(durate)
+    risultato = {}
+    for percentile in (50, 95, 99):
+        indice = min(len(valori) - 1, len(valori) * percentile // 100)
+        risultato[f'p{percentile}_ms'] = round(valori[indice] * 1000, 3) if valori else 0
+    return risultato
+
+
+def esegui_scenario(app, richieste: List[Richiesta], thread: int) -> Dict[str, Any]:
+    """
+    Esegue le richieste con `thread` client concorrenti tramite il client di test di Flask.
+
+    Args:
+        app: Applicazione Flask
+        richieste: Richieste generate da una funzione di SCENARI
+        thread: Numero di richieste contemporanee
+    Returns:
+        Dizionario con numero di richieste, errori (eccezioni e risposte 5xx), conteggio dei
+        codici HTTP, durata totale, throughput e percentili delle latenze
+    """
+    import jwt
+
+    client = app.test_client()
+    token = {}
+    for _, _, _, utente in richieste:
+        if utente is not None and utente not in token:
+            token[utente] = 'Bearer ' + jwt.encode(
+                {'utente_id': utente, 'username': f'utente{utente}', 'exp': time.time() + 3600},
+                app.config['SECRET_KEY'])
+
+    def esegui(richiesta: Richiesta) -> Tuple[float, Optional[int]]:
+        metodo, percorso, corpo, utente = richiesta
+        intestazioni = {'Accept': 'application/json'}
+        if utente is not None:
+            intestazioni['Authorization'] = token[utente]
+        inizio = time.perf_counter()
+        try:
+            codice = client.open(percorso, method=metodo, json=corpo, headers=intestazioni).status_code
+        except Exception as e:
+            print(f"Errore in {metodo} {percorso}: {e}")
+            codice = None
+        return time.perf_counter() - inizio, codice
+
+    with ThreadPoolExecutor(max_workers=thread) as pool:
+        inizio = time.perf_counter()
+        esiti = list(pool.map(esegui, richieste))
+        durata = time.perf_counter() - inizio
+
+    codici: Dict[str, int] = {}
+    for _, codice in esiti:
+        codici[str(codice)] = codici.get(str(codice), 0) + 1
+    return dict({
+        'richieste': len(richieste),
+        'errori': sum(1 for _, codice in esiti if codice is None or codice >= 500),
+        'codici': codici,
+        'durata_s': round(durata, 3),
+        'richieste_al_secondo': round(len(richieste) / durata, 2) if durata else 0,
+    }, **percentili([d for d, _ in esiti]))
+
+
+def confronta(precedenti: Dict[str, Any], attuali: Dict[str, Any]):
+    """Stampa per ogni scenario le variazioni di throughput e latenze rispetto a un'esecuzione precedente."""
+    print(f"\nConfronto con l'esecuzione del {precedenti.get('data', '?')}")
+    for nome, attuale in attuali['scenari'].items():
+        precedente = precedenti.get('scenari', {}).get(nome)
+        if precedente is None:
+            print(f'{nome:16} assente nell\'esecuzione precedente')
+            continue
+        variazioni = []
+        for chiave in ('richieste_al_secondo', 'p50_ms', 'p95_ms', 'p99_ms'):
+            prima, dopo = precedente.get(chiave), attuale[chiave]
+            if prima:
+                variazioni.append(f'{chiave} {prima} -> {dopo} ({(dopo - prima) / prima * 100:+.1f}%)')
+        print(f'{nome:16} ' + ', '.join(variazioni))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Scenari di carico riproducibili sulle route principali')
+    parser.add_argument('--scenari', default=','.join(SCENARI), help='Scenari da eseguire, separati da virgole')
+    parser.add_argument('--richieste', type=int, default=500, help='Richieste per scenario')
+    parser.add_argument('--thread', type=int, default=8, help='Richieste contemporanee')
+    parser.add_argument('--utenti', type=int, default=1000)
+    parser.add_argument('--fumetti', type=int, default=5000)
+    parser.add_argument('--letture', type=int, default=30, help='Fumetti letti in media da ogni utente')
+    parser.add_argument('--database', help='Database già generato da usare (ne viene usata una copia)')
+    parser.add_argument('--quota-nuove', type=float, default=0.3,
+                        help='Frazione delle ricerche con testi mai cercati, servite da ComicVine')
+    parser.add_argument('--latenza-ms', type=float, default=100, help='Latenza di ComicVine')
+    parser.add_argument('--variazione-ms', type=float, default=50, help='Variazione casuale della latenza')
+    parser.add_argument('--quota-429', type=float, default=0, help='Frazione delle richieste a ComicVine con 429')
+    parser.add_argument('--registrazioni', help='Cartella con risposte di ComicVine registrate')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', help='File JSON in cui salvare i risultati')
+    parser.add_argument('--confronta', help='File JSON di un\'esecuzione precedente')
+    args = parser.parse_args()
+
+    nomi = [nome.strip() for nome in args.scenari.split(',') if nome.strip()]
+    sconosciuti = [nome for nome in nomi if nome not in SCENARI]
+    if sconosciuti:
+        parser.error(f"Scenari sconosciuti: {', '.join(sconosciuti)}")
+
+    cartella = tempfile.mkdtemp()
+    percorso_db = os.path.join(cartella, 'comicsnap.db')
+    if args.database:
+        shutil.copyfile(args.database, percorso_db)
+    else:
+        inizio = time.perf_counter()
+        conteggi = genera_database(percorso_db, args.utenti, args.fumetti, args.letture, seed=args.seed)
+        print(f"Database generato in {time.perf_counter() - inizio:.1f}s: {conteggi}")
+
+    # La configurazione viene letta all'importazione di config.py, quindi va impostata prima
+    os.environ.update({
+        'DATABASE_PATH': percorso_db,
+        'SEARCH_CACHE_PATH': os.path.join(cartella, 'cache.db'),
+    })
+    os.environ.setdefault('COMICVINE_API_KEY', 'prova')
+    os.environ.setdefault('COMICVINE_REQUESTS_PER_HOUR', str(3600 * 1000))
+    # L'arricchimento in background renderebbe i risultati dipendenti dai tempi delle richieste
+    os.environ.setdefault('RACCOMANDAZIONI_ARRICCHIMENTO', 'false')
+    import comicvine
+    from benchmark.comicvine_locale import ComicVineLocale
+
+    comicvine_locale = ComicVineLocale(args.latenza_ms / 1000, args.variazione_ms / 1000, args.quota_429,
+                                       volumi=args.fumetti, cartella_registrazioni=args.registrazioni,
+                                       seed=args.seed).avvia()
+    comicvine.BASE_URL = comicvine_locale.url
+    try:
+        from app import app, inizializza_db
+        import sqlite3
+
+        # Un database passato con --database può avere uno schema precedente
+        inizializza_db()
+
+        conn = sqlite3.connect(percorso_db)
+        utenti, fumetti = conn.execute('SELECT (SELECT MAX(id) FROM utenti), (SELECT COUNT(*) FROM fumetti)').fetchone()
+        conn.close()
+
+        risultati = {
+            'data': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'parametri': vars(args),
+            'scenari': {},
+        }
+        for nome in nomi:
+            # Ogni scenario ha il suo generatore: le richieste non cambiano se si escludono gli altri
+            rng = random.Random(f'{args.seed}-{nome}')
+            richieste = SCENARI[nome](rng, args.richieste, utenti, fumetti, args.quota_nuove)
+            risultato = esegui_scenario(app, richieste, args.thread)
+            risultati['scenari'][nome] = risultato
+            print(f"{nome:16} {risultato['richieste_al_secondo']:8.1f} richieste/s  "
+                  f"p50 {risultato['p50_ms']:8.1f} ms  p95 {risultato['p95_ms']:8.1f} ms  "
+                  f"p99 {risultato['p99_ms']:8.1f} ms  errori {risultato['errori']}  codici {risultato['codici']}")
+        risultati['comicvine'] = comicvine_locale.statistiche()
+
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(risultati, f, indent=2)
+            print(f'Risultati salvati in {args.output}')
+        if args.confronta:
+            with open(args.confronta) as f:
+                confronta(json.load(f), risultati)
+    finally:
+        comicvine_locale.chiudi()
+        shutil.rmtree(cartella, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,174 @@
+import argparse
+import heapq
+import random
+import sqlite3
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+import migrazioni
+import similarita_fumetti
+from matrice_rating import MatriceRating
+
+
+# Implementazione originale, con una query per ogni altro utente, usata come riferimento
+def similarita_legacy(conn: sqlite3.Connection, utente_id: int) -> Dict[int, float]:
+    cursor = conn.cursor()
+    cursor.execute('SELECT comic_id, rating FROM fumetti_letti WHERE utente_id = ?', (utente_id,))
+    ratings_utente = dict(cursor.fetchall())
+    cursor.execute('SELECT DISTINCT utente_id FROM fumetti_letti WHERE utente_id != ?', (utente_id,))
+    altri_utenti = [row[0] for row in cursor.fetchall()]
+
+    similarita = {}
+    for altro_utente in altri_utenti:
+        cursor.execute('SELECT comic_id, rating FROM fumetti_letti WHERE utente_id = ?', (altro_utente,))
+        ratings_altro = dict(cursor.fetchall())
+        fumetti_comuni = set(ratings_utente.keys()) & set(ratings_altro.keys())
+        if fumetti_comuni:
+            numeratore = sum(ratings_utente[f] * ratings_altro[f] for f in fumetti_comuni)
+            denominatore = (sum(ratings_utente[f]**2 for f in fumetti_comuni) ** 0.5) * \
+                         (sum(ratings_altro[f]**2 for f in fumetti_comuni) ** 0.5)
+            similarita[altro_utente] = numeratore / denominatore if denominatore > 0 else 0
+    return similarita
+
+
+# Aggregazione collaborativa originale, con una query per ogni vicino
+def collaborativo_legacy(conn: sqlite3.Connection, similarita_utenti: Dict[int, float]) -> Dict[str, float]:
+    cursor = conn.cursor()
+    fumetti_raccomandati = defaultdict(float)
+    for altro_utente, sim in similarita_utenti.items():
+        cursor.execute('SELECT comic_id, rating FROM fumetti_letti WHERE utente_id = ? AND rating >= 4',
+                       (altro_utente,))
+        for comic_id, rating in cursor.fetchall():
+            fumetti_raccomandati[comic_id] += sim * rating
+    return fumetti_raccomandati
+
+
+# Crea un database in memoria con n_rating valutazioni distribuite in modo non uniforme
+def crea_database(n_rating: int, seed: int = 42) -> sqlite3.Connection:
+    rng = random.Random(seed)
+    n_utenti = max(10, n_rating // 20)
+    n_fumetti = max(50, n_rating // 10)
+    conn = sqlite3.connect(':memory:')
+    conn.execute('''
+        CREATE TABLE fumetti_letti (
+            id INTEGER PRIMARY KEY,
+            utente_id INTEGER,
+            comic_id TEXT NOT NULL,
+            rating INTEGER CHECK (rating >= 1 AND rating <= 5),
+            data_lettura DATETIME DEFAULT CURRENT_TIMESTAMP
+        )
+    ''')
+    righe = set()
+    while len(righe) < n_rating:
+        # I fumetti più popolari ricevono molte più valutazioni (distribuzione di Pareto)
+        fumetto = min(int(rng.paretovariate(1.2)) - 1, n_fumetti - 1)
+        righe.add((rng.randrange(n_utenti), str(fumetto)))
+    conn.executemany('INSERT INTO fumetti_letti (utente_id, comic_id, rating) VALUES (?, ?, ?)',
+                     ((u, f, rng.randint(1, 5)) for u, f in righe))
+    conn.commit()
+    return conn
+
+
+# Migliori k fumetti non ancora letti secondo gli score collaborativi
+def migliori(punteggi: Dict[str, float], letti: set, k: int) -> List[str]:
+    return [f for f, _ in heapq.nlargest(k, ((f, p) for f, p in punteggi.items() if f not in letti),
+                                         key=lambda x: x[1])]
+
+
+# Confronta il filtraggio per fumetti (indice precalcolato) con quello per utenti:
+# recall@k rispetto ai migliori k fumetti del filtraggio per utenti e tempi per richiesta
+def confronta_filtraggio_fumetti(conn: sqlite3.Connection, matrice: MatriceRating, n_utenti: int,
+                                 vicini: int, k: int = 10):
+    for istruzione in migrazioni.SIMILARITA_FUMETTI:
+        conn.execute(istruzione)
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_rating ON fumetti_letti (utente_id, comic_id, rating)')
+    inizio = time.perf_counter()
+    similarita_fumetti.salva_indice(conn, similarita_fumetti.calcola_indice(matrice, vicini))
+    costruzione = (time.perf_counter() - inizio) * 1000
+
+    utenti = random.Random(0).sample(matrice.utenti.tolist(), min(n_utenti, len(matrice.utenti)))
+    recall, tempi_utenti, tempi_fumetti = [], [], []
+    for utente in utenti:
+        colonne, _ = matrice.rating_utente(utente)
+        letti = set(matrice.fumetti[colonne].tolist())
+
+        inizio = time.perf_counter()
+        attesi = migliori(matrice.punteggi_collaborativi(matrice.similarita_coseno(utente)), letti, k)
+        tempi_utenti.append(time.perf_counter() - inizio)
+        inizio = time.perf_counter()
+        ottenuti = migliori(similarita_fumetti.punteggi_per_fumetti(conn, utente), letti, k)
+        tempi_fumetti.append(time.perf_counter() - inizio)
+
+        if attesi:
+            recall.append(len(set(attesi) & set(ottenuti)) / len(attesi))
+
+    mediana = lambda tempi: sorted(tempi)[len(tempi) // 2] * 1000
+    return costruzione, mediana(tempi_utenti), mediana(tempi_fumetti), sum(recall) / max(len(recall), 1)
+
+
+def misura(funzione, ripetizioni: int) -> float:
+    tempi = []
+    for _ in range(ripetizioni):
+        inizio = time.perf_counter()
+        funzione()
+        tempi.append(time.perf_counter() - inizio)
+    return sorted(tempi)[len(tempi) // 2] * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark del filtraggio collaborativo tra utenti')
+    parser.add_argument('--scale', type=int, nargs='+', default=[10_000, 100_000, 1_000_000],
+                        help='Numero di rating da generare per ogni scenario')
+    parser.add_argument('--max-legacy', type=int, default=10_000,
+                        help="Numero massimo di rating per cui misurare anche l'implementazione originale")
+    parser.add_argument('--ripetizioni', type=int, default=5)
+    parser.add_argument('--utenti-recall', type=int, default=100,
+                        help='Utenti su cui misurare la recall@10 del filtraggio per fumetti')
+    parser.add_argument('--vicini', type=int, default=similarita_fumetti.VICINI_PER_FUMETTO,
+                        help="Vicini per fumetto nell'indice di similarità")
+    args = parser.parse_args()
+
+    confronti = []
+
+    print(f"{'rating':>10} {'costruzione (ms)':>17} {'similarità (ms)':>16} {'collab. (ms)':>13} "
+          f"{'richiesta (ms)':>15} {'legacy (ms)':>12} {'diff max':>9}")
+    for n_rating in args.scale:
+        conn = crea_database(n_rating)
+        utente = conn.execute('''
+            SELECT utente_id FROM fumetti_letti GROUP BY utente_id ORDER BY COUNT(*) DESC LIMIT 1
+        ''').fetchone()[0]
+
+        costruzione = misura(lambda: MatriceRating.da_database(conn), args.ripetizioni)
+        matrice = MatriceRating.da_database(conn)
+        query = misura(lambda: matrice.similarita_coseno(utente), args.ripetizioni)
+        similarita = matrice.similarita_coseno(utente)
+        collaborativo = misura(lambda: matrice.punteggi_collaborativi(similarita), args.ripetizioni)
+
+        legacy, differenza = '-', '-'
+        if n_rating <= args.max_legacy:
+            legacy = misura(lambda: collaborativo_legacy(conn, similarita_legacy(conn, utente)), 1)
+            legacy = f'{legacy:.1f}'
+            attesi = similarita_legacy(conn, utente)
+            assert attesi.keys() == similarita.keys()
+            attesi_collaborativi = collaborativo_legacy(conn, attesi)
+            ottenuti_collaborativi = matrice.punteggi_collaborativi(similarita)
+            assert attesi_collaborativi.keys() == ottenuti_collaborativi.keys()
+            differenza = max(
+                max((abs(attesi[u] - similarita[u]) for u in attesi), default=0),
+                max((abs(attesi_collaborativi[f] - ottenuti_collaborativi[f]) for f in attesi_collaborativi), default=0))
+            differenza = f'{differenza:.0e}'
+
+        print(f'{n_rating:>10} {costruzione:>17.1f} {query:>16.2f} {collaborativo:>13.2f} '
+              f'{costruzione + query + collaborativo:>15.1f} {legacy:>12} {differenza:>9}')
+        confronti.append((n_rating, *confronta_filtraggio_fumetti(conn, matrice, args.utenti_recall, args.vicini)))
+        conn.close()
+
+    print(f"\nFiltraggio per fumetti ({args.vicini} vicini per fumetto) rispetto al filtraggio per utenti")
+    print(f"{'rating':>10} {'indice (ms)':>12} {'utenti (ms)':>12} {'fumetti (ms)':>13} {'recall@10':>10}")
+    for n_rating, costruzione, tempo_utenti, tempo_fumetti, recall in confronti:
+        print(f'{n_rating:>10} {costruzione:>12.0f} {tempo_utenti:>12.2f} {tempo_fumetti:>13.2f} {recall:>10.2f}')
+
+
+if __name__ == '__main__':
+    main()
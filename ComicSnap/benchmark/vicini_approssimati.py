@@ -0,0 +1,106 @@
+import argparse
+import heapq
+import random
+import sqlite3
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from matrice_rating import MatriceRating
+from vicini_approssimati import IndiceMinHash
+
+
+# Crea un database in memoria in cui gli utenti appartengono a comunità con gusti simili:
+# ogni utente legge soprattutto i fumetti della sua comunità e in parte i più popolari
+def crea_database(n_utenti: int, letture_per_utente: int, n_comunita: int, seed: int = 42) -> sqlite3.Connection:
+    rng = random.Random(seed)
+    n_fumetti = n_utenti // 2
+    conn = sqlite3.connect(':memory:')
+    conn.execute('''
+        CREATE TABLE fumetti_letti (
+            id INTEGER PRIMARY KEY,
+            utente_id INTEGER,
+            comic_id TEXT NOT NULL,
+            rating INTEGER CHECK (rating >= 1 AND rating <= 5)
+        )
+    ''')
+    catalogo_comunita = [rng.sample(range(n_fumetti), 60) for _ in range(n_comunita)]
+    righe = []
+    for utente in range(n_utenti):
+        comunita = catalogo_comunita[utente % n_comunita]
+        letti = set()
+        while len(letti) < letture_per_utente:
+            if rng.random() < 0.7:
+                letti.add((rng.choice(comunita), True))
+            else:
+                letti.add((min(int(rng.paretovariate(1.2)) - 1, n_fumetti - 1), False))
+        # I fumetti della propria comunità ricevono in prevalenza rating alti
+        righe.extend((utente, str(f), rng.randint(4, 5) if proprio else rng.randint(1, 5)) for f, proprio in letti)
+    conn.executemany('INSERT OR IGNORE INTO fumetti_letti (utente_id, comic_id, rating) VALUES (?, ?, ?)', righe)
+    conn.commit()
+    return conn
+
+
+def migliori(similarita: Dict[int, float], k: int) -> List[float]:
+    return heapq.nlargest(k, similarita.values())
+
+
+# Recall con parità: un vicino trovato è corretto se la sua similarità raggiunge quella del k-esimo
+# vicino esatto (la similarità sui soli fumetti in comune ha molti utenti a pari merito)
+def recall(attesi: List[float], trovati: List[float]) -> float:
+    soglia = attesi[-1] - 1e-9
+    return min(sum(1 for s in trovati if s >= soglia), len(attesi)) / len(attesi)
+
+
+def percentili(tempi: List[float]) -> str:
+    p50, p99 = np.percentile(np.array(tempi) * 1000, [50, 99])
+    return f'{p50:>9.2f} {p99:>9.2f}'
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark della ricerca approssimata degli utenti simili')
+    parser.add_argument('--utenti', type=int, default=50_000)
+    parser.add_argument('--letture', type=int, default=20, help='Fumetti letti da ogni utente')
+    parser.add_argument('--comunita', type=int, default=500)
+    parser.add_argument('--bande', type=int, nargs='+', default=[8, 16, 32, 64, 128],
+                        help='Valori del parametro bande da confrontare')
+    parser.add_argument('--righe', type=int, default=1, help='Righe per banda')
+    parser.add_argument('--popolarita-max', type=float, default=0.05,
+                        help='Quota massima di lettori dei fumetti usati nelle firme MinHash')
+    parser.add_argument('--vicini', type=int, default=50, help='Vicini considerati per la recall')
+    parser.add_argument('--interrogazioni', type=int, default=200)
+    args = parser.parse_args()
+
+    conn = crea_database(args.utenti, args.letture, args.comunita)
+    matrice = MatriceRating.da_database(conn)
+    utenti = random.Random(0).sample(matrice.utenti.tolist(), min(args.interrogazioni, len(matrice.utenti)))
+
+    tempi_esatti, attesi = [], {}
+    for utente in utenti:
+        inizio = time.perf_counter()
+        similarita = matrice.similarita_coseno(utente)
+        tempi_esatti.append(time.perf_counter() - inizio)
+        attesi[utente] = migliori(similarita, args.vicini)
+
+    print(f"{matrice.numero_rating} rating, {len(matrice.utenti)} utenti, recall dei {args.vicini} vicini più simili")
+    print(f"{'bande':>6} {'indice (s)':>11} {'candidati':>10} {'recall':>7} {'p50 (ms)':>9} {'p99 (ms)':>9}")
+    print(f"{'esatto':>6} {'-':>11} {len(matrice.utenti):>10} {1:>7.2f} {percentili(tempi_esatti)}")
+    for bande in args.bande:
+        inizio = time.perf_counter()
+        indice = IndiceMinHash(matrice, bande=bande, righe_per_banda=args.righe, popolarita_max=args.popolarita_max)
+        costruzione = time.perf_counter() - inizio
+
+        tempi, recall_utenti, candidati = [], [], []
+        for utente in utenti:
+            inizio = time.perf_counter()
+            similarita = indice.similarita_coseno(utente)
+            tempi.append(time.perf_counter() - inizio)
+            candidati.append(len(indice.candidati(utente)))
+            if attesi[utente]:
+                recall_utenti.append(recall(attesi[utente], migliori(similarita, args.vicini)))
+        print(f'{bande:>6} {costruzione:>11.1f} {np.mean(candidati):>10.0f} {np.mean(recall_utenti):>7.2f} {percentili(tempi)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,244 @@
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from coalescenza import SingoloVolo
+
+
+class CacheRicerche:
+    """
+    Cache a due livelli per i risultati delle ricerche su ComicVine: una LRU in memoria
+    con scadenza davanti a un archivio SQLite su disco condiviso tra i processi.
+
+    Le voci scadute da meno di ttl_obsoleto_secondi vengono servite subito mentre un
+    thread in background le aggiorna (stale-while-revalidate); se l'API esterna fallisce
+    si serve comunque l'ultimo risultato disponibile, anche se più vecchio.
+    Le richieste concorrenti per la stessa chiave mancante condividono un'unica chiamata all'API.
+    """
+    def __init__(self, percorso_db: str, ttl_secondi: float, ttl_obsoleto_secondi: float, dimensione_max: int,
+                 codifica: Callable[[Any], Any] = lambda x: x, decodifica: Callable[[Any], Any] = lambda x: x,
+                 coalescenza: Optional[SingoloVolo] = None):
+        """
+        Inizializza la cache.
+
+        Args:
+            percorso_db: Percorso del database SQLite della cache su disco
+            ttl_secondi: Età oltre la quale una voce viene aggiornata
+            ttl_obsoleto_secondi: Tempo aggiuntivo in cui una voce scaduta può ancora essere servita
+            dimensione_max: Numero massimo di voci tenute in memoria
+            codifica: Converte un valore in una struttura serializzabile in JSON per il disco
+            decodifica: Ricostruisce il valore dalla struttura letta dal disco
+            coalescenza: Coalescenza dei calcoli concorrenti; con un lease condiviso vale anche tra processi
+        """
+        self.ttl = ttl_secondi
+        self.ttl_obsoleto = ttl_obsoleto_secondi
+        self.dimensione_max = dimensione_max
+        self.codifica = codifica
+        self.decodifica = decodifica
+        self.coalescenza = coalescenza or SingoloVolo()
+        self._memoria: 'OrderedDict[str, Tuple[Any, float]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._in_aggiornamento = set()
+        # Riferimenti agli aggiornamenti asincroni in corso, che altrimenti potrebbero essere raccolti dal GC
+        self._task_aggiornamento = set()
+        self._contatori = {'hit': 0, 'hit_disco': 0, 'hit_obsoleti': 0, 'miss': 0,
+                           'evizioni': 0, 'errori_upstream': 0}
+
+        self._conn = sqlite3.connect(percorso_db, check_same_thread=False)
+        self._conn.execute('''
+            CREATE TABLE IF NOT EXISTS cache_ricerche (
+                chiave TEXT PRIMARY KEY,
+                valore TEXT NOT NULL,
+                creato_il REAL NOT NULL
+            )
+        ''')
+        self._conn.commit()
+        self._scritture = 0
+
+    @staticmethod
+    def chiave(query: str, max_results: int) -> str:
+        # Ricerche che differiscono solo per maiuscole o spazi condividono la stessa voce;
+        # il prefisso di versione va cambiato quando cambia il formato dei risultati salvati
+        return f"v2|{' '.join(query.lower().split())}|{max_results}"
+
+    def ottieni(self, chiave: str, calcola: Callable[[], Any]) -> Any:
+        """
+        Restituisce il valore associato alla chiave, calcolandolo se necessario.
+
+        Args:
+            chiave: Chiave della ricerca (vedi CacheRicerche.chiave)
+            calcola: Funzione che interroga l'API esterna; deve sollevare un'eccezione in caso di errore
+        Returns:
+            Il valore in cache o appena calcolato
+        Raises:
+            L'eccezione di calcola se l'API fallisce e non c'è alcun valore salvato
+        """
+        voce = self._leggi(chiave)
+        if voce is not None:
+            valore, creato_il = voce
+            eta = time.time() - creato_il
+            if eta < self.ttl:
+                self._conta('hit')
+                return valore
+            if eta < self.ttl + self.ttl_obsoleto:
+                self._conta('hit_obsoleti')
+                self._aggiorna_in_background(chiave, calcola)
+                return valore
+
+        self._conta('miss')
+
+        def calcola_e_scrivi():
+            valore = calcola()
+            self._scrivi(chiave, valore)
+            return valore
+
+        try:
+            return self.coalescenza.esegui(chiave, calcola_e_scrivi, lambda: self._leggi_recente(chiave))
+        except Exception:
+            self._conta('errori_upstream')
+            if voce is not None:
+                return voce[0]
+            raise
+
+    def leggi(self, chiave: str) -> Any:
+        """
+        Restituisce il valore in cache senza mai interrogare l'API esterna.
+
+        Returns:
+            Il valore salvato, anche se da aggiornare, oppure None se manca o è troppo vecchio
+        """
+        voce = self._leggi(chiave)
+        if voce is None or time.time() - voce[1] >= self.ttl + self.ttl_obsoleto:
+            return None
+        return voce[0]
+
+    async def ottieni_asincrono(self, chiave: str, calcola: Callable[[], Awaitable[Any]]) -> Any:
+        """
+        Versione asincrona di ottieni: calcola è una coroutine function e gli accessi
+        al disco avvengono fuori dall'event loop.
+        """
+        voce = await asyncio.to_thread(self._leggi, chiave)
+        if voce is not None:
+            valore, creato_il = voce
+            eta = time.time() - creato_il
+            if eta < self.ttl:
+                self._conta('hit')
+                return valore
+            if eta < self.ttl + self.ttl_obsoleto:
+                self._conta('hit_obsoleti')
+                self._aggiorna_in_background_asincrono(chiave, calcola)
+                return valore
+
+        self._conta('miss')
+
+        async def calcola_e_scrivi():
+            valore = await calcola()
+            await asyncio.to_thread(self._scrivi, chiave, valore)
+            return valore
+
+        try:
+            return await self.coalescenza.esegui_asincrono(chiave, calcola_e_scrivi,
+                                                           lambda: self._leggi_recente(chiave))
+        except Exception:
+            self._conta('errori_upstream')
+            if voce is not None:
+                return voce[0]
+            raise
+
+    def statistiche(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._contatori, voci_in_memoria=len(self._memoria))
+
+    def _conta(self, contatore: str):
+        with self._lock:
+            self._contatori[contatore] += 1
+
+    def _leggi(self, chiave: str) -> Optional[Tuple[Any, float]]:
+        with self._lock:
+            voce = self._memoria.get(chiave)
+            if voce is not None:
+                self._memoria.move_to_end(chiave)
+                return voce
+
+            riga = self._conn.execute('SELECT valore, creato_il FROM cache_ricerche WHERE chiave = ?',
+                                      (chiave,)).fetchone()
+            if riga is None:
+                return None
+            self._contatori['hit_disco'] += 1
+            voce = (self.decodifica(json.loads(riga[0])), riga[1])
+            self._inserisci_in_memoria(chiave, voce)
+            return voce
+
+    def _leggi_recente(self, chiave: str) -> Any:
+        # Valore non scaduto scritto su disco da un altro processo, oppure None
+        with self._lock:
+            riga = self._conn.execute('SELECT valore, creato_il FROM cache_ricerche WHERE chiave = ? AND creato_il >= ?',
+                                      (chiave, time.time() - self.ttl)).fetchone()
+            if riga is None:
+                return None
+            voce = (self.decodifica(json.loads(riga[0])), riga[1])
+            self._inserisci_in_memoria(chiave, voce)
+            return voce[0]
+
+    def _scrivi(self, chiave: str, valore: Any):
+        creato_il = time.time()
+        with self._lock:
+            self._inserisci_in_memoria(chiave, (valore, creato_il))
+            self._conn.execute('INSERT OR REPLACE INTO cache_ricerche (chiave, valore, creato_il) VALUES (?, ?, ?)',
+                               (chiave, json.dumps(self.codifica(valore)), creato_il))
+            # Ogni tanto elimina dal disco le voci troppo vecchie per essere servite
+            self._scritture += 1
+            if self._scritture % 100 == 0:
+                self._conn.execute('DELETE FROM cache_ricerche WHERE creato_il < ?',
+                                   (creato_il - self.ttl - self.ttl_obsoleto,))
+            self._conn.commit()
+
+    def _inserisci_in_memoria(self, chiave: str, voce: Tuple[Any, float]):
+        self._memoria[chiave] = voce
+        self._memoria.move_to_end(chiave)
+        while len(self._memoria) > self.dimensione_max:
+            self._memoria.popitem(last=False)
+            self._contatori['evizioni'] += 1
+
+    def _aggiorna_in_background(self, chiave: str, calcola: Callable[[], Any]):
+        with self._lock:
+            if chiave in self._in_aggiornamento:
+                return
+            self._in_aggiornamento.add(chiave)
+
+        def aggiorna():
+            try:
+                self._scrivi(chiave, calcola())
+            except Exception as e:
+                self._conta('errori_upstream')
+                print(f"Errore nell'aggiornamento della cache per '{chiave}': {e}")
+            finally:
+                with self._lock:
+                    self._in_aggiornamento.discard(chiave)
+
+        threading.Thread(target=aggiorna, daemon=True).start()
+
+    def _aggiorna_in_background_asincrono(self, chiave: str, calcola: Callable[[], Awaitable[Any]]):
+        with self._lock:
+            if chiave in self._in_aggiornamento:
+                return
+            self._in_aggiornamento.add(chiave)
+
+        async def aggiorna():
+            try:
+                valore = await calcola()
+                await asyncio.to_thread(self._scrivi, chiave, valore)
+            except Exception as e:
+                self._conta('errori_upstream')
+                print(f"Errore nell'aggiornamento della cache per '{chiave}': {e}")
+            finally:
+                with self._lock:
+                    self._in_aggiornamento.discard(chiave)
+
+        task = asyncio.get_running_loop().create_task(aggiorna())
+        self._task_aggiornamento.add(task)
+        task.add_done_callback(self._task_aggiornamento.discard)
@@ -0,0 +1,157 @@
+import heapq
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, replace
+from typing import AbstractSet, Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import catalogo
+from cache_ricerche import CacheRicerche
+from comicvine import ClientComicVine, Volume
+
+
+@dataclass
+class ProfiloUtente:
+    """Dati dell'utente usati per generare e valutare i candidati alle raccomandazioni."""
+    utente_id: int
+    editori_preferiti: List[Tuple[str, float]]
+    fumetti_letti: AbstractSet[str]
+    punteggi_collaborativi: Dict[str, float]
+
+
+class GeneratoreCandidati(ABC):
+    """
+    Fase di generazione dei candidati: propone i volumi tra cui SistemaRaccomandazione sceglie
+    le raccomandazioni. Le sottoclassi leggono solo dati locali, così la latenza delle
+    raccomandazioni non dipende da ComicVine.
+    """
+    @abstractmethod
+    def genera(self, profilo: ProfiloUtente, limite: int) -> List[Volume]:
+        """
+        Args:
+            profilo: Profilo dell'utente
+            limite: Numero massimo di candidati da proporre
+        Returns:
+            Volumi candidati, esclusi quelli già letti dall'utente
+        """
+
+
+class ArricchimentoComicVine:
+    """
+    Completa il catalogo locale interrogando ComicVine in background: i metadati dei fumetti
+    consigliati dai vicini che non sono ancora nel catalogo e le ricerche che mancano nella cache.
+    Le raccomandazioni calcolate nel frattempo usano i dati già disponibili.
+    """
+    def __init__(self, connessione: Callable[[], sqlite3.Connection],
+                 cerca: Optional[Callable[[str], Any]] = None,
+                 client: Optional[Callable[[], ClientComicVine]] = None, thread: int = 1):
+        """
+        Inizializza l'arricchimento.
+
+        Args:
+            connessione: Restituisce la connessione al database del thread corrente
+            cerca: Esegue una ricerca su ComicVine salvandone i risultati (cache e catalogo)
+            client: Restituisce il client ComicVine da usare (di default quello condiviso)
+            thread: Numero di thread dedicati alle richieste in background
+        """
+        if client is None:
+            import comicvine
+            client = comicvine.ottieni_client
+        self.connessione = connessione
+        self._cerca = cerca
+        self._client = client
+        self._pool = ThreadPoolExecutor(max_workers=thread, thread_name_prefix='arricchimento')
+        self._lock = threading.Lock()
+        self._in_corso = set()
+
+    def completa_metadati(self, comic_ids: Iterable[str]):
+        """Richiede a ComicVine i dati dei fumetti indicati (al massimo 100) e li aggiunge al catalogo."""
+        # Gli ID generati localmente (uuid) non esistono su ComicVine
+        ids = sorted(i for i in comic_ids if i.isdigit())[:100]
+        if ids:
+            self._in_background(f"id:{'|'.join(ids)}", self._scarica_metadati, ids)
+
+    def cerca(self, query: str):
+        """Esegue in background una ricerca su ComicVine, se è stata configurata."""
+        if self._cerca is not None:
+            self._in_background(f"ricerca:{query}", self._cerca, query)
+
+    def _scarica_metadati(self, ids: List[str]):
+        _, volumi = self._client().elenca_volumi('id:' + '|'.join(ids), limit=len(ids))
+        conn = self.connessione()
+        try:
+            catalogo.aggiungi_volumi(conn, volumi)
+            conn.commit()
+        except Exception:
+            # La connessione resta al thread: una transazione aperta terrebbe il lock di scrittura
+            if conn.in_transaction:
+                conn.rollback()
+            raise
+
+    def _in_background(self, chiave: str, funzione: Callable, argomento):
+        with self._lock:
+            if chiave in self._in_corso:
+                return
+            self._in_corso.add(chiave)
+
+        def esegui():
+            try:
+                funzione(argomento)
+            except Exception as e:
+                print(f"Errore nell'arricchimento da ComicVine ({chiave}): {e}")
+            finally:
+                with self._lock:
+                    self._in_corso.discard(chiave)
+
+        self._pool.submit(esegui)
+
+
+class CandidatiDaiVicini(GeneratoreCandidati):
+    """Fumetti valutati positivamente dagli utenti più simili, dal punteggio collaborativo più alto."""
+    def __init__(self, conn: sqlite3.Connection, arricchimento: Optional[ArricchimentoComicVine] = None):
+        self.conn = conn
+        self.arricchimento = arricchimento
+
+    def genera(self, profilo: ProfiloUtente, limite: int) -> List[Volume]:
+        punteggi = ((comic_id, score) for comic_id, score in profilo.punteggi_collaborativi.items()
+                    if comic_id not in profilo.fumetti_letti)
+        migliori = [comic_id for comic_id, _ in heapq.nlargest(limite, punteggi, key=lambda x: x[1])]
+        volumi = catalogo.volumi_per_id(self.conn, migliori)
+
+        # I fumetti registrati senza metadati (solo ID e rating) vengono completati per le prossime volte
+        mancanti = [comic_id for comic_id in migliori if comic_id not in volumi]
+        if mancanti and self.arricchimento is not None:
+            self.arricchimento.completa_metadati(mancanti)
+        return [volumi[comic_id] for comic_id in migliori if comic_id in volumi]
+
+
+class CandidatiEditoriPreferiti(GeneratoreCandidati):
+    """Fumetti del catalogo locale pubblicati dagli editori preferiti, dai più letti."""
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def genera(self, profilo: ProfiloUtente, limite: int) -> List[Volume]:
+        editori = [editore for editore, _ in profilo.editori_preferiti]
+        return catalogo.volumi_per_editori(self.conn, editori, profilo.utente_id, limite)
+
+
+class CandidatiCacheRicerche(GeneratoreCandidati):
+    """
+    Risultati già in cache della ricerca per editori preferiti che in passato veniva eseguita
+    su ComicVine ad ogni raccomandazione. Se la ricerca non è in cache viene avviata in background.
+    """
+    def __init__(self, cache: CacheRicerche, max_results: int, arricchimento: Optional[ArricchimentoComicVine] = None):
+        self.cache = cache
+        self.max_results = max_results
+        self.arricchimento = arricchimento
+
+    def genera(self, profilo: ProfiloUtente, limite: int) -> List[Volume]:
+        query = ' OR '.join(editore for editore, _ in profilo.editori_preferiti) or 'comics'
+        volumi = self.cache.leggi(CacheRicerche.chiave(query, self.max_results))
+        if volumi is None:
+            if self.arricchimento is not None:
+                self.arricchimento.cerca(query)
+            return []
+        # Copie: i volumi in cache sono condivisi con le ricerche e lo score viene assegnato sul volume
+        return [replace(volume) for volume in volumi if volume.id not in profilo.fumetti_letti][:limite]
@@ -0,0 +1,177 @@
+import re
+import sqlite3
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from comicvine import Volume
+
+# Valori segnaposto salvati da aggiungi_fumetto_letto, restituiti come campi mancanti
+SEGNAPOSTO = {'', 'Autore non specificato', 'Editore non specificato', 'Non specificato', 'N/D',
+              '/static/comic-placeholder.png'}
+
+# Quota minima di trigrammi della query presenti nel titolo perché sia considerato simile
+SOGLIA_SIMILARITA = 0.5
+
+# Candidati letti dall'indice a trigrammi prima di calcolare la similarità
+CANDIDATI_APPROSSIMATI = 200
+
+
+def _termini(query: str) -> List[str]:
+    return re.findall(r'\w+', query.lower())
+
+
+def _trigrammi(termini: List[str], margini: bool = False) -> set:
+    # Con i margini (come pg_trgm) anche inizio e fine delle parole contano come trigrammi,
+    # così un errore di battitura a metà parola pesa meno
+    if margini:
+        termini = [f'  {termine} ' for termine in termini]
+    return {termine[i:i + 3] for termine in termini for i in range(len(termine) - 2)}
+
+
+def _valore(valore) -> Optional[str]:
+    if valore is None or str(valore).strip() in SEGNAPOSTO:
+        return None
+    return str(valore)
+
+
+def _volume(riga) -> Volume:
+    id, titolo, autore, copertina, editore, anno = riga
+    return Volume(id=id, titolo=titolo, autore=_valore(autore), copertina=_valore(copertina),
+                  editore=_valore(editore), anno=_valore(anno))
+
+
+def cerca(conn: sqlite3.Connection, query: str, limite: int) -> Tuple[List[Volume], List[Volume]]:
+    """
+    Cerca nel catalogo locale dei fumetti.
+
+    Args:
+        conn: Connessione al database SQLite
+        query: Testo cercato dall'utente
+        limite: Numero massimo di risultati
+    Returns:
+        Tupla (fumetti che contengono tutte le parole cercate, anche come prefisso, ordinati per
+        pertinenza; fumetti con titolo simile alla query, ad esempio con errori di battitura)
+    """
+    termini = _termini(query)
+    if not termini:
+        return [], []
+
+    # Ogni parola cercata è un prefisso: "bat" trova "Batman"; il titolo pesa più di autore ed editore
+    righe = conn.execute('''
+        SELECT f.id, f.titolo, f.autore, f.url_copertina, f.editore, f.anno
+        FROM catalogo_fts c
+        JOIN fumetti f ON f.id = c.comic_id
+        WHERE catalogo_fts MATCH ?
+        ORDER BY bm25(catalogo_fts, 0, 10.0, 3.0, 1.0)
+        LIMIT ?
+    ''', (' '.join(f'"{termine}"*' for termine in termini), limite)).fetchall()
+    corrispondenze = [_volume(riga) for riga in righe]
+    if len(corrispondenze) >= limite:
+        return corrispondenze, []
+
+    return corrispondenze, _cerca_simili(conn, termini, {v.id for v in corrispondenze},
+                                         limite - len(corrispondenze))
+
+
+def _cerca_simili(conn: sqlite3.Connection, termini: List[str], esclusi: set, limite: int) -> List[Volume]:
+    # L'indice a trigrammi propone i titoli che condividono almeno un trigramma con la query;
+    # restano quelli che ne contengono una quota sufficiente, dal più simile
+    trigrammi_indice = _trigrammi(termini)
+    if not trigrammi_indice:
+        return []
+    trigrammi_query = _trigrammi(termini, margini=True)
+
+    candidati = conn.execute('''
+        SELECT comic_id, titolo FROM catalogo_trigrammi
+        WHERE catalogo_trigrammi MATCH ?
+        ORDER BY rank
+        LIMIT ?
+    ''', (' OR '.join(f'"{t}"' for t in sorted(trigrammi_indice)), CANDIDATI_APPROSSIMATI)).fetchall()
+
+    punteggi = {}
+    for comic_id, titolo in candidati:
+        if comic_id in esclusi:
+            continue
+        comuni = len(trigrammi_query & _trigrammi(_termini(titolo), margini=True))
+        similarita = comuni / len(trigrammi_query)
+        if similarita >= SOGLIA_SIMILARITA:
+            punteggi[comic_id] = similarita
+
+    migliori = sorted(punteggi, key=punteggi.get, reverse=True)[:limite]
+    per_id = volumi_per_id(conn, migliori)
+    return [per_id[comic_id] for comic_id in migliori if comic_id in per_id]
+
+
+def volumi_per_id(conn: sqlite3.Connection, comic_ids: List[str]) -> Dict[str, Volume]:
+    """
+    Legge dal catalogo i dati dei fumetti indicati.
+
+    Returns:
+        Dizionario con comic_id come chiave; i fumetti assenti dal catalogo non compaiono
+    """
+    if not comic_ids:
+        return {}
+    righe = conn.execute(f'''
+        SELECT id, titolo, autore, url_copertina, editore, anno FROM fumetti
+        WHERE id IN ({','.join('?' * len(comic_ids))})
+    ''', comic_ids).fetchall()
+    return {riga[0]: _volume(riga) for riga in righe}
+
+
+def volumi_per_editori(conn: sqlite3.Connection, editori: List[str], utente_id: int, limite: int) -> List[Volume]:
+    """
+    Legge dal catalogo i fumetti pubblicati dagli editori indicati che l'utente non ha ancora letto.
+
+    Args:
+        conn: Connessione al database SQLite
+        editori: Nomi degli editori
+        utente_id: ID dell'utente i cui fumetti letti vanno esclusi
+        limite: Numero massimo di fumetti
+    Returns:
+        Volumi ordinati dal più letto (a parità di letture per ID)
+    """
+    if not editori:
+        return []
+    righe = conn.execute(f'''
+        SELECT f.id, f.titolo, f.autore, f.url_copertina, f.editore, f.anno
+        FROM fumetti f
+        WHERE f.editore IN ({','.join('?' * len(editori))})
+          AND NOT EXISTS (SELECT 1 FROM fumetti_letti fl WHERE fl.utente_id = ? AND fl.comic_id = f.id)
+        ORDER BY (SELECT COUNT(*) FROM fumetti_letti fl WHERE fl.comic_id = f.id) DESC, f.id
+        LIMIT ?
+    ''', (*editori, utente_id, limite)).fetchall()
+    return [_volume(riga) for riga in righe]
+
+
+def aggiungi_volumi(conn: sqlite3.Connection, volumi: Iterable[Volume]):
+    """
+    Aggiunge al catalogo i volumi ricevuti da ComicVine, o ne aggiorna i dati, senza eseguire
+    il commit. I campi mancanti nella risposta non cancellano quelli già salvati.
+
+    Args:
+        conn: Connessione al database SQLite
+        volumi: Volumi con l'ID di ComicVine
+    """
+    conn.executemany('''
+        INSERT INTO fumetti (id, titolo, autore, url_copertina, editore, anno)
+        VALUES (?, ?, ?, ?, ?, ?)
+        ON CONFLICT (id) DO UPDATE SET
+            titolo = excluded.titolo,
+            autore = COALESCE(excluded.autore, autore),
+            url_copertina = COALESCE(excluded.url_copertina, url_copertina),
+            editore = COALESCE(excluded.editore, editore),
+            anno = COALESCE(excluded.anno, anno)
+    ''', [(v.id, v.titolo, v.autore, v.copertina, v.editore, v.anno) for v in volumi if v.id])
+
+
+def unisci(corrispondenze: List[Volume], remoti: List[Volume], simili: List[Volume], limite: int) -> List[Volume]:
+    """
+    Unisce i risultati locali e quelli di ComicVine senza duplicati: prima le corrispondenze
+    del catalogo, poi i risultati di ComicVine e infine i titoli simili.
+    """
+    risultati = []
+    visti = set()
+    for volume in (*corrispondenze, *remoti, *simili):
+        if volume.id not in visti:
+            visti.add(volume.id)
+            risultati.append(volume)
+    return risultati[:limite]
@@ -0,0 +1,236 @@
+import asyncio
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, Optional
+
+
+class _Volo:
+    """Calcolo in corso per una chiave: chi arriva dopo attende l'evento e ne riceve il risultato."""
+    __slots__ = ('evento', 'risultato', 'errore')
+
+    def __init__(self):
+        self.evento = threading.Event()
+        self.risultato = None
+        self.errore = None
+
+
+class LeaseSQLite:
+    """
+    Lock per chiave condiviso tra processi, basato su una tabella SQLite: il processo che riesce
+    a inserire la riga della chiave esegue il calcolo, gli altri attendono che la riga sparisca.
+    Un lease più vecchio di durata_max_secondi (ad esempio di un worker terminato) viene ignorato.
+    """
+    def __init__(self, percorso_db: str, durata_max_secondi: float = 60, intervallo_attesa: float = 0.05):
+        """
+        Inizializza il lock.
+
+        Args:
+            percorso_db: Database SQLite condiviso dai processi
+            durata_max_secondi: Durata oltre la quale un lease viene considerato abbandonato
+            intervallo_attesa: Intervallo tra due controlli mentre si attende il lease
+        """
+        self.percorso_db = percorso_db
+        self.durata_max_secondi = durata_max_secondi
+        self.intervallo_attesa = intervallo_attesa
+        self._locale = threading.local()
+        conn = self._connessione()
+        conn.execute('''
+            CREATE TABLE IF NOT EXISTS lease (
+                chiave TEXT PRIMARY KEY,
+                proprietario TEXT NOT NULL,
+                scadenza REAL NOT NULL
+            )
+        ''')
+
+    @property
+    def proprietario(self) -> str:
+        # Nello stesso processo una chiave ha un solo calcolo alla volta (vedi SingoloVolo),
+        # quindi basta il processo a identificare il proprietario del lease
+        return str(os.getpid())
+
+    def _connessione(self) -> sqlite3.Connection:
+        conn = getattr(self._locale, 'conn', None)
+        if conn is None:
+            # Autocommit: ogni istruzione è una transazione a sé e il lock del database dura pochissimo
+            conn = sqlite3.connect(self.percorso_db, timeout=self.durata_max_secondi, isolation_level=None)
+            self._locale.conn = conn
+        return conn
+
+    def acquisisci(self, chiave: str) -> bool:
+        """
+        Attende finché il lease della chiave non è libero e lo acquisisce.
+
+        Returns:
+            True se è stato necessario attendere un altro processo
+        """
+        conn = self._connessione()
+        atteso = False
+        while True:
+            adesso = time.time()
+            conn.execute('DELETE FROM lease WHERE chiave = ? AND scadenza < ?', (chiave, adesso))
+            try:
+                conn.execute('INSERT INTO lease (chiave, proprietario, scadenza) VALUES (?, ?, ?)',
+                             (chiave, self.proprietario, adesso + self.durata_max_secondi))
+                return atteso
+            except sqlite3.IntegrityError:
+                atteso = True
+                time.sleep(self.intervallo_attesa)
+
+    def rilascia(self, chiave: str):
+        self._connessione().execute('DELETE FROM lease WHERE chiave = ? AND proprietario = ?',
+                                    (chiave, self.proprietario))
+
+
+class SingoloVolo:
+    """
+    Coalescenza delle richieste (single-flight): le richieste concorrenti con la stessa chiave
+    condividono un unico calcolo, eseguito dalla prima, e ne ricevono tutte il risultato.
+
+    Le richieste servite dai thread (esegui) e quelle servite dall'event loop (esegui_asincrono)
+    condividono gli stessi calcoli in corso: ogni calcolo asincrono registra anche un _Volo, che i
+    thread attendono, e una coroutine che trova un calcolo di un thread ne attende l'evento fuori
+    dall'event loop.
+
+    Con un LeaseSQLite la coalescenza vale anche tra processi: prima di calcolare si acquisisce
+    il lease della chiave e, se un altro processo lo stava tenendo, si ricontrolla se il suo
+    risultato è già stato salvato (ad esempio nella cache su disco) prima di ricalcolarlo.
+    """
+    def __init__(self, lease: Optional[LeaseSQLite] = None):
+        self.lease = lease
+        self._lock = threading.Lock()
+        self._in_volo: Dict[str, _Volo] = {}
+        self._in_volo_asincroni: Dict[str, 'asyncio.Future'] = {}
+        self._contatori = {'calcoli': 0, 'condivise': 0, 'attese_processi': 0, 'riusi_processi': 0}
+
+    def esegui(self, chiave: str, calcola: Callable[[], Any],
+               ricontrolla: Optional[Callable[[], Any]] = None) -> Any:
+        """
+        Esegue calcola, a meno che un calcolo con la stessa chiave non sia già in corso:
+        in quel caso ne attende e restituisce il risultato (o ne rilancia l'eccezione).
+
+        Args:
+            chiave: Chiave che identifica il calcolo (ad esempio la query normalizzata)
+            calcola: Funzione che esegue il calcolo
+            ricontrolla: Funzione che legge il risultato salvato da un altro processo, o None se manca
+        Returns:
+            Il risultato del calcolo
+        """
+        with self._lock:
+            volo = self._in_volo.get(chiave)
+            primo = volo is None
+            if primo:
+                volo = self._in_volo[chiave] = _Volo()
+            else:
+                self._contatori['condivise'] += 1
+
+        if not primo:
+            volo.evento.wait()
+            if volo.errore is not None:
+                raise volo.errore
+            return volo.risultato
+
+        try:
+            volo.risultato = self._calcola_tra_processi(chiave, calcola, ricontrolla)
+            return volo.risultato
+        except Exception as e:
+            volo.errore = e
+            raise
+        finally:
+            with self._lock:
+                del self._in_volo[chiave]
+            volo.evento.set()
+
+    async def esegui_asincrono(self, chiave: str, calcola: Callable[[], Awaitable[Any]],
+                               ricontrolla: Optional[Callable[[], Any]] = None) -> Any:
+        """
+        Versione di esegui per le coroutine dello stesso event loop; il lease tra processi,
+        ricontrolla e l'attesa di un calcolo eseguito da un thread avvengono fuori dall'event loop.
+        """
+        with self._lock:
+            futuro = self._in_volo_asincroni.get(chiave)
+            volo = self._in_volo.get(chiave)
+            primo = volo is None
+            if primo:
+                volo = self._in_volo[chiave] = _Volo()
+                futuro = self._in_volo_asincroni[chiave] = asyncio.get_running_loop().create_future()
+            else:
+                self._contatori['condivise'] += 1
+
+        if not primo:
+            if futuro is not None:
+                # shield: l'annullamento di una richiesta in attesa non annulla il calcolo condiviso
+                return await asyncio.shield(futuro)
+            # Calcolo in corso in un thread (richiesta servita da Flask)
+            await asyncio.to_thread(volo.evento.wait)
+            if volo.errore is not None:
+                raise volo.errore
+            return volo.risultato
+
+        try:
+            if self.lease is None:
+                self._conta('calcoli')
+                risultato = await calcola()
+            else:
+                atteso = await asyncio.to_thread(self.lease.acquisisci, chiave)
+                try:
+                    risultato = await asyncio.to_thread(self._riusa, atteso, ricontrolla)
+                    if risultato is None:
+                        self._conta('calcoli')
+                        risultato = await calcola()
+                finally:
+                    await asyncio.to_thread(self.lease.rilascia, chiave)
+            volo.risultato = risultato
+            futuro.set_result(risultato)
+            return risultato
+        except asyncio.CancelledError:
+            volo.errore = RuntimeError('Calcolo annullato')
+            futuro.cancel()
+            raise
+        except Exception as e:
+            volo.errore = e
+            futuro.set_exception(e)
+            # Evita l'avviso "exception was never retrieved" quando nessuno era in attesa
+            futuro.exception()
+            raise
+        finally:
+            with self._lock:
+                del self._in_volo_asincroni[chiave]
+                del self._in_volo[chiave]
+            volo.evento.set()
+
+    def statistiche(self) -> Dict[str, int]:
+        # Ogni calcolo in corso, anche asincrono, ha il suo _Volo
+        with self._lock:
+            return dict(self._contatori, in_corso=len(self._in_volo))
+
+    def _calcola_tra_processi(self, chiave: str, calcola: Callable[[], Any],
+                              ricontrolla: Optional[Callable[[], Any]]) -> Any:
+        if self.lease is None:
+            self._conta('calcoli')
+            return calcola()
+
+        atteso = self.lease.acquisisci(chiave)
+        try:
+            risultato = self._riusa(atteso, ricontrolla)
+            if risultato is None:
+                self._conta('calcoli')
+                risultato = calcola()
+            return risultato
+        finally:
+            self.lease.rilascia(chiave)
+
+    def _riusa(self, atteso: bool, ricontrolla: Optional[Callable[[], Any]]) -> Any:
+        # Se un altro processo aveva il lease, il suo risultato potrebbe essere già disponibile
+        if not atteso:
+            return None
+        self._conta('attese_processi')
+        risultato = ricontrolla() if ricontrolla is not None else None
+        if risultato is not None:
+            self._conta('riusi_processi')
+        return risultato
+
+    def _conta(self, contatore: str):
+        with self._lock:
+            self._contatori[contatore] += 1
@@ -0,0 +1,581 @@
+import asyncio
+import io
+import json
+import threading
+import time
+import xml.etree.ElementTree as ET
+from collections import deque
+from dataclasses import dataclass, asdict
+from typing import Any, Dict, List, Optional, Tuple
+
+import requests
+from requests.adapters import HTTPAdapter
+
+# orjson è facoltativo: se installato decodifica le risposte JSON molto più velocemente
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# httpx serve solo al client asincrono usato dalla modalità ASGI (asgi.py)
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+from config import Config
+
+BASE_URL = Config.COMICVINE_BASE_URL
+USER_AGENT = 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.101 Safari/537.36'
+
+# Codici HTTP per cui vale la pena ripetere la richiesta
+CODICI_RIPETIBILI = {429, 500, 502, 503, 504}
+
+# Campi dei volumi effettivamente usati dall'applicazione, richiesti con field_list
+CAMPI_VOLUME = 'id,name,deck,start_year,publisher,image,people'
+
+
+@dataclass(slots=True)
+class Volume:
+    """
+    Volume di ComicVine con i soli campi usati dall'applicazione. È lo stesso record
+    restituito da /search e da /raccomandazioni (dove è valorizzato anche lo score).
+    """
+    id: Optional[str]
+    titolo: str
+    descrizione: Optional[str] = None
+    anno: Optional[str] = None
+    editore: Optional[str] = None
+    copertina: Optional[str] = None
+    autore: Optional[str] = None
+    score: Optional[float] = None
+
+    def a_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+class ErroreComicVine(Exception):
+    """Sollevata quando ComicVine non restituisce una risposta valida."""
+    pass
+
+
+class LimitatoreRichieste:
+    """
+    Token bucket: concede al massimo `capacita` richieste di fila e poi una
+    richiesta ogni 1 / ricarica_al_secondo secondi.
+    """
+    def __init__(self, capacita: float, ricarica_al_secondo: float):
+        self.capacita = capacita
+        self.ricarica_al_secondo = ricarica_al_secondo
+        self._gettoni = capacita
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquisisci(self, attesa_max: float) -> bool:
+        """
+        Consuma un gettone, attendendo al massimo attesa_max secondi.
+
+        Returns:
+            True se il gettone è stato ottenuto, False se l'attesa sarebbe troppo lunga
+        """
+        attesa = self.prenota(attesa_max)
+        if attesa is None:
+            return False
+        if attesa > 0:
+            time.sleep(attesa)
+        return True
+
+    async def acquisisci_asincrono(self, attesa_max: float) -> bool:
+        """Come acquisisci, ma attende senza bloccare l'event loop."""
+        attesa = self.prenota(attesa_max)
+        if attesa is None:
+            return False
+        if attesa > 0:
+            await asyncio.sleep(attesa)
+        return True
+
+    def prenota(self, attesa_max: float) -> Optional[float]:
+        """
+        Prenota un gettone senza attendere.
+
+        Returns:
+            I secondi da attendere prima di usare il gettone, oppure None se l'attesa
+            supererebbe attesa_max (in questo caso non viene prenotato nulla)
+        """
+        with self._lock:
+            adesso = time.monotonic()
+            self._gettoni = min(self.capacita, self._gettoni + (adesso - self._ultimo) * self.ricarica_al_secondo)
+            self._ultimo = adesso
+            attesa = (1 - self._gettoni) / self.ricarica_al_secondo if self._gettoni < 1 else 0
+            if attesa > attesa_max:
+                return None
+            # Il gettone viene prenotato subito, così le richieste concorrenti si mettono in coda
+            self._gettoni -= 1
+        return attesa
+
+
+class ClientComicVine:
+    """
+    Client HTTP condiviso per l'API di ComicVine: riusa le connessioni keep-alive di
+    una requests.Session, ripete le richieste fallite con backoff esponenziale, rispetta
+    la quota di richieste di ComicVine e registra le latenze delle chiamate.
+    """
+    def __init__(self, api_key: Optional[str], dimensione_pool: int = 10, timeout_connessione: float = 5,
+                 timeout_lettura: float = 10, tentativi_max: int = 3, backoff_secondi: float = 0.5,
+                 richieste_per_ora: int = 200, attesa_max_secondi: float = 2, formato: str = 'json'):
+        """
+        Inizializza il client.
+
+        Args:
+            api_key: Chiave dell'API di ComicVine
+            dimensione_pool: Numero massimo di connessioni aperte verso ComicVine
+            timeout_connessione: Timeout di connessione in secondi
+            timeout_lettura: Timeout di lettura della risposta in secondi
+            tentativi_max: Numero di tentativi per le risposte 429/5xx e gli errori di rete
+            backoff_secondi: Attesa prima del secondo tentativo, raddoppiata ad ogni tentativo
+            richieste_per_ora: Quota di richieste per risorsa concessa da ComicVine
+            attesa_max_secondi: Attesa massima per un gettone prima di rinunciare alla richiesta
+            formato: Formato delle risposte di ComicVine, 'json' oppure 'xml'
+        """
+        self.api_key = api_key
+        self.timeout = (timeout_connessione, timeout_lettura)
+        self.tentativi_max = max(1, tentativi_max)
+        self.backoff_secondi = backoff_secondi
+        self.richieste_per_ora = richieste_per_ora
+        self.attesa_max_secondi = attesa_max_secondi
+        self.formato = formato
+
+        self.sessione = requests.Session()
+        self.sessione.headers['User-Agent'] = USER_AGENT
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=dimensione_pool)
+        self.sessione.mount('https://', adapter)
+        self.sessione.mount('http://', adapter)
+
+        # ComicVine applica la quota separatamente per ogni risorsa
+        self._limitatori: Dict[str, LimitatoreRichieste] = {}
+        self._lock = threading.Lock()
+        self._latenze = deque(maxlen=1000)
+        self._contatori = {'chiamate': 0, 'tentativi': 0, 'errori': 0, 'limitate': 0, 'byte_ricevuti': 0}
+
+    def richiesta(self, risorsa: str, params: Dict[str, Any], stream: bool = False) -> requests.Response:
+        """
+        Esegue una GET su una risorsa dell'API (ad esempio 'search' o 'volumes').
+
+        Args:
+            risorsa: Nome della risorsa ComicVine
+            params: Parametri della query, esclusa la chiave API
+            stream: Se True il corpo non viene scaricato subito e va letto da response.raw
+        Returns:
+            La risposta con codice 200
+        Raises:
+            ErroreComicVine: se la quota è esaurita o tutti i tentativi falliscono
+        """
+        url = f"{BASE_URL}{risorsa}/"
+        params = dict(params, api_key=self.api_key)
+        inizio = time.perf_counter()
+        errore = None
+        try:
+            for tentativo in range(self.tentativi_max):
+                if tentativo:
+                    time.sleep(self._attesa_prima_di_riprovare(tentativo, errore))
+                # Anche i tentativi successivi consumano la quota
+                if not self._limitatore(risorsa).acquisisci(self.attesa_max_secondi):
+                    self._conta('limitate')
+                    raise ErroreComicVine(f"Quota di richieste ComicVine esaurita per '{risorsa}'")
+                self._conta('tentativi')
+                try:
+                    response = self.sessione.get(url, params=params, timeout=self.timeout, stream=stream)
+                except requests.RequestException as e:
+                    errore = e
+                    continue
+                if response.status_code == 200:
+                    # Le risposte in streaming vengono contate quando sono state lette
+                    if not stream:
+                        self._registra_byte(response.raw.tell())
+                    return response
+                errore = response
+                response.close()
+                if response.status_code not in CODICI_RIPETIBILI:
+                    break
+
+            self._conta('errori')
+            if hasattr(errore, 'status_code'):
+                raise ErroreComicVine(f"Errore nella richiesta API: {errore.status_code}")
+            raise ErroreComicVine(f"Errore di rete verso ComicVine: {errore}")
+        finally:
+            self._registra_chiamata(inizio)
+
+    def cerca_volumi(self, query: str, limit: int, offset: int = 0) -> Tuple[Optional[int], List[Volume]]:
+        """
+        Cerca volumi tramite la risorsa search nel formato scelto dal client
+        (JSON, oppure XML letto in streaming).
+
+        Args:
+            query: Testo da cercare
+            limit: Numero di risultati per pagina
+            offset: Posizione del primo risultato
+        Returns:
+            Tupla (numero totale di risultati se indicato da ComicVine, volumi con titolo della pagina)
+        Raises:
+            ErroreComicVine: se la richiesta fallisce o la risposta non è valida
+        """
+        params = {
+            'query': query,
+            'resources': 'volume',
+            'field_list': CAMPI_VOLUME,
+            'limit': limit,
+            'offset': offset
+        }
+        return self._leggi_volumi('search', params)
+
+    def elenca_volumi(self, filtro: str, limit: int = 100, offset: int = 0) -> Tuple[Optional[int], List[Volume]]:
+        """
+        Elenca i volumi tramite la risorsa volumes, in ordine di ID così che la paginazione
+        resti stabile anche se nel frattempo vengono aggiunti nuovi volumi.
+
+        Args:
+            filtro: Filtro di ComicVine, ad esempio 'date_added:2020-01-01|2020-12-31' o 'id:1|2|3'
+            limit: Numero di risultati per pagina (massimo 100)
+            offset: Posizione del primo risultato
+        Returns:
+            Tupla (numero totale di risultati se indicato da ComicVine, volumi con titolo della pagina)
+        Raises:
+            ErroreComicVine: se la richiesta fallisce o la risposta non è valida
+        """
+        params = {
+            'filter': filtro,
+            'sort': 'id:asc',
+            'field_list': CAMPI_VOLUME,
+            'limit': limit,
+            'offset': offset
+        }
+        return self._leggi_volumi('volumes', params)
+
+    def volumi_editore(self, editore_id: int) -> List[str]:
+        """
+        Restituisce gli ID di tutti i volumi di un editore (risorsa publisher).
+
+        Raises:
+            ErroreComicVine: se la richiesta fallisce o la risposta non è valida
+        """
+        response = self.richiesta(f'publisher/4010-{editore_id}', {'field_list': 'volumes', 'format': 'json'})
+        try:
+            dati = orjson.loads(response.content) if orjson is not None else json.loads(response.content)
+            volumi = (dati.get('results') or {}).get('volumes') or []
+        except (ValueError, AttributeError) as e:
+            raise ErroreComicVine(f"Errore di parsing JSON: {e}")
+        return [str(volume['id']) for volume in volumi if volume.get('id') is not None]
+
+    def _leggi_volumi(self, risorsa: str, params: Dict[str, Any]) -> Tuple[Optional[int], List[Volume]]:
+        # Interroga una risorsa che restituisce volumi nel formato scelto dal client
+        params = dict(params, format=self.formato)
+        if self.formato == 'json':
+            response = self.richiesta(risorsa, params)
+            try:
+                return leggi_volumi_json(response.content)
+            except ValueError as e:
+                raise ErroreComicVine(f"Errore di parsing JSON: {e}")
+
+        with self.richiesta(risorsa, params, stream=True) as response:
+            # Decomprime il corpo (gzip) mentre viene letto dal socket
+            response.raw.decode_content = True
+            try:
+                return leggi_volumi_xml(response.raw)
+            except ET.ParseError as e:
+                raise ErroreComicVine(f"Errore di parsing XML: {e}")
+            finally:
+                self._registra_byte(response.raw.tell())
+
+    def statistiche(self) -> Dict[str, float]:
+        """
+        Restituisce i contatori delle chiamate, i byte ricevuti (come trasmessi, quindi compressi
+        se la risposta è gzip) e i percentili di latenza (in ms) calcolati sulle ultime 1000 chiamate.
+        """
+        with self._lock:
+            latenze = sorted(self._latenze)
+            statistiche = dict(self._contatori)
+        for percentile in (50, 95, 99):
+            indice = min(len(latenze) - 1, len(latenze) * percentile // 100)
+            statistiche[f'latenza_p{percentile}_ms'] = latenze[indice] * 1000 if latenze else 0
+        return statistiche
+
+    def _registra_chiamata(self, inizio: float):
+        with self._lock:
+            self._contatori['chiamate'] += 1
+            self._latenze.append(time.perf_counter() - inizio)
+
+    def _limitatore(self, risorsa: str) -> LimitatoreRichieste:
+        # Le risorse di dettaglio (es. 'publisher/4010-31') condividono la quota del loro tipo
+        risorsa = risorsa.split('/')[0]
+        with self._lock:
+            if risorsa not in self._limitatori:
+                self._limitatori[risorsa] = LimitatoreRichieste(self.richieste_per_ora, self.richieste_per_ora / 3600)
+            return self._limitatori[risorsa]
+
+    def _attesa_prima_di_riprovare(self, tentativo: int, errore) -> float:
+        # Se ComicVine indica quanto attendere (header Retry-After) si rispetta l'indicazione;
+        # vale sia per le risposte di requests sia per quelle di httpx
+        if hasattr(errore, 'status_code'):
+            retry_after = errore.headers.get('Retry-After', '')
+            if retry_after.isdigit():
+                return min(float(retry_after), self.backoff_secondi * 2 ** self.tentativi_max)
+        return self.backoff_secondi * 2 ** (tentativo - 1)
+
+    def _conta(self, contatore: str):
+        with self._lock:
+            self._contatori[contatore] += 1
+
+    def _registra_byte(self, byte: int):
+        with self._lock:
+            self._contatori['byte_ricevuti'] += byte
+
+
+class ClientComicVineAsincrono:
+    """
+    Versione asincrona del client, usata dalle route servite in modalità ASGI: le richieste
+    passano da un httpx.AsyncClient e le attese (quota, backoff) non bloccano l'event loop.
+    Quota, contatori e latenze sono quelli del client sincrono da cui viene creato,
+    così le due modalità rispettano insieme lo stesso limite di ComicVine.
+    """
+    def __init__(self, client: ClientComicVine, dimensione_pool: int = 10):
+        """
+        Inizializza il client.
+
+        Args:
+            client: Client sincrono di cui condividere configurazione, quota e statistiche
+            dimensione_pool: Numero massimo di connessioni aperte verso ComicVine
+        """
+        if httpx is None:
+            raise RuntimeError("Il client asincrono di ComicVine richiede il pacchetto httpx")
+        self.client = client
+        timeout_connessione, timeout_lettura = client.timeout
+        self.sessione = httpx.AsyncClient(
+            headers={'User-Agent': USER_AGENT},
+            timeout=httpx.Timeout(timeout_lettura, connect=timeout_connessione),
+            limits=httpx.Limits(max_connections=dimensione_pool, max_keepalive_connections=dimensione_pool)
+        )
+
+    async def richiesta(self, risorsa: str, params: Dict[str, Any]) -> 'httpx.Response':
+        """
+        Esegue una GET su una risorsa dell'API, con gli stessi tentativi e la stessa
+        quota di ClientComicVine.richiesta.
+
+        Raises:
+            ErroreComicVine: se la quota è esaurita o tutti i tentativi falliscono
+        """
+        client = self.client
+        url = f"{BASE_URL}{risorsa}/"
+        params = dict(params, api_key=client.api_key)
+        inizio = time.perf_counter()
+        errore = None
+        try:
+            for tentativo in range(client.tentativi_max):
+                if tentativo:
+                    await asyncio.sleep(client._attesa_prima_di_riprovare(tentativo, errore))
+                if not await client._limitatore(risorsa).acquisisci_asincrono(client.attesa_max_secondi):
+                    client._conta('limitate')
+                    raise ErroreComicVine(f"Quota di richieste ComicVine esaurita per '{risorsa}'")
+                client._conta('tentativi')
+                try:
+                    response = await self.sessione.get(url, params=params)
+                except httpx.HTTPError as e:
+                    errore = e
+                    continue
+                if response.status_code == 200:
+                    client._registra_byte(response.num_bytes_downloaded)
+                    return response
+                errore = response
+                if response.status_code not in CODICI_RIPETIBILI:
+                    break
+
+            client._conta('errori')
+            if hasattr(errore, 'status_code'):
+                raise ErroreComicVine(f"Errore nella richiesta API: {errore.status_code}")
+            raise ErroreComicVine(f"Errore di rete verso ComicVine: {errore}")
+        finally:
+            client._registra_chiamata(inizio)
+
+    async def cerca_volumi(self, query: str, limit: int, offset: int = 0) -> Tuple[Optional[int], List[Volume]]:
+        """
+        Come ClientComicVine.cerca_volumi. La risposta XML viene letta dalla memoria,
+        perché il parser a eventi non può attendere il socket senza bloccare l'event loop.
+        """
+        params = {
+            'query': query,
+            'resources': 'volume',
+            'field_list': CAMPI_VOLUME,
+            'format': self.client.formato,
+            'limit': limit,
+            'offset': offset
+        }
+        response = await self.richiesta('search', params)
+        if self.client.formato == 'json':
+            try:
+                return leggi_volumi_json(response.content)
+            except ValueError as e:
+                raise ErroreComicVine(f"Errore di parsing JSON: {e}")
+
+        try:
+            return leggi_volumi_xml(io.BytesIO(response.content))
+        except ET.ParseError as e:
+            raise ErroreComicVine(f"Errore di parsing XML: {e}")
+
+    async def chiudi(self):
+        await self.sessione.aclose()
+
+
+def crea_volume(id: Optional[str], nome: Optional[str], descrizione: Optional[str], anno: Optional[str],
+                editore: Optional[str], copertina: Optional[str],
+                sceneggiatori: List[str], disegnatori: List[str]) -> Optional[Volume]:
+    """
+    Crea un Volume dai campi di ComicVine; l'autore è l'elenco degli sceneggiatori
+    o, in loro assenza, dei disegnatori.
+
+    Returns:
+        Il volume, oppure None se il titolo manca o non è valido
+    """
+    nome = nome.strip() if nome else None
+    if not nome or nome.lower() == 'null':
+        return None
+    autori = sceneggiatori or disegnatori
+    return Volume(id=str(id) if id is not None else None, titolo=nome, descrizione=descrizione,
+                  anno=str(anno) if anno is not None else None, editore=editore, copertina=copertina,
+                  autore=', '.join(autori) if autori else None)
+
+
+def leggi_volumi_json(contenuto: bytes) -> Tuple[Optional[int], List[Volume]]:
+    """
+    Decodifica una risposta JSON di ComicVine.
+
+    Args:
+        contenuto: Corpo della risposta
+    Returns:
+        Tupla (number_of_total_results se presente, volumi con titolo valido)
+    Raises:
+        ValueError: se il JSON non è valido
+    """
+    dati = orjson.loads(contenuto) if orjson is not None else json.loads(contenuto)
+    totale = dati.get('number_of_total_results')
+    volumi = []
+    for risultato in dati.get('results') or []:
+        sceneggiatori, disegnatori = [], []
+        for persona in risultato.get('people') or []:
+            autori = {'writer': sceneggiatori, 'artist': disegnatori}.get(persona.get('role'))
+            if autori is not None and persona.get('name') and persona['name'] not in autori:
+                autori.append(persona['name'])
+        volume = crea_volume(risultato.get('id'), risultato.get('name'), risultato.get('deck'),
+                             risultato.get('start_year'), (risultato.get('publisher') or {}).get('name'),
+                             (risultato.get('image') or {}).get('small_url'), sceneggiatori, disegnatori)
+        if volume is not None:
+            volumi.append(volume)
+    return (totale if isinstance(totale, int) else None), volumi
+
+
+def leggi_volumi_xml(sorgente) -> Tuple[Optional[int], List[Volume]]:
+    """
+    Legge in streaming una risposta XML di ComicVine estraendo solo i campi dei volumi
+    usati dall'applicazione. Ogni elemento <volume> viene liberato appena letto,
+    per cui la memoria occupata non dipende dalla dimensione della risposta.
+
+    Args:
+        sorgente: File o flusso di byte contenente l'XML
+    Returns:
+        Tupla (number_of_total_results se presente, volumi con titolo valido)
+    Raises:
+        ET.ParseError: se l'XML non è valido
+    """
+    totale = None
+    volumi = []
+    percorso = []
+    campi = None
+    inizio_volume = 0
+    ruolo = None
+
+    for evento, elem in ET.iterparse(sorgente, events=('start', 'end')):
+        if evento == 'start':
+            percorso.append(elem.tag)
+            if elem.tag == 'volume' and campi is None:
+                campi = {'id': None, 'name': None, 'deck': None, 'start_year': None,
+                         'publisher': None, 'image': None, 'writers': [], 'artists': []}
+                inizio_volume = len(percorso)
+            elif elem.tag == 'person' and campi is not None:
+                ruolo = elem.get('role')
+            continue
+
+        # Percorso dell'elemento all'interno del volume corrente ([] per il volume stesso)
+        relativo = percorso[inizio_volume:]
+        percorso.pop()
+        if campi is None:
+            if elem.tag == 'number_of_total_results' and elem.text and elem.text.strip().isdigit():
+                totale = int(elem.text)
+            continue
+
+        testo = elem.text.strip() if elem.text and elem.text.strip() else None
+        if not relativo:
+            volume = crea_volume(campi['id'], campi['name'], campi['deck'], campi['start_year'],
+                                 campi['publisher'], campi['image'], campi['writers'], campi['artists'])
+            if volume is not None:
+                volumi.append(volume)
+            campi = None
+            elem.clear()
+        elif len(relativo) == 1 and elem.tag in ('id', 'name', 'deck', 'start_year'):
+            campi[elem.tag] = testo
+        elif relativo == ['publisher', 'name']:
+            campi['publisher'] = testo
+        elif relativo == ['image', 'small_url']:
+            campi['image'] = testo
+        elif relativo[-2:] == ['person', 'name'] and testo:
+            autori = {'writer': campi['writers'], 'artist': campi['artists']}.get(ruolo)
+            if autori is not None and testo not in autori:
+                autori.append(testo)
+        elif elem.tag == 'person':
+            ruolo = None
+
+    return totale, volumi
+
+
+_client: Optional[ClientComicVine] = None
+_lock_client = threading.Lock()
+
+
+def ottieni_client() -> ClientComicVine:
+    """
+    Restituisce il client condiviso dal processo, creandolo dalla configurazione al primo utilizzo.
+    """
+    global _client
+    with _lock_client:
+        if _client is None:
+            _client = ClientComicVine(
+                Config.COMICVINE_API_KEY,
+                dimensione_pool=Config.COMICVINE_POOL_SIZE,
+                timeout_connessione=Config.COMICVINE_CONNECT_TIMEOUT,
+                timeout_lettura=Config.COMICVINE_READ_TIMEOUT,
+                tentativi_max=Config.COMICVINE_MAX_RETRIES,
+                backoff_secondi=Config.COMICVINE_BACKOFF_SECONDS,
+                richieste_per_ora=Config.COMICVINE_REQUESTS_PER_HOUR,
+                attesa_max_secondi=Config.COMICVINE_RATE_LIMIT_WAIT_SECONDS,
+                formato=Config.COMICVINE_FORMAT
+            )
+        return _client
+
+
+_client_asincrono: Optional[ClientComicVineAsincrono] = None
+
+
+def ottieni_client_asincrono() -> ClientComicVineAsincrono:
+    """
+    Restituisce il client asincrono condiviso. Le sue connessioni appartengono all'event loop
+    in cui viene usato per la prima volta, quindi va usato sempre dallo stesso loop.
+    """
+    global _client_asincrono
+    if _client_asincrono is None:
+        _client_asincrono = ClientComicVineAsincrono(ottieni_client(), dimensione_pool=Config.COMICVINE_POOL_SIZE)
+    return _client_asincrono
+
+
+async def chiudi_client_asincrono():
+    """Chiude le connessioni del client asincrono condiviso, se è stato creato."""
+    global _client_asincrono
+    if _client_asincrono is not None:
+        await _client_asincrono.chiudi()
+        _client_asincrono = None
@@ -11,7 +11,90 @@ class Config:
     
     # Configurazione Database
     DATABASE_PATH = os.getenv('DATABASE_PATH', 'comicsnap.db')
+    DB_BUSY_TIMEOUT_SECONDS = float(os.getenv('DB_BUSY_TIMEOUT_SECONDS', 5))
+    DB_MMAP_SIZE = int(os.getenv('DB_MMAP_SIZE', 64 * 1024 * 1024))
+    DB_CACHE_SIZE_KB = int(os.getenv('DB_CACHE_SIZE_KB', 16 * 1024))
+    DB_CACHED_STATEMENTS = int(os.getenv('DB_CACHED_STATEMENTS', 256))
+    # Group commit: le scritture singole di /fumetti-letti e /aggiungi_preferito vengono raccolte
+    # per al massimo DB_GROUP_COMMIT_INTERVAL_MS e salvate insieme in una transazione
+    DB_GROUP_COMMIT = os.getenv('DB_GROUP_COMMIT', 'false').lower() == 'true'
+    DB_GROUP_COMMIT_INTERVAL_MS = float(os.getenv('DB_GROUP_COMMIT_INTERVAL_MS', 5))
+    DB_GROUP_COMMIT_MAX_WRITES = int(os.getenv('DB_GROUP_COMMIT_MAX_WRITES', 500))
     
     # Altri parametri
     MAX_SEARCH_RESULTS = int(os.getenv('MAX_SEARCH_RESULTS', 100))
     TOKEN_EXPIRY_HOURS = int(os.getenv('TOKEN_EXPIRY_HOURS', 24))
+    # Numero massimo di fumetti in una richiesta a /importa_fumetti_letti
+    IMPORT_MAX_ITEMS = int(os.getenv('IMPORT_MAX_ITEMS', 5000))
+    
+    # Hash delle password: metodo di werkzeug con i parametri di costo ('scrypt:n:r:p' oppure
+    # 'pbkdf2:sha256:iterazioni'), processi dedicati e calcoli massimi in attesa prima di rispondere 503.
+    # Gli hash con parametri diversi vengono ricalcolati al login successivo
+    PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 2))
+    PASSWORD_HASH_QUEUE_MAX = int(os.getenv('PASSWORD_HASH_QUEUE_MAX', 32))
+    
+    # Catalogo locale: corrispondenze sufficienti per rispondere a /search senza interrogare ComicVine
+    CATALOG_MIN_RESULTS = int(os.getenv('CATALOG_MIN_RESULTS', 10))
+    
+    # Cache delle ricerche su ComicVine
+    SEARCH_CACHE_PATH = os.getenv('SEARCH_CACHE_PATH', 'cache_ricerche.db')
+    SEARCH_CACHE_TTL_SECONDS = int(os.getenv('SEARCH_CACHE_TTL_SECONDS', 3600))
+    SEARCH_CACHE_STALE_SECONDS = int(os.getenv('SEARCH_CACHE_STALE_SECONDS', 24 * 3600))
+    SEARCH_CACHE_MAX_ENTRIES = int(os.getenv('SEARCH_CACHE_MAX_ENTRIES', 256))
+    
+    # Coalescenza delle richieste identiche: database dei lock condiviso tra i processi worker
+    # (vuoto = coalescenza solo all'interno del processo) e durata massima di un lock
+    COALESCING_LOCK_PATH = os.getenv('COALESCING_LOCK_PATH', '')
+    COALESCING_LOCK_TIMEOUT_SECONDS = float(os.getenv('COALESCING_LOCK_TIMEOUT_SECONDS', 60))
+    
+    # Client HTTP di ComicVine
+    # Numero massimo di pagine scaricate in parallelo da ComicVine (1 = sequenziale)
+    COMICVINE_MAX_CONCURRENCY = int(os.getenv('COMICVINE_MAX_CONCURRENCY', 4))
+    COMICVINE_POOL_SIZE = int(os.getenv('COMICVINE_POOL_SIZE', 10))
+    COMICVINE_CONNECT_TIMEOUT = float(os.getenv('COMICVINE_CONNECT_TIMEOUT', 5))
+    COMICVINE_READ_TIMEOUT = float(os.getenv('COMICVINE_READ_TIMEOUT', 10))
+    COMICVINE_MAX_RETRIES = int(os.getenv('COMICVINE_MAX_RETRIES', 3))
+    COMICVINE_BACKOFF_SECONDS = float(os.getenv('COMICVINE_BACKOFF_SECONDS', 0.5))
+    # Quota concessa da ComicVine per ogni risorsa e attesa massima per un posto libero
+    COMICVINE_REQUESTS_PER_HOUR = int(os.getenv('COMICVINE_REQUESTS_PER_HOUR', 200))
+    COMICVINE_RATE_LIMIT_WAIT_SECONDS = float(os.getenv('COMICVINE_RATE_LIMIT_WAIT_SECONDS', 2))
+    # Formato delle risposte di ComicVine: 'json' oppure 'xml'
+    COMICVINE_FORMAT = os.getenv('COMICVINE_FORMAT', 'json')
+    # Indirizzo dell'API, diverso solo per i benchmark (python -m benchmark.comicvine_locale)
+    COMICVINE_BASE_URL = os.getenv('COMICVINE_BASE_URL', 'https://comicvine.gamespot.com/api/')
+    
+    # Richieste più lente di SLOW_REQUEST_MS (0 = nessuna) vengono scritte nel log; con
+    # SLOW_REQUEST_PROFILE_DIR ogni richiesta viene profilata con cProfile e il profilo di quelle
+    # lente salvato nella cartella (rallenta tutte le richieste: da usare solo per le diagnosi)
+    SLOW_REQUEST_MS = float(os.getenv('SLOW_REQUEST_MS', 0))
+    SLOW_REQUEST_PROFILE_DIR = os.getenv('SLOW_REQUEST_PROFILE_DIR', '')
+    
+    # Modalità ASGI (asgi.py): thread che servono le route Flask non asincrone
+    ASGI_WSGI_WORKERS = int(os.getenv('ASGI_WSGI_WORKERS', 10))
+    
+    # Parametri del sistema di raccomandazione
+    RACCOMANDAZIONI_VICINI_MAX = int(os.getenv('RACCOMANDAZIONI_VICINI_MAX', 50))
+    # Filtraggio collaborativo: 'utenti' (confronto con gli altri utenti a ogni richiesta) oppure
+    # 'fumetti' (indice di similarità tra fumetti ricostruito offline da similarita_fumetti.py: le
+    # nuove letture contano solo dopo la ricostruzione successiva)
+    RACCOMANDAZIONI_FILTRAGGIO = os.getenv('RACCOMANDAZIONI_FILTRAGGIO', 'utenti')
+    # Similarità tra utenti dalle somme per coppia aggiornate dai trigger ad ogni rating invece che dalla
+    # matrice completa: le letture diventano più veloci, ogni rating costa in proporzione ai lettori del fumetto
+    RACCOMANDAZIONI_SIMILARITA_INCREMENTALE = os.getenv('RACCOMANDAZIONI_SIMILARITA_INCREMENTALE', 'false').lower() == 'true'
+    # Ricerca approssimata (MinHash LSH) degli utenti simili per basi utenti molto grandi:
+    # più bande aumentano la recall e il tempo di risposta; l'indice viene ricostruito dopo il TTL
+    RACCOMANDAZIONI_LSH = os.getenv('RACCOMANDAZIONI_LSH', 'false').lower() == 'true'
+    RACCOMANDAZIONI_LSH_BANDE = int(os.getenv('RACCOMANDAZIONI_LSH_BANDE', 64))
+    RACCOMANDAZIONI_LSH_RIGHE = int(os.getenv('RACCOMANDAZIONI_LSH_RIGHE', 1))
+    RACCOMANDAZIONI_LSH_TTL_SECONDI = int(os.getenv('RACCOMANDAZIONI_LSH_TTL_SECONDI', 3600))
+    # Motore predefinito ('vicinato' o 'fattorizzazione'), sostituibile per richiesta con ?motore=
+    RACCOMANDAZIONI_MOTORE = os.getenv('RACCOMANDAZIONI_MOTORE', 'vicinato')
+    # Cartella del modello fattorizzato addestrato da fattorizzazione.py
+    RACCOMANDAZIONI_MODELLO_PATH = os.getenv('RACCOMANDAZIONI_MODELLO_PATH', 'modello_fattorizzazione')
+    # Profili dei gusti degli utenti tenuti in memoria (0 = letti ogni volta dal database)
+    RACCOMANDAZIONI_PROFILI_CACHE = int(os.getenv('RACCOMANDAZIONI_PROFILI_CACHE', 10000))
+    # Validità delle raccomandazioni precalcolate (in secondi)
+    RACCOMANDAZIONI_TTL_SECONDI = int(os.getenv('RACCOMANDAZIONI_TTL_SECONDI', 6 * 3600))
+    # Completa in background da ComicVine i metadati dei candidati che mancano nel catalogo locale
+    RACCOMANDAZIONI_ARRICCHIMENTO = os.getenv('RACCOMANDAZIONI_ARRICCHIMENTO', 'true').lower() == 'true'
@@ -0,0 +1,207 @@
+import sqlite3
+import threading
+import time
+from typing import Dict, Tuple
+
+
+class CursoreMisurato(sqlite3.Cursor):
+    """
+    Cursore che conta le istruzioni eseguite e il loro tempo sulla connessione, e misura il
+    tempo di acquisizione del lock di scrittura: la prima istruzione di modifica apre
+    implicitamente una transazione (BEGIN IMMEDIATE) e attende finché nessun'altra
+    connessione sta scrivendo.
+    """
+    def execute(self, sql, parametri=()):
+        connessione = self.connection
+        inizio = time.perf_counter()
+        if connessione.in_transaction or not _e_scrittura(sql):
+            try:
+                return super().execute(sql, parametri)
+            finally:
+                connessione._registra_istruzione(time.perf_counter() - inizio)
+
+        try:
+            return super().execute(sql, parametri)
+        except sqlite3.OperationalError as e:
+            if 'locked' in str(e):
+                connessione.gestore._registra_errore_lock()
+            raise
+        finally:
+            durata = time.perf_counter() - inizio
+            connessione._registra_istruzione(durata)
+            connessione.gestore._registra_attesa_lock(durata)
+
+    def executemany(self, sql, sequenza):
+        # Stessa misura di execute per gli inserimenti in blocco
+        connessione = self.connection
+        inizio = time.perf_counter()
+        if connessione.in_transaction or not _e_scrittura(sql):
+            try:
+                return super().executemany(sql, sequenza)
+            finally:
+                connessione._registra_istruzione(time.perf_counter() - inizio)
+
+        try:
+            return super().executemany(sql, sequenza)
+        finally:
+            durata = time.perf_counter() - inizio
+            connessione._registra_istruzione(durata)
+            connessione.gestore._registra_attesa_lock(durata)
+
+
+class ConnessioneMisurata(sqlite3.Connection):
+    """
+    Connessione che crea cursori misurati e conosce il gestore che l'ha creata. È usata da un
+    solo thread, quindi i contatori delle istruzioni non richiedono lock.
+    """
+    gestore: 'GestoreConnessioni'
+    istruzioni_eseguite = 0
+    tempo_istruzioni = 0.0
+
+    def _registra_istruzione(self, durata: float):
+        self.istruzioni_eseguite += 1
+        self.tempo_istruzioni += durata
+
+    def cursor(self, factory=CursoreMisurato):
+        return super().cursor(factory)
+
+    def execute(self, sql, parametri=()):
+        return self.cursor().execute(sql, parametri)
+
+    def executemany(self, sql, sequenza):
+        return self.cursor().executemany(sql, sequenza)
+
+
+def _e_scrittura(sql: str) -> bool:
+    return sql.lstrip()[:7].upper().startswith(('INSERT', 'UPDATE', 'DELETE', 'REPLACE'))
+
+
+class GestoreConnessioni:
+    """
+    Mantiene una connessione SQLite per thread, riusata da tutte le richieste servite
+    da quel thread. Le connessioni sono configurate in modalità WAL, così le letture non
+    vengono bloccate dalle scritture, e con cache delle istruzioni preparate.
+    """
+    def __init__(self, percorso: str, timeout_secondi: float = 5, mmap_size: int = 64 * 1024 * 1024,
+                 cache_size_kb: int = 16 * 1024, istruzioni_in_cache: int = 256):
+        """
+        Inizializza il gestore.
+
+        Args:
+            percorso: Percorso del database SQLite
+            timeout_secondi: Attesa massima per il lock di scrittura prima di "database is locked"
+            mmap_size: Byte del database letti tramite memory mapping
+            cache_size_kb: Dimensione della cache delle pagine per connessione, in KB
+            istruzioni_in_cache: Numero di istruzioni preparate tenute in cache per connessione
+        """
+        self.percorso = percorso
+        self.timeout_secondi = timeout_secondi
+        self.mmap_size = mmap_size
+        self.cache_size_kb = cache_size_kb
+        self.istruzioni_in_cache = istruzioni_in_cache
+        self._locale = threading.local()
+        self._lock = threading.Lock()
+        self._contatori = {'connessioni_create': 0, 'connessioni_aperte': 0, 'riutilizzi': 0,
+                           'transazioni_scrittura': 0, 'attese_lock': 0, 'errori_lock': 0}
+        self._attesa_lock_totale = 0.0
+        self._attesa_lock_max = 0.0
+
+    def connessione(self) -> sqlite3.Connection:
+        """
+        Restituisce la connessione del thread corrente, creandola se necessario.
+        """
+        conn = getattr(self._locale, 'conn', None)
+        if conn is not None:
+            with self._lock:
+                self._contatori['riutilizzi'] += 1
+            return conn
+
+        conn = sqlite3.connect(self.percorso, timeout=self.timeout_secondi, factory=ConnessioneMisurata,
+                               cached_statements=self.istruzioni_in_cache, isolation_level='IMMEDIATE')
+        conn.gestore = self
+        # Permette l'accesso alle colonne per nome invece che per indice
+        conn.row_factory = sqlite3.Row
+        conn.execute('PRAGMA journal_mode = WAL')
+        conn.execute('PRAGMA synchronous = NORMAL')
+        conn.execute(f'PRAGMA mmap_size = {int(self.mmap_size)}')
+        conn.execute(f'PRAGMA cache_size = {-int(self.cache_size_kb)}')
+        conn.execute('PRAGMA temp_store = MEMORY')
+
+        self._locale.conn = conn
+        # Alla terminazione del thread la connessione viene chiusa insieme ai suoi dati locali
+        self._locale.chiusura = _ChiusuraAllaFine(conn, self)
+        with self._lock:
+            self._contatori['connessioni_create'] += 1
+            self._contatori['connessioni_aperte'] += 1
+        return conn
+
+    def istruzioni_thread(self) -> Tuple[int, float]:
+        """
+        Restituisce il numero di istruzioni eseguite dalla connessione del thread corrente e il loro
+        tempo totale in secondi, senza creare la connessione: la differenza tra due letture misura
+        le istruzioni eseguite nel frattempo, ad esempio durante una richiesta.
+        """
+        conn = getattr(self._locale, 'conn', None)
+        if conn is None:
+            return 0, 0.0
+        return conn.istruzioni_eseguite, conn.tempo_istruzioni
+
+    def rilascia(self, conn: sqlite3.Connection):
+        """
+        Riporta la connessione allo stato iniziale alla fine di una richiesta:
+        una transazione rimasta aperta (ad esempio per un errore) viene annullata.
+        """
+        if conn.in_transaction:
+            conn.rollback()
+
+    def chiudi(self):
+        """Chiude la connessione del thread corrente."""
+        chiusura = getattr(self._locale, 'chiusura', None)
+        if chiusura is not None:
+            chiusura.chiudi()
+            self._locale.conn = None
+            self._locale.chiusura = None
+
+    def statistiche(self) -> Dict[str, float]:
+        with self._lock:
+            statistiche = dict(self._contatori)
+            statistiche['attesa_lock_totale_ms'] = self._attesa_lock_totale * 1000
+            statistiche['attesa_lock_max_ms'] = self._attesa_lock_max * 1000
+        return statistiche
+
+    def _registra_attesa_lock(self, durata: float):
+        with self._lock:
+            self._contatori['transazioni_scrittura'] += 1
+            # Sotto al millisecondo il lock era libero: non si conta come attesa
+            if durata > 0.001:
+                self._contatori['attese_lock'] += 1
+            self._attesa_lock_totale += durata
+            self._attesa_lock_max = max(self._attesa_lock_max, durata)
+
+    def _registra_errore_lock(self):
+        with self._lock:
+            self._contatori['errori_lock'] += 1
+
+    def _connessione_chiusa(self):
+        with self._lock:
+            self._contatori['connessioni_aperte'] -= 1
+
+
+class _ChiusuraAllaFine:
+    """Chiude la connessione quando viene distrutto, cioè alla fine del thread proprietario."""
+    def __init__(self, conn: sqlite3.Connection, gestore: GestoreConnessioni):
+        self.conn = conn
+        self.gestore = gestore
+
+    def chiudi(self):
+        if self.conn is not None:
+            try:
+                self.conn.close()
+            except sqlite3.ProgrammingError:
+                # La connessione appartiene a un thread ormai terminato
+                pass
+            self.conn = None
+            self.gestore._connessione_chiusa()
+
+    def __del__(self):
+        self.chiudi()
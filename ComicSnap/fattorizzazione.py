@@ -0,0 +1,265 @@
+import argparse
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import AbstractSet, List, Optional, Tuple
+
+import numpy as np
+
+import catalogo
+from candidati import ArricchimentoComicVine
+from comicvine import Volume
+from matrice_rating import MatriceRating
+from profili import CacheProfili
+
+# Rating elaborati insieme in un passo di ALS: limita la memoria dei prodotti esterni (rating × k × k)
+_RATING_PER_BLOCCO = 4096
+
+# File che indica la versione corrente del modello nella cartella
+_MANIFESTO = 'modello.json'
+
+
+def _risolvi(indptr: np.ndarray, indici: np.ndarray, residui: np.ndarray, fissi: np.ndarray,
+             regolarizzazione: float) -> np.ndarray:
+    # Un passo di ALS: per ogni riga risolve (Yᵀ Y + λ n I) x = Yᵀ r sui soli rating osservati,
+    # con i fattori Y dell'altro lato fissi. Le righe sono elaborate a blocchi contigui del formato CSR
+    n_righe, k = len(indptr) - 1, fissi.shape[1]
+    risultato = np.zeros((n_righe, k))
+    identita = np.eye(k)
+    riga = 0
+    while riga < n_righe:
+        fine = int(np.searchsorted(indptr, indptr[riga] + _RATING_PER_BLOCCO, side='right')) - 1
+        fine = min(max(fine, riga + 1), n_righe)
+        a, b = indptr[riga], indptr[fine]
+        conteggi = np.diff(indptr[riga:fine + 1])
+        piene = np.flatnonzero(conteggi)
+        if len(piene):
+            y = fissi[indici[a:b]]
+            if fine - riga == 1:
+                # Riga con molti rating (ad esempio un fumetto popolare): un solo prodotto matriciale
+                matrici = (y.T @ y)[None]
+                termini = (y.T @ residui[a:b])[None]
+            else:
+                inizi = indptr[riga:fine][piene] - a
+                matrici = np.add.reduceat(y[:, :, None] * y[:, None, :], inizi, axis=0)
+                termini = np.add.reduceat(y * residui[a:b, None], inizi, axis=0)
+            matrici += regolarizzazione * conteggi[piene][:, None, None] * identita
+            risultato[riga + piene] = np.linalg.solve(matrici, termini[..., None])[..., 0]
+        riga = fine
+    return risultato
+
+
+def addestra(matrice: MatriceRating, fattori: int = 32, regolarizzazione: float = 0.1,
+             iterazioni: int = 10, seed: int = 0) -> Tuple[np.ndarray, np.ndarray, float]:
+    """
+    Fattorizza la matrice dei rating con l'ALS (alternating least squares): alterna la soluzione
+    ai minimi quadrati dei fattori degli utenti e dei fumetti, ciascuna con l'altra fissa.
+
+    Args:
+        matrice: Matrice dei rating
+        fattori: Dimensione dei fattori latenti
+        regolarizzazione: Peso λ della regolarizzazione, moltiplicato per il numero di rating
+        iterazioni: Numero di alternanze
+        seed: Seme dell'inizializzazione casuale
+    Returns:
+        Tupla (fattori degli utenti, fattori dei fumetti, rating medio)
+    """
+    media = float(matrice.valori.mean()) if matrice.numero_rating else 0.0
+    residui_righe = matrice.valori - media
+    residui_colonne = matrice.valori_colonne - media
+    fattori_fumetti = np.random.default_rng(seed).normal(0, 0.1, (len(matrice.fumetti), fattori))
+    fattori_utenti = np.zeros((len(matrice.utenti), fattori))
+    for iterazione in range(iterazioni):
+        fattori_utenti = _risolvi(matrice.indptr, matrice.indici, residui_righe, fattori_fumetti, regolarizzazione)
+        fattori_fumetti = _risolvi(matrice.indptr_colonne, matrice.indici_colonne, residui_colonne,
+                                   fattori_utenti, regolarizzazione)
+        righe = np.repeat(np.arange(len(matrice.utenti)), np.diff(matrice.indptr))
+        previsti = np.einsum('ij,ij->i', fattori_utenti[righe], fattori_fumetti[matrice.indici])
+        errore = np.sqrt(np.mean((residui_righe - previsti) ** 2)) if matrice.numero_rating else 0.0
+        print(f"Iterazione {iterazione + 1}/{iterazioni}: RMSE {errore:.4f}")
+    return fattori_utenti, fattori_fumetti, media
+
+
+def salva(cartella: str, matrice: MatriceRating, fattori_utenti: np.ndarray, fattori_fumetti: np.ndarray,
+          media: float):
+    """
+    Salva il modello come array .npy e pubblica la nuova versione sostituendo il manifesto
+    in modo atomico: i processi che usano la versione precedente la vedono fino al ricaricamento.
+    """
+    os.makedirs(cartella, exist_ok=True)
+    versione = uuid.uuid4().hex
+    for nome, array in (('utenti', matrice.utenti), ('fumetti', matrice.fumetti.astype(str)),
+                        ('fattori_utenti', fattori_utenti.astype(np.float32)),
+                        ('fattori_fumetti', fattori_fumetti.astype(np.float32))):
+        np.save(os.path.join(cartella, f'{versione}-{nome}.npy'), array)
+
+    precedente = _leggi_manifesto(cartella)
+    temporaneo = os.path.join(cartella, f'{_MANIFESTO}.{versione}')
+    with open(temporaneo, 'w') as f:
+        json.dump({'versione': versione, 'media': media, 'fattori': fattori_utenti.shape[1],
+                   'creato_il': time.time()}, f)
+    os.replace(temporaneo, os.path.join(cartella, _MANIFESTO))
+
+    # Restano solo la versione corrente e quella precedente, che altri processi potrebbero avere aperto
+    conservate = {versione, precedente['versione'] if precedente else None}
+    for nome in os.listdir(cartella):
+        if nome.endswith('.npy') and nome.split('-', 1)[0] not in conservate:
+            try:
+                os.remove(os.path.join(cartella, nome))
+            except OSError:
+                pass
+
+
+def _leggi_manifesto(cartella: str) -> Optional[dict]:
+    try:
+        with open(os.path.join(cartella, _MANIFESTO)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+class ModelloFattorizzato:
+    """
+    Modello addestrato da addestra, letto dai file .npy. I fattori sono mappati in memoria
+    (mmap): tutti i processi worker condividono le stesse pagine della cache del sistema operativo.
+    """
+    def __init__(self, cartella: str, manifesto: dict):
+        percorso = lambda nome: os.path.join(cartella, f"{manifesto['versione']}-{nome}.npy")
+        self.versione = manifesto['versione']
+        self.media = manifesto['media']
+        self.fattori_utenti = np.load(percorso('fattori_utenti'), mmap_mode='r')
+        self.fattori_fumetti = np.load(percorso('fattori_fumetti'), mmap_mode='r')
+        self.fumetti = np.load(percorso('fumetti'))
+        self._posizione_utente = {int(u): i for i, u in enumerate(np.load(percorso('utenti')).tolist())}
+        self._posizione_fumetto = {f: i for i, f in enumerate(self.fumetti.tolist())}
+
+    @classmethod
+    def carica(cls, cartella: str) -> Optional['ModelloFattorizzato']:
+        """Carica la versione corrente del modello, o restituisce None se non è mai stato addestrato."""
+        manifesto = _leggi_manifesto(cartella)
+        return cls(cartella, manifesto) if manifesto else None
+
+    def contiene(self, utente_id: int) -> bool:
+        return int(utente_id) in self._posizione_utente
+
+    def migliori(self, utente_id: int, esclusi: AbstractSet[str], k: int) -> List[Tuple[str, float]]:
+        """
+        Restituisce i k fumetti con il rating previsto più alto per l'utente: un prodotto
+        matrice-vettore seguito da una selezione parziale con argpartition.
+
+        Args:
+            utente_id: ID dell'utente (deve essere presente nel modello)
+            esclusi: ID dei fumetti da escludere, ad esempio quelli già letti
+            k: Numero di fumetti da restituire
+        Returns:
+            Lista di tuple (comic_id, rating previsto) ordinate per rating decrescente
+        """
+        previsti = self.fattori_fumetti @ self.fattori_utenti[self._posizione_utente[int(utente_id)]]
+        colonne_escluse = [c for c in map(self._posizione_fumetto.get, esclusi) if c is not None]
+        previsti[colonne_escluse] = -np.inf
+        k = min(k, len(previsti) - len(colonne_escluse))
+        if k <= 0:
+            return []
+        migliori = np.argpartition(-previsti, k - 1)[:k]
+        migliori = migliori[np.argsort(-previsti[migliori], kind='stable')]
+        return list(zip(self.fumetti[migliori].tolist(), (previsti[migliori] + self.media).tolist()))
+
+
+class ModelloCondiviso:
+    """Modello condiviso tra le richieste, ricaricato quando il job di addestramento ne pubblica uno nuovo."""
+    def __init__(self, cartella: str):
+        self.cartella = cartella
+        self._modello: Optional[ModelloFattorizzato] = None
+        self._modificato_il = None
+        self._lock = threading.Lock()
+
+    def ottieni(self) -> Optional[ModelloFattorizzato]:
+        try:
+            modificato_il = os.stat(os.path.join(self.cartella, _MANIFESTO)).st_mtime_ns
+        except OSError:
+            return self._modello
+        with self._lock:
+            if modificato_il != self._modificato_il:
+                self._modello = ModelloFattorizzato.carica(self.cartella) or self._modello
+                self._modificato_il = modificato_il
+            return self._modello
+
+
+class MotoreFattorizzazione:
+    """
+    Motore di raccomandazione basato sul modello fattorizzato, alternativo a SistemaRaccomandazione
+    e con la stessa interfaccia. Gli utenti assenti dal modello (registrati dopo l'ultimo
+    addestramento) non ricevono raccomandazioni: vanno serviti con l'altro motore.
+    """
+    def __init__(self, conn: sqlite3.Connection, modello: ModelloFattorizzato,
+                 arricchimento: Optional[ArricchimentoComicVine] = None, profili: Optional[CacheProfili] = None):
+        """
+        Args:
+            conn: Connessione al database SQLite
+            modello: Modello fattorizzato corrente
+            arricchimento: Completa in background i dati dei fumetti consigliati assenti dal catalogo
+            profili: Cache dei profili dei gusti, da cui leggere i fumetti già letti
+        """
+        self.conn = conn
+        self.modello = modello
+        self.arricchimento = arricchimento
+        self.profili = profili
+
+    def genera_raccomandazioni(self, utente_id: int, limit: int = 10) -> List[Volume]:
+        if not self.modello.contiene(utente_id):
+            return []
+
+        if self.profili is not None:
+            letti = self.profili.ottieni(self.conn, utente_id).fumetti_letti
+        else:
+            letti = {str(row[0]) for row in self.conn.execute(
+                'SELECT comic_id FROM fumetti_letti WHERE utente_id = ?', (utente_id,))}
+        # I fumetti senza dati nel catalogo non possono essere mostrati: se sono troppi
+        # si allarga la selezione fino ad esaurire i fumetti del modello
+        k = limit * 3
+        while True:
+            migliori = self.modello.migliori(utente_id, letti, k)
+            volumi = catalogo.volumi_per_id(self.conn, [comic_id for comic_id, _ in migliori])
+            if len(volumi) >= limit or len(migliori) < k:
+                break
+            k *= 4
+
+        mancanti = [comic_id for comic_id, _ in migliori[:limit] if comic_id not in volumi]
+        if mancanti and self.arricchimento is not None:
+            self.arricchimento.completa_metadati(mancanti)
+
+        raccomandazioni = []
+        for comic_id, previsto in migliori:
+            if comic_id in volumi:
+                volumi[comic_id].score = round(previsto, 2)
+                raccomandazioni.append(volumi[comic_id])
+        return raccomandazioni[:limit]
+
+
+# Job di addestramento: python fattorizzazione.py [--fattori 32] [--iterazioni 10] [--regolarizzazione 0.1]
+def main():
+    from config import Config
+
+    parser = argparse.ArgumentParser(description='Addestra il modello fattorizzato delle raccomandazioni')
+    parser.add_argument('--fattori', type=int, default=32)
+    parser.add_argument('--iterazioni', type=int, default=10)
+    parser.add_argument('--regolarizzazione', type=float, default=0.1)
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(Config.DATABASE_PATH, timeout=Config.DB_BUSY_TIMEOUT_SECONDS)
+    try:
+        inizio = time.perf_counter()
+        matrice = MatriceRating.da_database(conn)
+    finally:
+        conn.close()
+    fattori_utenti, fattori_fumetti, media = addestra(matrice, args.fattori, args.regolarizzazione, args.iterazioni)
+    salva(Config.RACCOMANDAZIONI_MODELLO_PATH, matrice, fattori_utenti, fattori_fumetti, media)
+    print(f"Modello con {len(matrice.utenti)} utenti e {len(matrice.fumetti)} fumetti salvato in "
+          f"{Config.RACCOMANDAZIONI_MODELLO_PATH} ({time.perf_counter() - inizio:.1f}s)")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,187 @@
+import multiprocessing
+import threading
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, Optional, Tuple
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+
+class ErroreSovraccarico(Exception):
+    """Sollevata quando ci sono già troppi calcoli di hash in attesa: la richiesta va rifiutata subito."""
+    pass
+
+
+def _metodo_hash(hash_salvato: str) -> str:
+    # Prefisso dell'hash di werkzeug con algoritmo e parametri di costo, ad esempio 'scrypt:32768:8:1'
+    return hash_salvato.split('$', 1)[0]
+
+
+def metodo_completo(metodo: str) -> str:
+    """
+    Completa il metodo configurato con i parametri di costo predefiniti di werkzeug, così
+    come compare nel prefisso degli hash generati (ad esempio 'scrypt' -> 'scrypt:32768:8:1').
+
+    Raises:
+        ValueError: se il metodo non è supportato o i parametri non sono validi
+    """
+    nome, *parametri = metodo.split(':')
+    if nome == 'scrypt':
+        if not parametri:
+            parametri = ['32768', '8', '1']
+        if len(parametri) != 3 or not all(p.isdigit() for p in parametri):
+            raise ValueError(f"Parametri di scrypt non validi: '{metodo}'")
+        return ':'.join(['scrypt', *(str(int(p)) for p in parametri)])
+    if nome == 'pbkdf2':
+        if len(parametri) > 2 or (len(parametri) == 2 and not parametri[1].isdigit()):
+            raise ValueError(f"Parametri di pbkdf2 non validi: '{metodo}'")
+        algoritmo = parametri[0] if parametri else 'sha256'
+        iterazioni = int(parametri[1]) if len(parametri) == 2 else DEFAULT_PBKDF2_ITERATIONS
+        return f'pbkdf2:{algoritmo}:{iterazioni}'
+    raise ValueError(f"Metodo di hash non valido: '{metodo}'")
+
+
+def _contesto_processi():
+    # I processi non vengono creati con fork del processo dell'applicazione, che ha già altri thread
+    # (connessioni SQLite, client HTTP, scrittori): un lock tenuto da un thread al momento del fork
+    # resterebbe bloccato per sempre nel figlio. forkserver dove disponibile, altrimenti spawn
+    metodi = multiprocessing.get_all_start_methods()
+    return multiprocessing.get_context('forkserver' if 'forkserver' in metodi else 'spawn')
+
+
+def _genera(password: str, metodo: str) -> Tuple[str, float]:
+    # Eseguita nei processi del pool: restituisce anche la durata del solo calcolo
+    inizio = time.perf_counter()
+    hash_password = generate_password_hash(password, metodo)
+    return hash_password, time.perf_counter() - inizio
+
+
+def _verifica(hash_salvato: str, password: str, metodo: str) -> Tuple[bool, Optional[str], float]:
+    # Eseguita nei processi del pool: se la password è corretta ma l'hash usa parametri di costo
+    # diversi da quelli configurati, calcola subito anche il nuovo hash
+    inizio = time.perf_counter()
+    nuovo_hash = None
+    valida = check_password_hash(hash_salvato, password)
+    if valida and _metodo_hash(hash_salvato) != metodo:
+        nuovo_hash = generate_password_hash(password, metodo)
+    return valida, nuovo_hash, time.perf_counter() - inizio
+
+
+class HashPassword:
+    """
+    Calcolo degli hash delle password in un pool di processi. Le funzioni di derivazione sono
+    volutamente lente e, eseguite nel thread della richiesta, terrebbero il GIL bloccando le altre
+    richieste servite dallo stesso processo. I calcoli in corso o in attesa sono limitati da coda_max:
+    oltre questo limite le richieste vengono rifiutate subito con ErroreSovraccarico. Se un processo
+    del pool termina in modo anomalo il pool viene ricreato al calcolo successivo.
+    """
+    def __init__(self, metodo: str = 'scrypt:32768:8:1', processi: int = 2, coda_max: int = 32):
+        """
+        Inizializza il pool, che viene avviato al primo calcolo.
+
+        Args:
+            metodo: Metodo di werkzeug con i parametri di costo ('scrypt:n:r:p' o 'pbkdf2:sha256:iterazioni')
+            processi: Numero di processi che calcolano gli hash
+            coda_max: Numero massimo di calcoli in corso o in attesa
+        """
+        # Metodo completo di tutti i parametri, come compare negli hash salvati
+        self.metodo = metodo_completo(metodo)
+        self.processi = processi
+        self.coda_max = coda_max
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._lock = threading.Lock()
+        self._in_coda = 0
+        self._latenze = deque(maxlen=1000)
+        self._attese = deque(maxlen=1000)
+        self._contatori = {'hash_generati': 0, 'verifiche': 0, 'verifiche_fallite': 0, 'rehash': 0,
+                           'rifiutate': 0, 'pool_ricreati': 0}
+
+    def genera(self, password: str) -> str:
+        """
+        Calcola l'hash di una nuova password con il metodo configurato.
+
+        Raises:
+            ErroreSovraccarico: se la coda dei calcoli è piena o il pool non è disponibile
+        """
+        hash_password, = self._esegui(_genera, password, self.metodo)
+        with self._lock:
+            self._contatori['hash_generati'] += 1
+        return hash_password
+
+    def verifica(self, hash_salvato: str, password: str) -> Tuple[bool, Optional[str]]:
+        """
+        Verifica una password e, se è corretta ma l'hash salvato usa parametri di costo diversi
+        da quelli configurati, restituisce anche il nuovo hash da salvare al suo posto.
+
+        Args:
+            hash_salvato: Hash salvato nel database
+            password: Password inviata dall'utente
+        Returns:
+            Tupla (password corretta, nuovo hash oppure None)
+        Raises:
+            ErroreSovraccarico: se la coda dei calcoli è piena o il pool non è disponibile
+        """
+        valida, nuovo_hash = self._esegui(_verifica, hash_salvato, password, self.metodo)
+        with self._lock:
+            self._contatori['verifiche'] += 1
+            if not valida:
+                self._contatori['verifiche_fallite'] += 1
+            if nuovo_hash is not None:
+                self._contatori['rehash'] += 1
+        return valida, nuovo_hash
+
+    def _esegui(self, funzione, *args) -> tuple:
+        # Invia il calcolo al pool, misurando la durata del calcolo e l'attesa in coda
+        with self._lock:
+            if self._in_coda >= self.coda_max:
+                self._contatori['rifiutate'] += 1
+                raise ErroreSovraccarico('Troppi calcoli di hash in attesa')
+            self._in_coda += 1
+            if self._pool is None:
+                self._pool = ProcessPoolExecutor(max_workers=self.processi, mp_context=_contesto_processi())
+            pool = self._pool
+        inizio = time.perf_counter()
+        try:
+            *risultato, durata = pool.submit(funzione, *args).result()
+        except BrokenProcessPool:
+            # Un processo è terminato (ad esempio per memoria esaurita): il pool non accetta più
+            # calcoli, quindi viene scartato e ricreato alla richiesta successiva
+            with self._lock:
+                if self._pool is pool:
+                    self._pool = None
+                    self._contatori['pool_ricreati'] += 1
+            pool.shutdown(wait=False)
+            raise ErroreSovraccarico('Pool di calcolo degli hash non disponibile')
+        finally:
+            with self._lock:
+                self._in_coda -= 1
+        totale = time.perf_counter() - inizio
+        with self._lock:
+            self._latenze.append(durata)
+            # Tutto il tempo non speso nel calcolo: attesa di un processo libero e invio dei dati
+            self._attese.append(max(totale - durata, 0))
+        return tuple(risultato)
+
+    def statistiche(self) -> Dict[str, float]:
+        """
+        Restituisce i contatori, i calcoli in coda e i percentili (in ms) della durata
+        degli hash e dell'attesa in coda, calcolati sugli ultimi 1000 calcoli.
+        """
+        with self._lock:
+            latenze = sorted(self._latenze)
+            attese = sorted(self._attese)
+            statistiche = dict(self._contatori)
+            statistiche['in_coda'] = self._in_coda
+        for nome, valori in (('latenza_hash', latenze), ('attesa_coda', attese)):
+            for percentile in (50, 95, 99):
+                indice = min(len(valori) - 1, len(valori) * percentile // 100)
+                statistiche[f'{nome}_p{percentile}_ms'] = valori[indice] * 1000 if valori else 0
+        return statistiche
+
+    def chiudi(self):
+        with self._lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown()
@@ -0,0 +1,167 @@
+import argparse
+import sqlite3
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Iterator, List, Optional, Tuple
+
+import catalogo
+import migrazioni
+from comicvine import ClientComicVine, ErroreComicVine, Volume
+
+# Volumi per richiesta: il massimo consentito da ComicVine
+DIMENSIONE_PAGINA = 100
+
+# Pagina importata: (posizione da cui riprendere, totale se noto, volumi della pagina)
+Pagina = Tuple[int, Optional[int], List[Volume]]
+
+
+def leggi_stato(conn: sqlite3.Connection, sorgente: str) -> Tuple[int, Optional[int]]:
+    """
+    Restituisce la posizione da cui riprendere l'importazione di una sorgente e il suo totale.
+    """
+    riga = conn.execute('SELECT posizione, totale FROM ingestione_stato WHERE sorgente = ?',
+                        (sorgente,)).fetchone()
+    return (riga[0], riga[1]) if riga else (0, None)
+
+
+def salva_stato(conn: sqlite3.Connection, sorgente: str, posizione: int, totale: Optional[int], righe: int):
+    # Va eseguita nella stessa transazione che scrive i volumi della pagina
+    conn.execute('''
+        INSERT INTO ingestione_stato (sorgente, posizione, totale, righe, aggiornato_il) VALUES (?, ?, ?, ?, ?)
+        ON CONFLICT (sorgente) DO UPDATE SET
+            posizione = excluded.posizione,
+            totale = excluded.totale,
+            righe = righe + excluded.righe,
+            aggiornato_il = excluded.aggiornato_il
+    ''', (sorgente, posizione, totale, righe, time.time()))
+
+
+def pagine_per_data(client: ClientComicVine, dal: str, al: str, posizione: int) -> Iterator[Pagina]:
+    """
+    Scorre i volumi aggiunti a ComicVine tra due date, in ordine di ID.
+    """
+    offset = posizione
+    while True:
+        totale, volumi = client.elenca_volumi(f'date_added:{dal}|{al}', DIMENSIONE_PAGINA, offset)
+        offset += DIMENSIONE_PAGINA
+        yield offset, totale, volumi
+        # Senza il totale ci si ferma alla prima pagina vuota
+        if (totale is not None and offset >= totale) or (totale is None and not volumi):
+            return
+
+
+def pagine_per_editore(client: ClientComicVine, editore_id: int, posizione: int) -> Iterator[Pagina]:
+    """
+    Scorre i volumi di un editore: l'elenco degli ID viene dalla risorsa publisher,
+    i dettagli sono richiesti alla risorsa volumes a blocchi di DIMENSIONE_PAGINA ID.
+
+    Raises:
+        ErroreComicVine: se ComicVine restituisce più volumi degli ID richiesti
+    """
+    ids = sorted(client.volumi_editore(editore_id), key=int)
+    for inizio in range(posizione, len(ids), DIMENSIONE_PAGINA):
+        # Ogni blocco deve stare in una sola risposta, altrimenti i volumi oltre la prima pagina
+        # andrebbero persi mentre l'avanzamento salvato li considera importati
+        blocco = ids[inizio:inizio + DIMENSIONE_PAGINA]
+        _, volumi = client.elenca_volumi('id:' + '|'.join(blocco), len(blocco))
+        if len(volumi) > len(blocco):
+            raise ErroreComicVine(f"{len(volumi)} volumi ricevuti per {len(blocco)} ID dell'editore {editore_id}")
+        yield inizio + len(blocco), len(ids), volumi
+
+
+def _con_anticipo(pagine: Iterator[Pagina]) -> Iterator[Pagina]:
+    # Scarica la pagina successiva mentre quella corrente viene scritta nel database
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        futuro = pool.submit(next, pagine, None)
+        while True:
+            pagina = futuro.result()
+            if pagina is None:
+                return
+            futuro = pool.submit(next, pagine, None)
+            yield pagina
+
+
+def importa(conn: sqlite3.Connection, sorgente: str, pagine: Iterator[Pagina]) -> int:
+    """
+    Scrive nel catalogo le pagine di una sorgente. Ogni pagina viene salvata con executemany
+    nella stessa transazione dell'avanzamento, quindi un'interruzione non perde né ripete righe.
+
+    Args:
+        conn: Connessione al database SQLite
+        sorgente: Nome della sorgente nella tabella ingestione_stato
+        pagine: Pagine da importare (vedi pagine_per_data e pagine_per_editore)
+    Returns:
+        Numero di volumi importati
+    """
+    inizio = time.perf_counter()
+    righe = 0
+    for posizione, totale, volumi in _con_anticipo(pagine):
+        catalogo.aggiungi_volumi(conn, volumi)
+        salva_stato(conn, sorgente, posizione, totale, len(volumi))
+        conn.commit()
+
+        righe += len(volumi)
+        durata = time.perf_counter() - inizio
+        avanzamento = f"{min(posizione, totale)}/{totale}" if totale is not None else str(posizione)
+        print(f"{sorgente}: {avanzamento}, {righe} volumi importati, {righe / durata:.1f} righe/s")
+    return righe
+
+
+# Importazione del catalogo: python ingestione.py --dal 2020-01-01 --al 2020-12-31 | --editore ID [ID ...]
+# Rilanciando lo stesso comando l'importazione riprende dall'ultima pagina salvata
+def main():
+    from config import Config
+
+    parser = argparse.ArgumentParser(description='Importa nel catalogo locale i volumi di ComicVine')
+    parser.add_argument('--dal', help='Data di inizio (AAAA-MM-GG) dei volumi aggiunti a ComicVine')
+    parser.add_argument('--al', help='Data di fine (AAAA-MM-GG) dei volumi aggiunti a ComicVine')
+    parser.add_argument('--editore', type=int, nargs='+', default=[], help='ID ComicVine degli editori da importare')
+    parser.add_argument('--ricomincia', action='store_true', help="Ignora l'avanzamento salvato")
+    parser.add_argument('--richieste-per-ora', type=int, default=Config.COMICVINE_REQUESTS_PER_HOUR,
+                        help='Quota di richieste verso ComicVine')
+    args = parser.parse_args()
+    if bool(args.dal) != bool(args.al) or not (args.dal or args.editore):
+        parser.error('indicare --dal e --al oppure --editore')
+
+    # Nel batch si attende la quota per tutto il tempo necessario invece di rinunciare
+    client = ClientComicVine(
+        Config.COMICVINE_API_KEY,
+        timeout_connessione=Config.COMICVINE_CONNECT_TIMEOUT,
+        timeout_lettura=Config.COMICVINE_READ_TIMEOUT,
+        tentativi_max=Config.COMICVINE_MAX_RETRIES,
+        backoff_secondi=Config.COMICVINE_BACKOFF_SECONDS,
+        richieste_per_ora=args.richieste_per_ora,
+        attesa_max_secondi=3600,
+        formato=Config.COMICVINE_FORMAT
+    )
+
+    sorgenti = []
+    if args.dal:
+        sorgenti.append((f'date_added:{args.dal}|{args.al}',
+                         lambda posizione: pagine_per_data(client, args.dal, args.al, posizione)))
+    for editore_id in args.editore:
+        sorgenti.append((f'editore:{editore_id}',
+                         lambda posizione, editore_id=editore_id: pagine_per_editore(client, editore_id, posizione)))
+
+    conn = sqlite3.connect(Config.DATABASE_PATH, timeout=Config.DB_BUSY_TIMEOUT_SECONDS)
+    try:
+        migrazioni.applica_migrazioni(conn)
+        for sorgente, pagine in sorgenti:
+            if args.ricomincia:
+                conn.execute('DELETE FROM ingestione_stato WHERE sorgente = ?', (sorgente,))
+                conn.commit()
+            posizione, totale = leggi_stato(conn, sorgente)
+            if totale is not None and posizione >= totale:
+                print(f"{sorgente}: già importata ({totale} volumi), usare --ricomincia per ripeterla")
+                continue
+            importa(conn, sorgente, pagine(posizione))
+    except ErroreComicVine as e:
+        print(f"Importazione interrotta: {e}. Rilanciare il comando per riprendere.")
+        sys.exit(1)
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,263 @@
+import sqlite3
+from typing import Dict, Iterator, Optional, Tuple
+
+import numpy as np
+
+
+class MatriceRating:
+    """
+    Matrice sparsa utenti × fumetti dei rating, costruita con una sola scansione
+    della tabella fumetti_letti.
+
+    I dati sono memorizzati due volte: per righe (CSR, un utente per riga) e per
+    colonne (CSC, un fumetto per colonna), così da poter leggere in modo efficiente
+    sia i rating di un utente sia tutti gli utenti che hanno valutato un fumetto.
+    """
+    def __init__(self, utenti: np.ndarray, fumetti: np.ndarray,
+                 indici_utente: np.ndarray, indici_fumetto: np.ndarray, valori: np.ndarray):
+        """
+        Inizializza la matrice a partire dalle triple (utente, fumetto, rating).
+
+        Args:
+            utenti: ID degli utenti, ordinati, uno per riga
+            fumetti: ID dei fumetti, ordinati, uno per colonna
+            indici_utente: Indice di riga di ogni rating, ordinato per (riga, colonna)
+            indici_fumetto: Indice di colonna di ogni rating
+            valori: Valore di ogni rating
+        """
+        self.utenti = utenti
+        self.fumetti = fumetti
+        self._posizione_utente = {int(u): i for i, u in enumerate(utenti)}
+        self._posizione_fumetto = {str(f): i for i, f in enumerate(fumetti)}
+
+        # Formato CSR: i rating dell'utente i sono in valori[indptr[i]:indptr[i + 1]]
+        self.indptr = np.zeros(len(utenti) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(indici_utente, minlength=len(utenti)), out=self.indptr[1:])
+        self.indici = indici_fumetto
+        self.valori = valori
+
+        # Formato CSC: stessi dati raggruppati per fumetto
+        ordine = np.argsort(indici_fumetto, kind='stable')
+        self.indptr_colonne = np.zeros(len(fumetti) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(indici_fumetto, minlength=len(fumetti)), out=self.indptr_colonne[1:])
+        self.indici_colonne = indici_utente[ordine]
+        self.valori_colonne = valori[ordine]
+
+    @classmethod
+    def da_database(cls, conn: sqlite3.Connection) -> 'MatriceRating':
+        """
+        Costruisce la matrice leggendo tutti i rating in una sola query.
+        Le righe senza rating vengono ignorate; se un utente ha registrato più volte
+        lo stesso fumetto vale l'ultimo rating inserito.
+
+        Args:
+            conn: Connessione al database SQLite
+        Returns:
+            La matrice dei rating
+        """
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT utente_id, comic_id, rating
+            FROM fumetti_letti
+            WHERE utente_id IS NOT NULL AND rating IS NOT NULL
+            ORDER BY id
+        ''')
+        righe = cursor.fetchall()
+        if not righe:
+            vuoto = np.zeros(0, dtype=np.int64)
+            return cls(vuoto, np.zeros(0, dtype=str), vuoto, vuoto, np.zeros(0, dtype=np.float64))
+
+        colonna_utenti, colonna_fumetti, colonna_rating = zip(*righe)
+        utenti, indici_utente = np.unique(np.array(colonna_utenti, dtype=np.int64), return_inverse=True)
+        fumetti, indici_fumetto = np.unique(np.array(colonna_fumetti, dtype=str), return_inverse=True)
+        valori = np.array(colonna_rating, dtype=np.float64)
+
+        # Rimozione dei duplicati (utente, fumetto) mantenendo l'ultimo inserito:
+        # np.unique sulla sequenza invertita restituisce la prima occorrenza, cioè l'ultima
+        chiavi = indici_utente.astype(np.int64) * len(fumetti) + indici_fumetto
+        _, posizioni = np.unique(chiavi[::-1], return_index=True)
+        posizioni = len(chiavi) - 1 - posizioni
+
+        return cls(utenti, fumetti, indici_utente[posizioni].astype(np.int64),
+                   indici_fumetto[posizioni].astype(np.int64), valori[posizioni])
+
+    @property
+    def numero_rating(self) -> int:
+        return len(self.valori)
+
+    def rating_utente(self, utente_id: int) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Restituisce i rating di un utente come coppia (indici dei fumetti, valori).
+
+        Args:
+            utente_id: ID dell'utente
+        Returns:
+            Tupla di array vuoti se l'utente non ha rating
+        """
+        riga = self._posizione_utente.get(int(utente_id))
+        if riga is None:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.float64)
+        inizio, fine = self.indptr[riga], self.indptr[riga + 1]
+        return self.indici[inizio:fine], self.valori[inizio:fine]
+
+    def indice_utente(self, utente_id: int) -> Optional[int]:
+        return self._posizione_utente.get(int(utente_id))
+
+    def indice_fumetto(self, comic_id: str) -> Optional[int]:
+        return self._posizione_fumetto.get(str(comic_id))
+
+    def similarita_coseno(self, utente_id: int) -> Dict[int, float]:
+        """
+        Calcola in un'unica operazione vettoriale la similarità coseno tra l'utente
+        dato e tutti gli altri, limitata ai fumetti valutati da entrambi.
+
+        Vengono letti solo i rating dei fumetti valutati dall'utente target, per cui
+        il costo è proporzionale al numero di co-valutazioni e non al numero di utenti.
+
+        Args:
+            utente_id: ID dell'utente
+        Returns:
+            Dizionario con user_id come chiave e similarità coseno come valore,
+            solo per gli utenti con almeno un fumetto in comune
+        """
+        colonne, rating_target = self.rating_utente(utente_id)
+        if len(colonne) == 0:
+            return {}
+
+        # Raccoglie, per ogni fumetto dell'utente target, tutti gli utenti che lo hanno valutato
+        inizi = self.indptr_colonne[colonne]
+        lunghezze = self.indptr_colonne[colonne + 1] - inizi
+        posizioni = np.repeat(inizi - np.cumsum(lunghezze) + lunghezze, lunghezze) + np.arange(lunghezze.sum())
+        altri = self.indici_colonne[posizioni]
+        rating_altri = self.valori_colonne[posizioni]
+        rating_propri = np.repeat(rating_target, lunghezze)
+
+        # Somme per utente su numeratore e norme, ristrette ai fumetti in comune
+        n_utenti = len(self.utenti)
+        numeratore = np.bincount(altri, weights=rating_propri * rating_altri, minlength=n_utenti)
+        norma_target = np.bincount(altri, weights=rating_propri ** 2, minlength=n_utenti)
+        norma_altri = np.bincount(altri, weights=rating_altri ** 2, minlength=n_utenti)
+        in_comune = np.bincount(altri, minlength=n_utenti) > 0
+        in_comune[self._posizione_utente[int(utente_id)]] = False
+
+        indici = np.flatnonzero(in_comune)
+        denominatore = np.sqrt(norma_target[indici]) * np.sqrt(norma_altri[indici])
+        valori = np.divide(numeratore[indici], denominatore,
+                           out=np.zeros(len(indici)), where=denominatore > 0)
+
+        return dict(zip(self.utenti[indici].tolist(), valori.tolist()))
+
+    def similarita_coseno_candidati(self, utente_id: int, righe: np.ndarray) -> Dict[int, float]:
+        """
+        Come similarita_coseno, ma limitata agli utenti candidati indicati (ad esempio proposti
+        da un indice approssimato): vengono lette solo le righe dei candidati.
+
+        Args:
+            utente_id: ID dell'utente
+            righe: Indici di riga degli utenti candidati
+        Returns:
+            Dizionario con user_id come chiave e similarità coseno come valore,
+            solo per i candidati con almeno un fumetto in comune
+        """
+        colonne, rating_target = self.rating_utente(utente_id)
+        righe = righe[righe != self._posizione_utente.get(int(utente_id), -1)]
+        if len(colonne) == 0 or len(righe) == 0:
+            return {}
+
+        # Rating dell'utente target per colonna, per confrontarli con quelli dei candidati
+        rating_per_colonna = np.zeros(len(self.fumetti))
+        rating_per_colonna[colonne] = rating_target
+        valutati = np.zeros(len(self.fumetti), dtype=bool)
+        valutati[colonne] = True
+
+        inizi = self.indptr[righe]
+        lunghezze = self.indptr[righe + 1] - inizi
+        posizioni = np.repeat(inizi - np.cumsum(lunghezze) + lunghezze, lunghezze) + np.arange(lunghezze.sum())
+        candidato = np.repeat(np.arange(len(righe)), lunghezze)
+        colonne_altri = self.indici[posizioni]
+        in_comune = valutati[colonne_altri]
+        candidato = candidato[in_comune]
+        rating_altri = self.valori[posizioni][in_comune]
+        rating_propri = rating_per_colonna[colonne_altri[in_comune]]
+
+        numeratore = np.bincount(candidato, weights=rating_propri * rating_altri, minlength=len(righe))
+        norma_target = np.bincount(candidato, weights=rating_propri ** 2, minlength=len(righe))
+        norma_altri = np.bincount(candidato, weights=rating_altri ** 2, minlength=len(righe))
+        indici = np.flatnonzero(np.bincount(candidato, minlength=len(righe)))
+
+        denominatore = np.sqrt(norma_target[indici]) * np.sqrt(norma_altri[indici])
+        valori = np.divide(numeratore[indici], denominatore,
+                           out=np.zeros(len(indici)), where=denominatore > 0)
+        return dict(zip(self.utenti[righe[indici]].tolist(), valori.tolist()))
+
+    def punteggi_collaborativi(self, similarita: Dict[int, float], rating_minimo: float = 4) -> Dict[str, float]:
+        """
+        Aggrega in un solo passaggio i rating dei vicini pesati per la loro similarità.
+        Per ogni fumetto lo score è la somma di similarità * rating sui vicini che lo
+        hanno valutato almeno rating_minimo.
+
+        Args:
+            similarita: Dizionario con user_id dei vicini come chiave e similarità come valore
+            rating_minimo: Rating minimo perché un fumetto del vicino venga considerato
+        Returns:
+            Dizionario con comic_id come chiave e score di raccomandazione come valore
+        """
+        righe = [self._posizione_utente[u] for u in similarita if u in self._posizione_utente]
+        if not righe:
+            return {}
+        righe = np.array(righe, dtype=np.int64)
+        pesi = np.array([similarita[int(u)] for u in self.utenti[righe]], dtype=np.float64)
+
+        # Concatena le righe CSR dei vicini, come in similarita_coseno ma per righe
+        inizi = self.indptr[righe]
+        lunghezze = self.indptr[righe + 1] - inizi
+        posizioni = np.repeat(inizi - np.cumsum(lunghezze) + lunghezze, lunghezze) + np.arange(lunghezze.sum())
+        colonne = self.indici[posizioni]
+        valori = self.valori[posizioni]
+        pesi = np.repeat(pesi, lunghezze)
+
+        selezionati = valori >= rating_minimo
+        colonne = colonne[selezionati]
+        punteggi = np.bincount(colonne, weights=pesi[selezionati] * valori[selezionati],
+                               minlength=len(self.fumetti))
+        presenti = np.flatnonzero(np.bincount(colonne, minlength=len(self.fumetti)))
+
+        return dict(zip(self.fumetti[presenti].tolist(), punteggi[presenti].tolist()))
+
+    def vicini_fumetti(self, vicini_max: int) -> Iterator[Tuple[int, np.ndarray, np.ndarray]]:
+        """
+        Calcola, per ogni fumetto, i vicini_max fumetti più simili secondo la similarità coseno
+        tra le colonne della matrice (i rating di tutti gli utenti, non solo di quelli in comune).
+
+        Per ogni fumetto vengono letti i rating degli utenti che lo hanno valutato, quindi il costo
+        totale è proporzionale alla somma dei quadrati delle letture di ogni utente.
+
+        Args:
+            vicini_max: Numero massimo di vicini per fumetto
+        Returns:
+            Iteratore di tuple (indice del fumetto, indici dei vicini, similarità) ordinate per
+            similarità decrescente; sono esclusi i fumetti senza utenti in comune
+        """
+        norme = np.sqrt(np.bincount(self.indici, weights=self.valori ** 2, minlength=len(self.fumetti)))
+        for colonna in range(len(self.fumetti)):
+            inizio, fine = self.indptr_colonne[colonna], self.indptr_colonne[colonna + 1]
+            utenti = self.indici_colonne[inizio:fine]
+            rating = self.valori_colonne[inizio:fine]
+
+            # Concatena le righe CSR degli utenti che hanno valutato il fumetto
+            inizi = self.indptr[utenti]
+            lunghezze = self.indptr[utenti + 1] - inizi
+            posizioni = np.repeat(inizi - np.cumsum(lunghezze) + lunghezze, lunghezze) + np.arange(lunghezze.sum())
+
+            # Prodotti scalari con le sole colonne co-valutate: np.unique evita un array grande quanto il catalogo
+            altre, inverso = np.unique(self.indici[posizioni], return_inverse=True)
+            prodotti = np.bincount(inverso, weights=self.valori[posizioni] * np.repeat(rating, lunghezze))
+            diversi = altre != colonna
+            altre, prodotti = altre[diversi], prodotti[diversi]
+
+            similarita = prodotti / (norme[colonna] * norme[altre])
+            if len(altre) > vicini_max:
+                migliori = np.argpartition(-similarita, vicini_max - 1)[:vicini_max]
+                altre, similarita = altre[migliori], similarita[migliori]
+            ordine = np.argsort(-similarita, kind='stable')
+            yield colonna, altre[ordine], similarita[ordine]
@@ -0,0 +1,158 @@
+import bisect
+import math
+import threading
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+# Limiti dei bucket per le durate, in secondi
+LIMITI_DURATA = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Limiti dei bucket per il numero di istruzioni SQL di una richiesta
+LIMITI_ISTRUZIONI = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+Etichette = Tuple[Tuple[str, str], ...]
+
+
+def _formatta_etichette(etichette: Etichette) -> str:
+    if not etichette:
+        return ''
+    coppie = []
+    for nome, valore in etichette:
+        valore = str(valore).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+        coppie.append(f'{nome}="{valore}"')
+    return '{' + ','.join(coppie) + '}'
+
+
+def _formatta_valore(valore: float) -> str:
+    if math.isinf(valore):
+        return '+Inf' if valore > 0 else '-Inf'
+    return repr(float(valore)) if not float(valore).is_integer() else str(int(valore))
+
+
+class _Istogramma:
+    """Conteggi cumulativi per bucket, somma e numero delle osservazioni di ogni combinazione di etichette."""
+    def __init__(self, descrizione: str, limiti: Sequence[float]):
+        self.descrizione = descrizione
+        self.limiti = tuple(limiti)
+        self.serie: Dict[Etichette, List[float]] = {}
+
+    def osserva(self, etichette: Etichette, valore: float):
+        # Ultimi due elementi: somma e numero delle osservazioni
+        serie = self.serie.get(etichette)
+        if serie is None:
+            serie = self.serie[etichette] = [0] * (len(self.limiti) + 3)
+        serie[bisect.bisect_left(self.limiti, valore)] += 1
+        serie[-2] += valore
+        serie[-1] += 1
+
+    def righe(self, nome: str) -> List[str]:
+        righe = [f'# HELP {nome} {self.descrizione}', f'# TYPE {nome} histogram']
+        for etichette, serie in sorted(self.serie.items()):
+            cumulato = 0
+            for limite, conteggio in zip(self.limiti + (math.inf,), serie):
+                cumulato += conteggio
+                righe.append(f'{nome}_bucket{_formatta_etichette(etichette + (("le", _formatta_valore(limite)),))} {cumulato}')
+            righe.append(f'{nome}_sum{_formatta_etichette(etichette)} {_formatta_valore(serie[-2])}')
+            righe.append(f'{nome}_count{_formatta_etichette(etichette)} {serie[-1]}')
+        return righe
+
+
+class _Contatore:
+    """Valore cumulativo di ogni combinazione di etichette, esposto con il suffisso _total di Prometheus."""
+    def __init__(self, descrizione: str):
+        self.descrizione = descrizione
+        self.serie: Dict[Etichette, float] = {}
+
+    def incrementa(self, etichette: Etichette, valore: float):
+        self.serie[etichette] = self.serie.get(etichette, 0) + valore
+
+    def righe(self, nome: str) -> List[str]:
+        if not nome.endswith('_total'):
+            nome += '_total'
+        righe = [f'# HELP {nome} {self.descrizione}', f'# TYPE {nome} counter']
+        for etichette, valore in sorted(self.serie.items()):
+            righe.append(f'{nome}{_formatta_etichette(etichette)} {_formatta_valore(valore)}')
+        return righe
+
+
+class RegistroMetriche:
+    """
+    Metriche del processo esposte nel formato testuale di Prometheus (vedi /metrics).
+    Oltre a istogrammi e contatori aggiornati dall'applicazione, raccoglie alla lettura
+    le statistiche dei componenti che hanno un metodo statistiche() (client di ComicVine,
+    connessioni, cache, ...), esposte come valori istantanei.
+    """
+    def __init__(self, prefisso: str = 'comicsnap'):
+        """
+        Args:
+            prefisso: Prefisso dei nomi di tutte le metriche
+        """
+        self.prefisso = prefisso
+        self._lock = threading.Lock()
+        self._istogrammi: Dict[str, _Istogramma] = {}
+        self._contatori: Dict[str, _Contatore] = {}
+        self._statistiche: Dict[str, Callable[[], Optional[Dict[str, float]]]] = {}
+
+    def registra_istogramma(self, nome: str, descrizione: str, limiti: Sequence[float] = LIMITI_DURATA):
+        with self._lock:
+            self._istogrammi.setdefault(nome, _Istogramma(descrizione, limiti))
+
+    def registra_contatore(self, nome: str, descrizione: str):
+        with self._lock:
+            self._contatori.setdefault(nome, _Contatore(descrizione))
+
+    def registra_statistiche(self, nome: str, statistiche: Callable[[], Optional[Dict[str, float]]]):
+        """
+        Registra un componente le cui statistiche vengono lette ad ogni esportazione.
+
+        Args:
+            nome: Nome del componente, usato nel nome delle metriche
+            statistiche: Restituisce il dizionario delle statistiche, oppure None se il componente non è attivo
+        """
+        with self._lock:
+            self._statistiche[nome] = statistiche
+
+    def osserva(self, nome: str, valore: float, **etichette):
+        """
+        Aggiunge un'osservazione a un istogramma registrato.
+
+        Raises:
+            KeyError: se l'istogramma non è stato registrato
+        """
+        chiave = tuple(sorted((k, str(v)) for k, v in etichette.items()))
+        with self._lock:
+            self._istogrammi[nome].osserva(chiave, valore)
+
+    def incrementa(self, nome: str, valore: float = 1, **etichette):
+        """
+        Incrementa un contatore registrato.
+
+        Raises:
+            KeyError: se il contatore non è stato registrato
+        """
+        chiave = tuple(sorted((k, str(v)) for k, v in etichette.items()))
+        with self._lock:
+            self._contatori[nome].incrementa(chiave, valore)
+
+    def testo_prometheus(self) -> str:
+        """Restituisce tutte le metriche nel formato di esposizione testuale di Prometheus."""
+        righe = []
+        with self._lock:
+            for nome, istogramma in sorted(self._istogrammi.items()):
+                righe.extend(istogramma.righe(f'{self.prefisso}_{nome}'))
+            for nome, contatore in sorted(self._contatori.items()):
+                righe.extend(contatore.righe(f'{self.prefisso}_{nome}'))
+            componenti = sorted(self._statistiche.items())
+
+        # Le statistiche dei componenti vengono lette fuori dal lock del registro
+        for componente, statistiche in componenti:
+            try:
+                valori = statistiche()
+            except Exception as e:
+                print(f"Errore nella lettura delle statistiche di {componente}: {e}")
+                continue
+            for chiave, valore in sorted((valori or {}).items()):
+                if isinstance(valore, (int, float)) and not isinstance(valore, bool):
+                    nome = f'{self.prefisso}_{componente}_{chiave}'
+                    righe.append(f'# TYPE {nome} gauge')
+                    righe.append(f'{nome} {_formatta_valore(valore)}')
+        return '\n'.join(righe) + '\n'
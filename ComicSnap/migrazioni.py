@@ -0,0 +1,471 @@
+import sqlite3
+from typing import Callable, List, Tuple, Union
+
+# Una migrazione è una lista di istruzioni SQL oppure una funzione che riceve la connessione
+Migrazione = Union[List[str], Callable[[sqlite3.Connection], None]]
+
+
+def _aggiungi_colonne_mancanti(conn: sqlite3.Connection, tabella: str, colonne: List[Tuple[str, str]]):
+    esistenti = {row[1] for row in conn.execute(f'PRAGMA table_info({tabella})')}
+    for colonna, tipo in colonne:
+        if colonna not in esistenti:
+            conn.execute(f'ALTER TABLE {tabella} ADD COLUMN {colonna} {tipo}')
+
+
+def _schema_di_base(conn: sqlite3.Connection):
+    """
+    Versione 1: tabelle usate dall'applicazione. I database creati dalle versioni
+    precedenti possono avere tabelle già esistenti a cui mancano alcune colonne.
+    """
+    for istruzione in [
+        # Tabella per gli utenti registrati
+        '''CREATE TABLE IF NOT EXISTS utenti (
+            id INTEGER PRIMARY KEY,
+            username TEXT NOT NULL UNIQUE,
+            password_hash TEXT NOT NULL,
+            data_registrazione DATETIME DEFAULT CURRENT_TIMESTAMP
+        )''',
+        # Tabella per memorizzare le preferenze degli utenti sui fumetti
+        '''CREATE TABLE IF NOT EXISTS preferenze_utente (
+            id INTEGER PRIMARY KEY,
+            utente_id INTEGER,
+            comic_id TEXT NOT NULL,
+            genere TEXT NOT NULL,
+            peso REAL DEFAULT 1.0,
+            FOREIGN KEY (utente_id) REFERENCES utenti (id)
+        )''',
+        # Tabella per tracciare i fumetti letti dagli utenti con valutazione
+        '''CREATE TABLE IF NOT EXISTS fumetti_letti (
+            id INTEGER PRIMARY KEY,
+            utente_id INTEGER,
+            comic_id TEXT NOT NULL,
+            rating INTEGER CHECK (rating >= 1 AND rating <= 5),
+            data_lettura DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (utente_id) REFERENCES utenti (id)
+        )''',
+        # Tabella principale dei fumetti con informazioni dettagliate
+        '''CREATE TABLE IF NOT EXISTS fumetti (
+            id TEXT PRIMARY KEY,
+            titolo TEXT NOT NULL,
+            autore TEXT,
+            url_copertina TEXT,
+            data_aggiunta DATETIME DEFAULT CURRENT_TIMESTAMP,
+            editore TEXT,
+            anno INTEGER
+        )''',
+        # Tabella degli autori preferiti dagli utenti
+        '''CREATE TABLE IF NOT EXISTS autori_preferiti (
+            id INTEGER PRIMARY KEY,
+            utente_id INTEGER,
+            autore TEXT NOT NULL,
+            FOREIGN KEY (utente_id) REFERENCES utenti (id)
+        )''',
+        # Raccomandazioni precalcolate per ogni utente
+        '''CREATE TABLE IF NOT EXISTS raccomandazioni (
+            id INTEGER PRIMARY KEY,
+            utente_id INTEGER,
+            comic_id TEXT NOT NULL,
+            score REAL NOT NULL,
+            data_raccomandazione DATETIME DEFAULT CURRENT_TIMESTAMP,
+            titolo TEXT,
+            copertina TEXT,
+            editore TEXT,
+            anno TEXT,
+            autore TEXT,
+            FOREIGN KEY (utente_id) REFERENCES utenti (id)
+        )''',
+        # Stato del calcolo: istante dell'ultimo calcolo e dell'ultima modifica ai dati dell'utente
+        '''CREATE TABLE IF NOT EXISTS stato_raccomandazioni (
+            utente_id INTEGER PRIMARY KEY,
+            data_calcolo REAL,
+            data_modifica REAL,
+            FOREIGN KEY (utente_id) REFERENCES utenti (id)
+        )''',
+    ]:
+        conn.execute(istruzione)
+
+    _aggiungi_colonne_mancanti(conn, 'fumetti', [('autore', 'TEXT')])
+    _aggiungi_colonne_mancanti(conn, 'raccomandazioni', [
+        ('titolo', 'TEXT'), ('copertina', 'TEXT'), ('editore', 'TEXT'), ('anno', 'TEXT'), ('autore', 'TEXT')
+    ])
+    conn.execute('CREATE INDEX IF NOT EXISTS idx_raccomandazioni_utente ON raccomandazioni (utente_id, score DESC)')
+
+
+# Versione 2: la tabella fumetti del database distribuito ha colonne non più usate
+# (prezzo, genere, descrizione) e autore NOT NULL; viene ricostruita con lo schema del codice
+ALLINEA_FUMETTI = [
+    '''CREATE TABLE fumetti_nuova (
+        id TEXT PRIMARY KEY,
+        titolo TEXT NOT NULL,
+        autore TEXT,
+        url_copertina TEXT,
+        data_aggiunta DATETIME DEFAULT CURRENT_TIMESTAMP,
+        editore TEXT,
+        anno INTEGER
+    )''',
+    '''INSERT INTO fumetti_nuova (id, titolo, autore, url_copertina, data_aggiunta, editore, anno)
+       SELECT id, titolo, autore, url_copertina, data_aggiunta, editore, anno FROM fumetti''',
+    'DROP TABLE fumetti',
+    'ALTER TABLE fumetti_nuova RENAME TO fumetti',
+]
+
+def _sposta_duplicati(conn: sqlite3.Connection, tabella: str) -> int:
+    # Copia in <tabella>_duplicati le righe con la stessa coppia (utente_id, comic_id) di una
+    # riga inserita dopo, poi le elimina: si mantiene l'ultima riga e le altre restano recuperabili
+    duplicati = f'''SELECT * FROM {tabella} WHERE id NOT IN (
+        SELECT MAX(id) FROM {tabella} GROUP BY utente_id, comic_id
+    )'''
+    numero = conn.execute(f'SELECT COUNT(*) FROM ({duplicati})').fetchone()[0]
+    if numero:
+        conn.execute(f'CREATE TABLE IF NOT EXISTS {tabella}_duplicati AS {duplicati} LIMIT 0')
+        conn.execute(f'INSERT INTO {tabella}_duplicati {duplicati}')
+        conn.execute(f'DELETE FROM {tabella} WHERE id IN (SELECT id FROM {tabella}_duplicati)')
+        print(f"Migrazione 3: {numero} righe duplicate di {tabella} spostate in {tabella}_duplicati")
+    return numero
+
+
+def _indici_utente_fumetto(conn: sqlite3.Connection):
+    """
+    Versione 3: indici per le ricerche per (utente_id, comic_id). Prima di rendere unica la
+    coppia i duplicati vengono spostati in una tabella di backup (_sposta_duplicati).
+    """
+    _sposta_duplicati(conn, 'fumetti_letti')
+    _sposta_duplicati(conn, 'preferenze_utente')
+    for istruzione in [
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_fumetti_letti_utente_fumetto ON fumetti_letti (utente_id, comic_id)',
+        'CREATE UNIQUE INDEX IF NOT EXISTS idx_preferenze_utente_fumetto ON preferenze_utente (utente_id, comic_id)',
+        # Indici coprenti per il join dei rating con gli editori (ricalcolo del profilo per editore)
+        'CREATE INDEX IF NOT EXISTS idx_fumetti_letti_rating ON fumetti_letti (utente_id, comic_id, rating)',
+        'CREATE INDEX IF NOT EXISTS idx_fumetti_editore ON fumetti (id, editore)',
+        # Utenti che hanno letto un fumetto, per il filtraggio collaborativo
+        'CREATE INDEX IF NOT EXISTS idx_fumetti_letti_fumetto ON fumetti_letti (comic_id, utente_id, rating)',
+        'CREATE INDEX IF NOT EXISTS idx_autori_preferiti_utente ON autori_preferiti (utente_id)',
+    ]:
+        conn.execute(istruzione)
+
+# Valori segnaposto salvati da aggiungi_fumetto_letto quando il client non invia autore o editore:
+# non vengono indicizzati, altrimenti una ricerca di "non" troverebbe quasi tutto il catalogo
+_AUTORE_INDICIZZATO = "CASE WHEN new.autore IN ('Autore non specificato', 'Non specificato') THEN NULL ELSE new.autore END"
+_EDITORE_INDICIZZATO = "CASE WHEN new.editore IN ('Editore non specificato', 'Non specificato') THEN NULL ELSE new.editore END"
+
+# Versione 4: catalogo locale con indice full-text su titolo, autore ed editore dei fumetti,
+# più un indice a trigrammi dei titoli per la ricerca approssimata. Gli indici hanno una copia
+# del testo e sono collegati ai fumetti tramite comic_id (non tramite rowid, che VACUUM può
+# rinumerare); i trigger li tengono allineati alla tabella fumetti
+CATALOGO_FULL_TEXT = [
+    '''CREATE VIRTUAL TABLE IF NOT EXISTS catalogo_fts USING fts5(
+        comic_id UNINDEXED, titolo, autore, editore,
+        tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+    )''',
+    '''CREATE VIRTUAL TABLE IF NOT EXISTS catalogo_trigrammi USING fts5(
+        comic_id UNINDEXED, titolo, tokenize = 'trigram'
+    )''',
+    f'''CREATE TRIGGER IF NOT EXISTS fumetti_catalogo_inserimento AFTER INSERT ON fumetti BEGIN
+        INSERT INTO catalogo_fts (comic_id, titolo, autore, editore)
+        VALUES (new.id, new.titolo, {_AUTORE_INDICIZZATO}, {_EDITORE_INDICIZZATO});
+        INSERT INTO catalogo_trigrammi (comic_id, titolo) VALUES (new.id, new.titolo);
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS fumetti_catalogo_modifica AFTER UPDATE OF id, titolo, autore, editore ON fumetti
+    WHEN old.id IS NOT new.id OR old.titolo IS NOT new.titolo
+      OR old.autore IS NOT new.autore OR old.editore IS NOT new.editore
+    BEGIN
+        DELETE FROM catalogo_fts WHERE comic_id = old.id;
+        DELETE FROM catalogo_trigrammi WHERE comic_id = old.id;
+        INSERT INTO catalogo_fts (comic_id, titolo, autore, editore)
+        VALUES (new.id, new.titolo, {_AUTORE_INDICIZZATO}, {_EDITORE_INDICIZZATO});
+        INSERT INTO catalogo_trigrammi (comic_id, titolo) VALUES (new.id, new.titolo);
+    END''',
+    '''CREATE TRIGGER IF NOT EXISTS fumetti_catalogo_eliminazione AFTER DELETE ON fumetti BEGIN
+        DELETE FROM catalogo_fts WHERE comic_id = old.id;
+        DELETE FROM catalogo_trigrammi WHERE comic_id = old.id;
+    END''',
+    # Indicizza i fumetti già presenti
+    f'''INSERT INTO catalogo_fts (comic_id, titolo, autore, editore)
+        SELECT id, titolo, {_AUTORE_INDICIZZATO.replace('new.', '')}, {_EDITORE_INDICIZZATO.replace('new.', '')}
+        FROM fumetti''',
+    'INSERT INTO catalogo_trigrammi (comic_id, titolo) SELECT id, titolo FROM fumetti',
+]
+
+# Versione 5: avanzamento dell'importazione del catalogo da ComicVine (ingestione.py),
+# una riga per ogni sorgente (intervallo di date o editore)
+STATO_INGESTIONE = [
+    '''CREATE TABLE IF NOT EXISTS ingestione_stato (
+        sorgente TEXT PRIMARY KEY,
+        posizione INTEGER NOT NULL DEFAULT 0,
+        totale INTEGER,
+        righe INTEGER NOT NULL DEFAULT 0,
+        aggiornato_il REAL
+    )''',
+]
+
+# Versione 6: i candidati alle raccomandazioni vengono letti dal catalogo per editore
+# (candidati.CandidatiEditoriPreferiti); l'indice su (id, editore) non serve a questa ricerca
+INDICE_CANDIDATI_EDITORE = [
+    'CREATE INDEX IF NOT EXISTS idx_fumetti_per_editore ON fumetti (editore, id)',
+]
+
+# Versione 7: indice di similarità tra fumetti per il filtraggio collaborativo basato sui fumetti,
+# ricostruito offline da similarita_fumetti.py; la chiave primaria raggruppa i vicini di ogni fumetto
+SIMILARITA_FUMETTI = [
+    '''CREATE TABLE IF NOT EXISTS similarita_fumetti (
+        comic_id TEXT NOT NULL,
+        vicino_id TEXT NOT NULL,
+        similarita REAL NOT NULL,
+        PRIMARY KEY (comic_id, vicino_id)
+    ) WITHOUT ROWID''',
+]
+
+
+def _contributo_coppie(riga: str, segno: str) -> str:
+    # Somma (segno '') o sottrae (segno '-') il contributo del rating di una riga di fumetti_letti
+    # alle coppie che il suo utente forma con gli altri utenti che hanno valutato lo stesso fumetto
+    return f'''INSERT INTO somme_similarita_utenti (utente_a, utente_b, prodotto, norma_a, norma_b)
+        SELECT MIN({riga}.utente_id, fl.utente_id), MAX({riga}.utente_id, fl.utente_id),
+               {segno}({riga}.rating * fl.rating),
+               {segno}(CASE WHEN {riga}.utente_id < fl.utente_id THEN {riga}.rating * {riga}.rating ELSE fl.rating * fl.rating END),
+               {segno}(CASE WHEN {riga}.utente_id < fl.utente_id THEN fl.rating * fl.rating ELSE {riga}.rating * {riga}.rating END)
+        FROM fumetti_letti fl
+        WHERE fl.comic_id = {riga}.comic_id AND fl.utente_id != {riga}.utente_id AND fl.rating IS NOT NULL
+          AND {riga}.utente_id IS NOT NULL AND {riga}.rating IS NOT NULL
+        ON CONFLICT (utente_a, utente_b) DO UPDATE SET
+            prodotto = prodotto + excluded.prodotto,
+            norma_a = norma_a + excluded.norma_a,
+            norma_b = norma_b + excluded.norma_b;'''
+
+
+# Coppie che non hanno più fumetti valutati in comune dopo la rimozione di un rating
+_RIMUOVI_COPPIE_VUOTE = '''DELETE FROM somme_similarita_utenti
+        WHERE (utente_a = old.utente_id OR utente_b = old.utente_id) AND prodotto <= 0;'''
+
+# Ricalcolo completo delle somme dai rating (usato anche da somme_similarita.py)
+RICALCOLO_SOMME_SIMILARITA = '''INSERT INTO somme_similarita_utenti (utente_a, utente_b, prodotto, norma_a, norma_b)
+    SELECT a.utente_id, b.utente_id, SUM(a.rating * b.rating), SUM(a.rating * a.rating), SUM(b.rating * b.rating)
+    FROM fumetti_letti a
+    JOIN fumetti_letti b ON b.comic_id = a.comic_id AND b.utente_id > a.utente_id
+    WHERE a.rating IS NOT NULL AND b.rating IS NOT NULL
+    GROUP BY a.utente_id, b.utente_id'''
+
+# Versione 8: somme per coppia di utenti (utente_a < utente_b) su cui si calcola la similarità coseno:
+# prodotto scalare e norme al quadrato ristretti ai fumetti valutati da entrambi. La tabella resta
+# vuota finché la similarità incrementale non viene attivata (somme_similarita.attiva_manutenzione)
+SOMME_SIMILARITA_UTENTI = [
+    '''CREATE TABLE IF NOT EXISTS somme_similarita_utenti (
+        utente_a INTEGER NOT NULL,
+        utente_b INTEGER NOT NULL,
+        prodotto REAL NOT NULL,
+        norma_a REAL NOT NULL,
+        norma_b REAL NOT NULL,
+        PRIMARY KEY (utente_a, utente_b)
+    ) WITHOUT ROWID''',
+    'CREATE INDEX IF NOT EXISTS idx_somme_similarita_utente_b ON somme_similarita_utenti (utente_b, utente_a)',
+]
+
+# Trigger che mantengono le somme della versione 8, installati solo con la similarità incrementale:
+# ad ogni rating inserito, modificato o eliminato applicano solo la variazione delle coppie che
+# condividono quel fumetto, quindi ogni scrittura costa in proporzione ai lettori del fumetto.
+# Gli ID di utente e fumetto di una lettura non vengono mai modificati dall'applicazione
+TRIGGER_SOMME_SIMILARITA = {
+    'fumetti_letti_somme_inserimento': f'''CREATE TRIGGER IF NOT EXISTS fumetti_letti_somme_inserimento AFTER INSERT ON fumetti_letti BEGIN
+        {_contributo_coppie('new', '')}
+    END''',
+    'fumetti_letti_somme_modifica': f'''CREATE TRIGGER IF NOT EXISTS fumetti_letti_somme_modifica AFTER UPDATE OF rating ON fumetti_letti
+    WHEN old.rating IS NOT new.rating
+    BEGIN
+        {_contributo_coppie('old', '-')}
+        {_contributo_coppie('new', '')}
+        {_RIMUOVI_COPPIE_VUOTE}
+    END''',
+    'fumetti_letti_somme_eliminazione': f'''CREATE TRIGGER IF NOT EXISTS fumetti_letti_somme_eliminazione AFTER DELETE ON fumetti_letti BEGIN
+        {_contributo_coppie('old', '-')}
+        {_RIMUOVI_COPPIE_VUOTE}
+    END''',
+}
+
+
+def _contributo_lettura(riga: str, segno: str) -> str:
+    # Somma (segno '') o sottrae (segno '-') il rating di una riga di fumetti_letti
+    # alle statistiche del suo utente per l'editore del fumetto
+    return f'''INSERT INTO profilo_utente_editori (utente_id, editore, letture, somma_rating, somma_quadrati)
+        SELECT {riga}.utente_id, f.editore, {segno}1, {segno}{riga}.rating, {segno}({riga}.rating * {riga}.rating)
+        FROM fumetti f
+        WHERE f.id = {riga}.comic_id AND f.editore IS NOT NULL
+          AND {riga}.utente_id IS NOT NULL AND {riga}.rating IS NOT NULL
+        ON CONFLICT (utente_id, editore) DO UPDATE SET
+            letture = letture + excluded.letture,
+            somma_rating = somma_rating + excluded.somma_rating,
+            somma_quadrati = somma_quadrati + excluded.somma_quadrati;'''
+
+
+def _contributo_fumetto(riga: str, segno: str) -> str:
+    # Somma o sottrae i rating di tutti i lettori di un fumetto alle statistiche per il suo editore,
+    # quando il fumetto entra nel catalogo dopo le letture o il suo editore cambia
+    return f'''INSERT INTO profilo_utente_editori (utente_id, editore, letture, somma_rating, somma_quadrati)
+        SELECT fl.utente_id, {riga}.editore, {segno}COUNT(*), {segno}SUM(fl.rating), {segno}SUM(fl.rating * fl.rating)
+        FROM fumetti_letti fl
+        WHERE fl.comic_id = {riga}.id AND {riga}.editore IS NOT NULL
+          AND fl.utente_id IS NOT NULL AND fl.rating IS NOT NULL
+        GROUP BY fl.utente_id
+        ON CONFLICT (utente_id, editore) DO UPDATE SET
+            letture = letture + excluded.letture,
+            somma_rating = somma_rating + excluded.somma_rating,
+            somma_quadrati = somma_quadrati + excluded.somma_quadrati;'''
+
+
+def _nuova_versione_profilo(utente: str) -> str:
+    # Incrementa la versione del profilo, che invalida le copie in memoria (profili.CacheProfili)
+    return f'''INSERT INTO profilo_utente (utente_id, versione) SELECT {utente}, 1 WHERE {utente} IS NOT NULL
+        ON CONFLICT (utente_id) DO UPDATE SET versione = versione + 1;'''
+
+
+# Versione dei profili dei lettori di un fumetto il cui editore è cambiato
+def _nuova_versione_lettori(riga: str) -> str:
+    return f'''INSERT INTO profilo_utente (utente_id, versione)
+        SELECT DISTINCT utente_id, 1 FROM fumetti_letti WHERE comic_id = {riga}.id AND utente_id IS NOT NULL
+        ON CONFLICT (utente_id) DO UPDATE SET versione = versione + 1;'''
+
+
+# Editori che non hanno più letture con rating dopo una rimozione
+_RIMUOVI_EDITORI_VUOTI = 'DELETE FROM profilo_utente_editori WHERE utente_id = {} AND letture <= 0;'
+
+# Editore rimasto senza letture con rating per i lettori di un fumetto tolto all'editore
+_RIMUOVI_EDITORE_VUOTO_LETTORI = '''DELETE FROM profilo_utente_editori
+        WHERE editore = old.editore AND letture <= 0
+          AND utente_id IN (SELECT utente_id FROM fumetti_letti WHERE comic_id = old.id);'''
+
+# Ricalcolo completo delle statistiche per editore dai rating
+RICALCOLO_PROFILO_EDITORI = '''INSERT INTO profilo_utente_editori (utente_id, editore, letture, somma_rating, somma_quadrati)
+    SELECT fl.utente_id, f.editore, COUNT(*), SUM(fl.rating), SUM(fl.rating * fl.rating)
+    FROM fumetti_letti fl
+    JOIN fumetti f ON f.id = fl.comic_id
+    WHERE f.editore IS NOT NULL AND fl.utente_id IS NOT NULL AND fl.rating IS NOT NULL
+    GROUP BY fl.utente_id, f.editore'''
+
+# Versione 9: profilo dei gusti materializzato. Per ogni utente e editore numero, somma e somma dei
+# quadrati dei rating (da cui gli editori preferiti senza il join con fumetti e il GROUP BY), più una
+# versione del profilo incrementata ad ogni modifica di letture, preferenze o editori dei fumetti letti.
+# Come per le somme della versione 8, i trigger applicano solo la variazione di ogni modifica
+PROFILO_UTENTE = [
+    '''CREATE TABLE IF NOT EXISTS profilo_utente_editori (
+        utente_id INTEGER NOT NULL,
+        editore TEXT NOT NULL,
+        letture INTEGER NOT NULL,
+        somma_rating REAL NOT NULL,
+        somma_quadrati REAL NOT NULL,
+        PRIMARY KEY (utente_id, editore)
+    ) WITHOUT ROWID''',
+    '''CREATE TABLE IF NOT EXISTS profilo_utente (
+        utente_id INTEGER PRIMARY KEY,
+        versione INTEGER NOT NULL
+    )''',
+    f'''CREATE TRIGGER IF NOT EXISTS fumetti_letti_profilo_inserimento AFTER INSERT ON fumetti_letti BEGIN
+        {_contributo_lettura('new', '')}
+        {_nuova_versione_profilo('new.utente_id')}
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS fumetti_letti_profilo_modifica AFTER UPDATE OF rating ON fumetti_letti
+    WHEN old.rating IS NOT new.rating
+    BEGIN
+        {_contributo_lettura('old', '-')}
+        {_contributo_lettura('new', '')}
+        {_RIMUOVI_EDITORI_VUOTI.format('old.utente_id')}
+        {_nuova_versione_profilo('new.utente_id')}
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS fumetti_letti_profilo_eliminazione AFTER DELETE ON fumetti_letti BEGIN
+        {_contributo_lettura('old', '-')}
+        {_RIMUOVI_EDITORI_VUOTI.format('old.utente_id')}
+        {_nuova_versione_profilo('old.utente_id')}
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS fumetti_profilo_inserimento AFTER INSERT ON fumetti BEGIN
+        {_contributo_fumetto('new', '')}
+        {_nuova_versione_lettori('new')}
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS fumetti_profilo_modifica AFTER UPDATE OF editore ON fumetti
+    WHEN old.editore IS NOT new.editore
+    BEGIN
+        {_contributo_fumetto('old', '-')}
+        {_contributo_fumetto('new', '')}
+        {_RIMUOVI_EDITORE_VUOTO_LETTORI}
+        {_nuova_versione_lettori('new')}
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS fumetti_profilo_eliminazione AFTER DELETE ON fumetti BEGIN
+        {_contributo_fumetto('old', '-')}
+        {_RIMUOVI_EDITORE_VUOTO_LETTORI}
+        {_nuova_versione_lettori('old')}
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS preferenze_utente_profilo_inserimento AFTER INSERT ON preferenze_utente BEGIN
+        {_nuova_versione_profilo('new.utente_id')}
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS preferenze_utente_profilo_modifica AFTER UPDATE ON preferenze_utente BEGIN
+        {_nuova_versione_profilo('old.utente_id')}
+        {_nuova_versione_profilo('new.utente_id')}
+    END''',
+    f'''CREATE TRIGGER IF NOT EXISTS preferenze_utente_profilo_eliminazione AFTER DELETE ON preferenze_utente BEGIN
+        {_nuova_versione_profilo('old.utente_id')}
+    END''',
+    # Statistiche dai rating già presenti
+    RICALCOLO_PROFILO_EDITORI,
+]
+
+# Elenco ordinato delle migrazioni: la posizione (a partire da 1) è il numero di versione
+MIGRAZIONI: List[Migrazione] = [
+    _schema_di_base,
+    ALLINEA_FUMETTI,
+    _indici_utente_fumetto,
+    CATALOGO_FULL_TEXT,
+    STATO_INGESTIONE,
+    INDICE_CANDIDATI_EDITORE,
+    SIMILARITA_FUMETTI,
+    SOMME_SIMILARITA_UTENTI,
+    PROFILO_UTENTE,
+]
+
+
+def versione_corrente(conn: sqlite3.Connection) -> int:
+    return conn.execute('PRAGMA user_version').fetchone()[0]
+
+
+def applica_migrazioni(conn: sqlite3.Connection) -> int:
+    """
+    Porta lo schema del database all'ultima versione. La versione raggiunta è salvata
+    in PRAGMA user_version e ogni migrazione viene eseguita in una transazione che prende
+    subito il lock di scrittura, così più processi avviati insieme non la eseguono due volte.
+
+    Args:
+        conn: Connessione al database SQLite
+    Returns:
+        La versione dello schema dopo le migrazioni
+    """
+    versione = versione_corrente(conn)
+    for numero, migrazione in enumerate(MIGRAZIONI, start=1):
+        if numero <= versione:
+            continue
+        conn.commit()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            # Un altro processo può aver applicato la migrazione mentre si attendeva il lock
+            if versione_corrente(conn) >= numero:
+                conn.rollback()
+                versione = versione_corrente(conn)
+                continue
+            if callable(migrazione):
+                migrazione(conn)
+            else:
+                for istruzione in migrazione:
+                    conn.execute(istruzione)
+            conn.execute(f'PRAGMA user_version = {numero}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        versione = numero
+    return versione
+
+
+# Applica le migrazioni al database configurato: python migrazioni.py
+if __name__ == '__main__':
+    from config import Config
+
+    connessione = sqlite3.connect(Config.DATABASE_PATH)
+    try:
+        print(f"Schema del database alla versione {applica_migrazioni(connessione)}")
+    finally:
+        connessione.close()
@@ -0,0 +1,121 @@
+import heapq
+import sqlite3
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Dict, FrozenSet, List, Mapping, Tuple
+
+
+@dataclass(frozen=True)
+class ProfiloGusti:
+    """
+    Profilo dei gusti di un utente letto dalle tabelle materializzate (migrazione 9).
+    È condiviso tra le richieste tramite CacheProfili, quindi anche i dizionari sono in sola lettura.
+    """
+    utente_id: int
+    versione: int
+    # Per ogni editore: numero di letture con rating, somma e somma dei quadrati dei rating
+    editori: Mapping[str, Tuple[int, float, float]]
+    fumetti_letti: FrozenSet[str]
+    preferenze: Mapping[str, float]
+
+    def editori_preferiti(self, numero: int = 3) -> List[Tuple[str, float]]:
+        """
+        Restituisce gli editori con il rating medio più alto.
+
+        Args:
+            numero: Numero massimo di editori
+        Returns:
+            Lista di tuple (editore, rating_medio) ordinate per rating decrescente
+        """
+        medie = ((editore, somma / letture) for editore, (letture, somma, _) in self.editori.items())
+        return heapq.nlargest(numero, medie, key=lambda coppia: coppia[1])
+
+
+def versione_profilo(conn: sqlite3.Connection, utente_id: int) -> int:
+    # Un utente senza letture né preferenze non ha ancora una riga: versione 0
+    riga = conn.execute('SELECT versione FROM profilo_utente WHERE utente_id = ?', (utente_id,)).fetchone()
+    return riga[0] if riga else 0
+
+
+def carica_profilo(conn: sqlite3.Connection, utente_id: int) -> ProfiloGusti:
+    """
+    Legge il profilo di un utente con tre letture per chiave, senza join né aggregazioni.
+
+    Args:
+        conn: Connessione al database SQLite
+        utente_id: ID dell'utente
+    Returns:
+        Il profilo dell'utente
+    """
+    # La versione è letta per prima: una modifica concorrente rende i dati più recenti
+    # della versione, e la copia in memoria viene ricaricata alla richiesta successiva
+    versione = versione_profilo(conn, utente_id)
+    editori = conn.execute('''
+        SELECT editore, letture, somma_rating, somma_quadrati
+        FROM profilo_utente_editori
+        WHERE utente_id = ? AND letture > 0
+    ''', (utente_id,)).fetchall()
+    fumetti_letti = conn.execute('SELECT comic_id FROM fumetti_letti WHERE utente_id = ?', (utente_id,)).fetchall()
+    preferenze = conn.execute('SELECT comic_id, peso FROM preferenze_utente WHERE utente_id = ?',
+                              (utente_id,)).fetchall()
+    return ProfiloGusti(
+        utente_id=utente_id,
+        versione=versione,
+        editori=MappingProxyType({editore: (letture, somma, quadrati) for editore, letture, somma, quadrati in editori}),
+        fumetti_letti=frozenset(str(riga[0]) for riga in fumetti_letti),
+        preferenze=MappingProxyType(dict(preferenze)),
+    )
+
+
+class CacheProfili:
+    """
+    LRU in memoria dei profili dei gusti. Ogni lettura controlla la versione del profilo nel
+    database con una sola query per chiave primaria: i trigger la incrementano ad ogni modifica,
+    quindi le copie restano valide anche quando i dati vengono scritti da un altro processo.
+    """
+    def __init__(self, dimensione_max: int = 10000):
+        """
+        Args:
+            dimensione_max: Numero massimo di profili tenuti in memoria
+        """
+        self.dimensione_max = dimensione_max
+        self._profili: 'OrderedDict[int, ProfiloGusti]' = OrderedDict()
+        self._lock = threading.Lock()
+        self._contatori = {'hit': 0, 'miss': 0, 'evizioni': 0}
+
+    def ottieni(self, conn: sqlite3.Connection, utente_id: int) -> ProfiloGusti:
+        """
+        Restituisce il profilo dell'utente, ricaricandolo se è cambiato dopo l'ultima lettura.
+
+        Args:
+            conn: Connessione al database SQLite
+            utente_id: ID dell'utente
+        Returns:
+            Il profilo dell'utente
+        """
+        versione = versione_profilo(conn, utente_id)
+        with self._lock:
+            profilo = self._profili.get(utente_id)
+            if profilo is not None and profilo.versione == versione:
+                self._profili.move_to_end(utente_id)
+                self._contatori['hit'] += 1
+                return profilo
+            self._contatori['miss'] += 1
+
+        profilo = carica_profilo(conn, utente_id)
+        with self._lock:
+            attuale = self._profili.get(utente_id)
+            # Un'altra richiesta può aver già salvato una versione più recente
+            if attuale is None or attuale.versione <= profilo.versione:
+                self._profili[utente_id] = profilo
+                self._profili.move_to_end(utente_id)
+            while len(self._profili) > self.dimensione_max:
+                self._profili.popitem(last=False)
+                self._contatori['evizioni'] += 1
+        return profilo
+
+    def statistiche(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._contatori, profili_in_memoria=len(self._profili))
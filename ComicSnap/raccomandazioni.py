@@ -1,234 +1,272 @@
 import sqlite3
-import requests
-import xml.etree.ElementTree as ET
-from typing import List, Dict, Any, Tuple
-import os
-from collections import defaultdict
+import time
+from typing import List, Dict, Optional, Iterable, Iterator, AbstractSet
+import heapq
+from matrice_rating import MatriceRating
+import similarita_fumetti
+import somme_similarita
+from vicini_approssimati import IndiceMinHash
+from profili import CacheProfili, ProfiloGusti, carica_profilo
+from metriche import RegistroMetriche
+from comicvine import Volume
+from candidati import (ArricchimentoComicVine, CandidatiDaiVicini, CandidatiEditoriPreferiti,
+                       GeneratoreCandidati, ProfiloUtente)
+
+# Candidati richiesti a ciascun generatore, come i risultati della vecchia ricerca su ComicVine
+CANDIDATI_PER_GENERATORE = 100
+
+# Filtraggi collaborativi disponibili: confronto con gli altri utenti al momento della richiesta,
+# oppure indice di similarità tra fumetti precalcolato (similarita_fumetti.py)
+FILTRAGGIO_UTENTI = 'utenti'
+FILTRAGGIO_FUMETTI = 'fumetti'
+
+def valuta_candidati(candidati: Iterable[Volume], editori_preferiti: Dict[str, float], fumetti_letti: AbstractSet[str],
+                     punteggi_collaborativi: Dict[str, float], preferenze: Dict[str, float],
+                     limite: int) -> List[Volume]:
+    """
+    Assegna lo score ai candidati e seleziona i migliori in un solo passaggio, con un heap di
+    dimensione limite invece di ordinare tutti i candidati. Lo score combina il rating medio
+    dell'editore (se preferito) e lo score collaborativo, moltiplicati per 1 + il peso della
+    preferenza esplicita; a parità di score vale l'ordine dei candidati.
+    
+    Args:
+        candidati: Volumi candidati, anche come iteratore
+        editori_preferiti: Dizionario con editore come chiave e rating medio come valore
+        fumetti_letti: ID dei fumetti già letti, che vengono scartati
+        punteggi_collaborativi: Dizionario con comic_id come chiave e score collaborativo come valore
+        preferenze: Dizionario con comic_id come chiave e peso della preferenza come valore
+        limite: Numero massimo di volumi da restituire
+    Returns:
+        I migliori volumi per score decrescente; lo score viene assegnato solo a questi
+    """
+    def valutati():
+        for volume in candidati:
+            volume_id = volume.id
+            if volume_id in fumetti_letti:
+                continue
+            score = editori_preferiti.get(volume.editore, 0) + punteggi_collaborativi.get(volume_id, 0)
+            peso = preferenze.get(volume_id)
+            if peso is not None:
+                score *= (1 + peso)
+            yield round(score, 2), volume
+
+    migliori = heapq.nlargest(limite, valutati(), key=lambda coppia: coppia[0])
+    for score, volume in migliori:
+        # Lo score viene salvato direttamente sul volume restituito
+        volume.score = score
+    return [volume for _, volume in migliori]
+
+def _misura_iteratore(iteratore: Iterable[Volume], durate: Dict[str, float], fase: str) -> Iterator[Volume]:
+    # Accumula in durate[fase] il solo tempo speso a produrre gli elementi, escluso quello
+    # di chi li consuma: separa la generazione dei candidati dalla loro valutazione
+    iteratore = iter(iteratore)
+    durate[fase] = 0.0
+    while True:
+        inizio = time.perf_counter()
+        try:
+            elemento = next(iteratore)
+        except StopIteration:
+            durate[fase] += time.perf_counter() - inizio
+            return
+        durate[fase] += time.perf_counter() - inizio
+        yield elemento
 
 class SistemaRaccomandazione:
     """
     Un sistema di raccomandazione per fumetti che utilizza sia il filtraggio collaborativo
     che le preferenze esplicite degli utenti per generare suggerimenti personalizzati.
     """
-    def __init__(self, db_connection: sqlite3.Connection):
+    def __init__(self, db_connection: sqlite3.Connection, vicini_max: Optional[int] = None,
+                 generatori: Optional[List[GeneratoreCandidati]] = None,
+                 arricchimento: Optional[ArricchimentoComicVine] = None, filtraggio: str = FILTRAGGIO_UTENTI,
+                 similarita_incrementale: bool = False, indice_vicini: Optional[IndiceMinHash] = None,
+                 profili: Optional[CacheProfili] = None, metriche: Optional[RegistroMetriche] = None):
         """
         Inizializza il sistema di raccomandazione.
         
         Args:
             db_connection: Connessione al database SQLite contenente i dati degli utenti
+            vicini_max: Numero massimo di utenti simili usati nel filtraggio collaborativo (None per tutti)
+            generatori: Fonti locali dei candidati (di default fumetti dei vicini ed editori preferiti)
+            arricchimento: Completa in background i metadati dei candidati mancanti nel catalogo
+            filtraggio: FILTRAGGIO_UTENTI o FILTRAGGIO_FUMETTI
+            similarita_incrementale: Usa le somme per coppia di utenti aggiornate ad ogni rating
+                invece della matrice dei rating, che va costruita leggendo tutti i rating
+            indice_vicini: Indice approssimato degli utenti simili; la sua matrice dei rating
+                sostituisce quella costruita dal sistema
+            profili: Cache in memoria dei profili dei gusti (None per leggerli ogni volta dal database)
+            metriche: Registro in cui osservare la durata delle fasi del calcolo
+                (istogramma raccomandazioni_fase_secondi, da registrare prima dell'uso)
+        Raises:
+            ValueError: Se il filtraggio non è tra quelli disponibili
         """
+        if filtraggio not in (FILTRAGGIO_UTENTI, FILTRAGGIO_FUMETTI):
+            raise ValueError(f"Filtraggio collaborativo sconosciuto: {filtraggio}")
         self.conn = db_connection
-        self.api_key = os.getenv('COMICVINE_API_KEY')  # Recupera la chiave API dalle variabili d'ambiente
-        self.base_url = "https://comicvine.gamespot.com/api/search/"
-        self.headers = {'User-Agent': 'Mozilla/5.0'}
+        self.filtraggio = filtraggio
+        self.similarita_incrementale = similarita_incrementale
+        self.indice_vicini = indice_vicini
+        self.vicini_max = vicini_max
+        self.profili = profili
+        self.metriche = metriche
+        if generatori is None:
+            generatori = [CandidatiDaiVicini(db_connection, arricchimento), CandidatiEditoriPreferiti(db_connection)]
+        self.generatori = generatori
+        self._matrice = None
 
-    def ottieni_preferenze_utente(self, utente_id: int) -> Dict[str, float]:
+    def ottieni_profilo(self, utente_id: int) -> ProfiloGusti:
         """
-        Recupera le preferenze esplicite dell'utente dal database.
+        Restituisce preferenze, fumetti letti e statistiche per editore dell'utente in un solo profilo,
+        dalla cache in memoria se configurata.
         
         Args:
             utente_id: ID dell'utente
         Returns:
-            Dizionario con comic_id come chiave e peso della preferenza come valore
-        """
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT comic_id, peso
-            FROM preferenze_utente
-            WHERE utente_id = ?
-        ''', (utente_id,))
-        return dict(cursor.fetchall())
-
-    def ottieni_editori_preferiti(self, utente_id: int) -> List[Tuple[str, float]]:
+            Il profilo dei gusti dell'utente
         """
-        Identifica i 3 editori preferiti dell'utente basandosi sui rating medi.
-        
-        Args:
-            utente_id: ID dell'utente
-        Returns:
-            Lista di tuple (editore, rating_medio) ordinate per rating decrescente
-        """
-        cursor = self.conn.cursor()
-        cursor.execute('''
-            SELECT f.editore, AVG(fl.rating) as rating_medio
-            FROM fumetti f
-            JOIN fumetti_letti fl ON f.id = fl.comic_id
-            WHERE fl.utente_id = ? AND f.editore IS NOT NULL
-            GROUP BY f.editore
-            ORDER BY rating_medio DESC
-            LIMIT 3
-        ''', (utente_id,))
-        return cursor.fetchall()
+        if self.profili is not None:
+            return self.profili.ottieni(self.conn, utente_id)
+        return carica_profilo(self.conn, utente_id)
 
-    def ottieni_fumetti_letti(self, utente_id: int) -> List[str]:
+    def matrice_rating(self) -> MatriceRating:
         """
-        Recupera l'elenco dei fumetti già letti dall'utente.
-        
-        Args:
-            utente_id: ID dell'utente
-        Returns:
-            Lista di ID dei fumetti letti
+        Restituisce la matrice sparsa dei rating, costruendola al primo utilizzo
+        con una sola scansione di fumetti_letti.
         """
-        cursor = self.conn.cursor()
-        cursor.execute('SELECT comic_id FROM fumetti_letti WHERE utente_id = ?', (utente_id,))
-        return [str(row[0]) for row in cursor.fetchall()]
+        if self._matrice is None:
+            if self.indice_vicini is not None:
+                self._matrice = self.indice_vicini.matrice
+            else:
+                self._matrice = MatriceRating.da_database(self.conn)
+        return self._matrice
 
     def calcola_similarita_utenti(self, utente_id: int) -> Dict[int, float]:
         """
         Calcola la similarità coseno tra l'utente dato e tutti gli altri utenti
         basandosi sui rating dei fumetti in comune.
+        Il calcolo avviene in un'unica operazione vettoriale sulla matrice dei rating.
         
         Args:
             utente_id: ID dell'utente
         Returns:
             Dizionario con user_id come chiave e similarità coseno come valore
         """
-        cursor = self.conn.cursor()
-        # Ottiene i rating dell'utente target
-        cursor.execute('''
-            SELECT comic_id, rating 
-            FROM fumetti_letti 
-            WHERE utente_id = ?
-        ''', (utente_id,))
-        ratings_utente = dict(cursor.fetchall())
-        
-        # Ottiene la lista degli altri utenti
-        cursor.execute('''
-            SELECT DISTINCT utente_id 
-            FROM fumetti_letti 
-            WHERE utente_id != ?
-        ''', (utente_id,))
-        altri_utenti = [row[0] for row in cursor.fetchall()]
-        
-        similarita = {}
-        for altro_utente in altri_utenti:
-            # Ottiene i rating dell'altro utente
-            cursor.execute('''
-                SELECT comic_id, rating 
-                FROM fumetti_letti 
-                WHERE utente_id = ?
-            ''', (altro_utente,))
-            ratings_altro = dict(cursor.fetchall())
-            
-            # Calcola similarità coseno solo se ci sono fumetti in comune
-            fumetti_comuni = set(ratings_utente.keys()) & set(ratings_altro.keys())
-            if fumetti_comuni:
-                numeratore = sum(ratings_utente[f] * ratings_altro[f] for f in fumetti_comuni)
-                denominatore = (sum(ratings_utente[f]**2 for f in fumetti_comuni) ** 0.5) * \
-                             (sum(ratings_altro[f]**2 for f in fumetti_comuni) ** 0.5)
-                similarita[altro_utente] = numeratore / denominatore if denominatore > 0 else 0
-        
-        return similarita
+        # Con l'indice approssimato si confrontano solo i candidati che condividono un bucket;
+        # gli utenti arrivati dopo la costruzione dell'indice usano il calcolo esatto
+        if self.indice_vicini is not None and self.indice_vicini.contiene(utente_id):
+            return self.indice_vicini.similarita_coseno(utente_id)
+        if self.similarita_incrementale:
+            return somme_similarita.similarita_utente(self.conn, utente_id)
+        return self.matrice_rating().similarita_coseno(utente_id)
 
-    def ottieni_raccomandazioni_collaborative(self, utente_id: int, similarita_utenti: Dict[int, float]) -> Dict[str, float]:
+    def ottieni_raccomandazioni_collaborative(self, utente_id: int, similarita_utenti: Dict[int, float],
+                                              vicini_max: Optional[int] = None) -> Dict[str, float]:
         """
         Genera raccomandazioni usando il filtraggio collaborativo basato su utenti.
-        Considera solo i fumetti con rating >= 4.
+        Considera solo i fumetti con rating >= 4 e, se richiesto, solo i vicini più simili.
         
         Args:
             utente_id: ID dell'utente
             similarita_utenti: Dizionario delle similarità con altri utenti
+            vicini_max: Numero massimo di vicini da considerare; se None si usa quello del sistema
         Returns:
             Dizionario con comic_id come chiave e score di raccomandazione come valore
         """
-        cursor = self.conn.cursor()
-        fumetti_raccomandati = defaultdict(float)
+        vicini_max = self.vicini_max if vicini_max is None else vicini_max
+        if vicini_max and len(similarita_utenti) > vicini_max:
+            similarita_utenti = dict(heapq.nlargest(vicini_max, similarita_utenti.items(), key=lambda x: x[1]))
         
-        for altro_utente, sim in similarita_utenti.items():
-            cursor.execute('''
-                SELECT comic_id, rating 
-                FROM fumetti_letti 
-                WHERE utente_id = ? AND rating >= 4
-            ''', (altro_utente,))
-            for comic_id, rating in cursor.fetchall():
-                fumetti_raccomandati[comic_id] += sim * rating
+        if self.similarita_incrementale:
+            return somme_similarita.punteggi_collaborativi(self.conn, similarita_utenti, rating_minimo=4)
+        return self.matrice_rating().punteggi_collaborativi(similarita_utenti, rating_minimo=4)
+
+    def ottieni_raccomandazioni_per_fumetti(self, utente_id: int) -> Dict[str, float]:
+        """
+        Genera raccomandazioni usando il filtraggio collaborativo basato sui fumetti: i vicini
+        dei fumetti valutati con rating >= 4 vengono letti dall'indice precalcolato.
+        Se l'indice non è ancora stato costruito si usa il filtraggio basato su utenti.
         
-        return fumetti_raccomandati
+        Args:
+            utente_id: ID dell'utente
+        Returns:
+            Dizionario con comic_id come chiave e score di raccomandazione come valore
+        """
+        if not similarita_fumetti.indice_presente(self.conn):
+            return self.ottieni_raccomandazioni_collaborative(utente_id, self.calcola_similarita_utenti(utente_id))
+        return similarita_fumetti.punteggi_per_fumetti(self.conn, utente_id, rating_minimo=4)
 
-    def genera_raccomandazioni(self, utente_id: int, limit: int = 10) -> List[Dict[str, Any]]:
+    def genera_raccomandazioni(self, utente_id: int, limit: int = 10) -> List[Volume]:
         """
         Genera raccomandazioni finali combinando:
         - Preferenze esplicite dell'utente
         - Editori preferiti
         - Raccomandazioni collaborative
-        - Dati da API esterna (ComicVine)
+        I candidati provengono dai generatori locali, quindi non serve attendere ComicVine
         
         Args:
             utente_id: ID dell'utente
             limit: Numero massimo di raccomandazioni da restituire
         Returns:
-            Lista di dizionari contenenti le informazioni dei fumetti raccomandati
+            Lista dei volumi raccomandati, con lo score valorizzato
         """
         try:
-            # Raccolta dati utente
-            preferenze = self.ottieni_preferenze_utente(utente_id)
-            editori_preferiti = self.ottieni_editori_preferiti(utente_id)
-            fumetti_letti = self.ottieni_fumetti_letti(utente_id)
+            # Durata di ogni fase del calcolo, in secondi
+            durate = {}
+            inizio = time.perf_counter()
             
-            # Calcolo raccomandazioni collaborative
-            similarita_utenti = self.calcola_similarita_utenti(utente_id)
-            fumetti_raccomandati = self.ottieni_raccomandazioni_collaborative(utente_id, similarita_utenti)
+            # Raccolta dati utente dal profilo materializzato
+            profilo_gusti = self.ottieni_profilo(utente_id)
+            preferenze = profilo_gusti.preferenze
+            editori_preferiti = profilo_gusti.editori_preferiti()
+            fumetti_letti = profilo_gusti.fumetti_letti
+            durate['profilo'], inizio = time.perf_counter() - inizio, time.perf_counter()
             
-            # Preparazione query API usando gli editori preferiti
-            query = ' OR '.join(editore for editore, _ in editori_preferiti) if editori_preferiti else 'comics'
-            params = {
-                'api_key': self.api_key,
-                'query': query,
-                'resources': 'volume',
-                'format': 'xml',
-                'limit': 100
-            }
+            # Calcolo raccomandazioni collaborative
+            if self.filtraggio == FILTRAGGIO_FUMETTI:
+                fumetti_raccomandati = self.ottieni_raccomandazioni_per_fumetti(utente_id)
+            else:
+                similarita_utenti = self.calcola_similarita_utenti(utente_id)
+                durate['similarita'], inizio = time.perf_counter() - inizio, time.perf_counter()
+                fumetti_raccomandati = self.ottieni_raccomandazioni_collaborative(utente_id, similarita_utenti)
+            durate['collaborativo'], inizio = time.perf_counter() - inizio, time.perf_counter()
             
-            # Chiamata API
-            response = requests.get(self.base_url, headers=self.headers, params=params, timeout=10)
+            # Generazione dei candidati dai dati locali
+            profilo = ProfiloUtente(utente_id, editori_preferiti, fumetti_letti, fumetti_raccomandati)
             
-            raccomandazioni = []
-            if response.status_code == 200:
-                root = ET.fromstring(response.text)
-                volumes = root.findall(".//volume")
-                
-                # Elaborazione risultati API
-                for volume in volumes:
-                    volume_id = volume.find(".//id").text
-                    titolo = volume.find(".//name").text
-                    editore = volume.find(".//publisher/name").text
-                    
-                    # Filtra fumetti già letti e titoli non validi
-                    if (volume_id not in fumetti_letti and 
-                        titolo and titolo.strip() and titolo.lower() != "null"):
-                        
-                        # Calcolo score finale combinando diversi fattori
-                        score = 0
-                        # Bonus per editori preferiti
-                        if editore:
-                            for ed_pref, rating_medio in editori_preferiti:
-                                if editore == ed_pref:
-                                    score += rating_medio
-                        
-                        # Aggiunge score da raccomandazioni collaborative
-                        if volume_id in fumetti_raccomandati:
-                            score += fumetti_raccomandati[volume_id]
-                        
-                        # Moltiplica per preferenze esplicite se presenti
-                        if volume_id in preferenze:
-                            score *= (1 + preferenze[volume_id])
-                        
-                        # Creazione oggetto raccomandazione
-                        raccomandazioni.append({
-                            'id': volume_id,
-                            'titolo': titolo,
-                            'copertina': volume.find(".//image/small_url").text,
-                            'editore': editore,
-                            'anno': volume.find(".//start_year").text if volume.find(".//start_year") is not None else "N/D",
-                            'score': round(score, 2)
-                        })
-                
-                # Ordinamento finale e limite risultati
-                raccomandazioni.sort(key=lambda x: x['score'], reverse=True)
-                raccomandazioni = raccomandazioni[:limit]
+            # Valutazione dei candidati man mano che i generatori li producono e selezione dei migliori
+            candidati = _misura_iteratore(self.genera_candidati(profilo), durate, 'candidati')
+            raccomandazioni = valuta_candidati(candidati, dict(editori_preferiti), fumetti_letti,
+                                               fumetti_raccomandati, preferenze, limit)
+            durate['punteggio'] = time.perf_counter() - inizio - durate.get('candidati', 0)
             
+            if self.metriche is not None:
+                for fase, durata in durate.items():
+                    self.metriche.osserva('raccomandazioni_fase_secondi', durata, fase=fase)
             return raccomandazioni
             
         except Exception as e:
             print(f"Errore dettagliato: {e}")
-            return []
\ No newline at end of file
+            return []
+
+    def genera_candidati(self, profilo: ProfiloUtente) -> Iterator[Volume]:
+        """
+        Produce i candidati di tutti i generatori, senza duplicati: un volume proposto da più
+        generatori viene restituito una volta sola. Un generatore che fallisce viene saltato,
+        così le raccomandazioni restano disponibili con le altre fonti.
+        
+        Args:
+            profilo: Profilo dell'utente
+        Returns:
+            Iteratore dei volumi candidati
+        """
+        visti = set()
+        for generatore in self.generatori:
+            try:
+                volumi = generatore.genera(profilo, CANDIDATI_PER_GENERATORE)
+            except Exception as e:
+                print(f"Errore nel generatore di candidati {type(generatore).__name__}: {e}")
+                continue
+            for volume in volumi:
+                if volume.id not in visti:
+                    visti.add(volume.id)
+                    yield volume
\ No newline at end of file
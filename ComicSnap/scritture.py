@@ -0,0 +1,263 @@
+import queue
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, TimeoutError as FuturoScaduto
+from typing import Any, Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from archivio_raccomandazioni import segna_da_aggiornare
+
+
+def normalizza_lettura(dati: Any) -> Dict[str, Any]:
+    """
+    Valida un fumetto letto da importare, con gli stessi campi e valori predefiniti
+    di /aggiungi_fumetto_letto.
+
+    Args:
+        dati: Oggetto JSON ricevuto dal client
+    Returns:
+        Dizionario con comic_id, titolo, autore, url_copertina, editore, anno e rating
+    Raises:
+        ValueError: se mancano comic_id o titolo oppure il rating non è tra 1 e 5
+    """
+    if not isinstance(dati, dict):
+        raise ValueError('Ogni elemento deve essere un oggetto')
+
+    def testo(campo, predefinito=''):
+        valore = dati.get(campo)
+        return str(valore).strip() if valore is not None else predefinito
+
+    lettura = {
+        'comic_id': testo('comic_id'),
+        'titolo': testo('titolo'),
+        'autore': testo('autore', 'Autore non specificato'),
+        'url_copertina': testo('url_copertina') or '/static/comic-placeholder.png',
+        'editore': testo('editore', 'Non specificato'),
+        'anno': testo('anno', 'N/D'),
+        'rating': dati.get('rating'),
+    }
+    if not lettura['comic_id'] or not lettura['titolo']:
+        raise ValueError('Comic ID e Titolo sono richiesti')
+    rating = lettura['rating']
+    if rating is not None and (isinstance(rating, bool) or not isinstance(rating, int) or not 1 <= rating <= 5):
+        raise ValueError('Il rating deve essere un intero tra 1 e 5')
+    return lettura
+
+
+def importa_letture(conn: sqlite3.Connection, utente_id: int, letture: Sequence[Dict[str, Any]]) -> Dict[str, int]:
+    """
+    Registra in un'unica transazione i fumetti letti importati da un utente. I fumetti già
+    presenti tra i letti vengono individuati con una sola query e saltati, come fa
+    /aggiungi_fumetto_letto; a parità di comic_id nell'importazione vale l'ultimo.
+
+    Args:
+        conn: Connessione al database SQLite
+        utente_id: ID dell'utente
+        letture: Fumetti letti validati con normalizza_lettura
+    Returns:
+        Dizionario con il numero di fumetti importati e di quelli già presenti
+    """
+    nuove = {lettura['comic_id']: lettura for lettura in letture}
+    gia_letti = {str(riga[0]) for riga in conn.execute(
+        'SELECT comic_id FROM fumetti_letti WHERE utente_id = ?', (utente_id,))}
+    da_importare = [lettura for comic_id, lettura in nuove.items() if comic_id not in gia_letti]
+
+    try:
+        if da_importare:
+            conn.executemany('''
+                INSERT OR IGNORE INTO fumetti (id, titolo, autore, url_copertina, editore, anno)
+                VALUES (:comic_id, :titolo, :autore, :url_copertina, :editore, :anno)
+            ''', da_importare)
+            # Le letture aggiunte in parallelo da un'altra richiesta restano invariate
+            cursor = conn.executemany('''
+                INSERT INTO fumetti_letti (utente_id, comic_id, rating)
+                VALUES (?, ?, ?)
+                ON CONFLICT (utente_id, comic_id) DO NOTHING
+            ''', [(utente_id, lettura['comic_id'], lettura['rating']) for lettura in da_importare])
+            importati = cursor.rowcount
+            segna_da_aggiornare(conn, utente_id)
+        else:
+            importati = 0
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    return {'importati': importati, 'gia_presenti': len(nuove) - importati}
+
+
+class ErroreScritturaScaduta(Exception):
+    """La scrittura non è stata salvata entro l'attesa massima dello ScrittoreRaggruppato."""
+
+
+class _Scrittura:
+    """Istruzione in attesa di essere scritta dal ScrittoreRaggruppato."""
+    __slots__ = ('istruzione', 'parametri', 'utente_id', 'futuro')
+
+    def __init__(self, istruzione: str, parametri: Tuple, utente_id: Optional[int]):
+        self.istruzione = istruzione
+        self.parametri = parametri
+        self.utente_id = utente_id
+        self.futuro = Future()
+
+
+class ScrittoreRaggruppato:
+    """
+    Scrittore in background che raggruppa le scritture di singoli elementi arrivate da richieste
+    diverse in una sola transazione (group commit): invece di un commit, e quindi una sincronizzazione
+    su disco, per ogni richiesta ne viene eseguito uno ogni intervallo_secondi. Ogni richiesta attende
+    il commit della transazione che contiene la sua scrittura, quindi la risposta arriva solo quando
+    il dato è salvato. Un errore di una scrittura (ad esempio un vincolo violato) viene restituito
+    solo a chi l'ha richiesta, senza annullare le altre. Una richiesta non attende il commit per più
+    di attesa_secondi più intervallo_secondi: oltre riceve ErroreScritturaScaduta.
+    """
+    def __init__(self, connetti: Callable[[], sqlite3.Connection], intervallo_secondi: float = 0.005,
+                 scritture_max: int = 500, attesa_secondi: float = 5):
+        """
+        Inizializza lo scrittore, il cui thread viene avviato alla prima scrittura.
+
+        Args:
+            connetti: Restituisce la connessione da usare nel thread dello scrittore
+            intervallo_secondi: Attesa massima di altre scritture dopo la prima di una transazione
+            scritture_max: Numero massimo di scritture in una transazione
+            attesa_secondi: Attesa massima del commit oltre l'intervallo, di solito il busy timeout
+                del database
+        """
+        self.connetti = connetti
+        self.intervallo = intervallo_secondi
+        self.scritture_max = scritture_max
+        self.attesa = attesa_secondi
+        self._coda: 'queue.Queue[Optional[_Scrittura]]' = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+        self._contatori = {'scritture': 0, 'transazioni': 0, 'errori': 0, 'scadute': 0,
+                           'scritture_max_per_transazione': 0}
+
+    def scrivi(self, istruzione: str, parametri: Tuple = (), utente_id: Optional[int] = None):
+        """
+        Esegue un'istruzione di scrittura e attende il commit.
+
+        Args:
+            istruzione: Istruzione SQL (INSERT, UPDATE o DELETE)
+            parametri: Parametri dell'istruzione
+            utente_id: Utente le cui raccomandazioni vanno ricalcolate dopo la scrittura
+        Raises:
+            sqlite3.Error: l'errore dell'istruzione o del commit
+            ErroreScritturaScaduta: se il commit non arriva entro l'attesa massima
+        """
+        scrittura = _Scrittura(istruzione, parametri, utente_id)
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._esegui, daemon=True)
+                self._thread.start()
+        self._coda.put(scrittura)
+        try:
+            scrittura.futuro.result(timeout=self.attesa + self.intervallo)
+        except FuturoScaduto:
+            # Se è ancora in coda la scrittura viene annullata, altrimenti potrebbe essere salvata
+            # comunque dalla transazione in corso
+            annullata = scrittura.futuro.cancel()
+            with self._lock:
+                self._contatori['scadute'] += 1
+            raise ErroreScritturaScaduta('Scrittura annullata' if annullata else 'Esito della scrittura sconosciuto')
+
+    def chiudi(self):
+        """Completa le scritture in coda e ferma il thread."""
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._coda.put(None)
+            thread.join()
+
+    def statistiche(self) -> Dict[str, int]:
+        with self._lock:
+            return dict(self._contatori, in_coda=self._coda.qsize())
+
+    def _esegui(self):
+        conn = self.connetti()
+        while True:
+            prima = self._coda.get()
+            if prima is None:
+                return
+            lotto = [prima]
+            scadenza = time.monotonic() + self.intervallo
+            fine = False
+            while len(lotto) < self.scritture_max:
+                try:
+                    scrittura = self._coda.get(timeout=max(scadenza - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if scrittura is None:
+                    fine = True
+                    break
+                lotto.append(scrittura)
+            self._scrivi_lotto(conn, lotto)
+            if fine:
+                return
+
+    def _scrivi_lotto(self, conn: sqlite3.Connection, lotto: List[_Scrittura]):
+        # Le scritture già scadute e annullate da chi le aveva richieste non vengono eseguite
+        lotto = [scrittura for scrittura in lotto if scrittura.futuro.set_running_or_notify_cancel()]
+        if not lotto:
+            return
+        riuscite: List[_Scrittura] = []
+        try:
+            conn.execute('BEGIN IMMEDIATE')
+            for scrittura in lotto:
+                # Ogni scrittura nel suo savepoint: se fallisce si annulla solo quella
+                conn.execute('SAVEPOINT scrittura')
+                try:
+                    conn.execute(scrittura.istruzione, scrittura.parametri)
+                except sqlite3.Error as e:
+                    conn.execute('ROLLBACK TO scrittura')
+                    scrittura.futuro.set_exception(e)
+                else:
+                    riuscite.append(scrittura)
+                finally:
+                    conn.execute('RELEASE scrittura')
+            for utente_id in {s.utente_id for s in riuscite if s.utente_id is not None}:
+                segna_da_aggiornare(conn, utente_id)
+            conn.commit()
+        except Exception as e:
+            if conn.in_transaction:
+                conn.rollback()
+            for scrittura in lotto:
+                if not scrittura.futuro.done():
+                    scrittura.futuro.set_exception(e)
+            with self._lock:
+                self._contatori['errori'] += len(lotto)
+            return
+
+        for scrittura in riuscite:
+            scrittura.futuro.set_result(None)
+        with self._lock:
+            self._contatori['scritture'] += len(riuscite)
+            self._contatori['errori'] += len(lotto) - len(riuscite)
+            self._contatori['transazioni'] += 1
+            self._contatori['scritture_max_per_transazione'] = max(
+                self._contatori['scritture_max_per_transazione'], len(lotto))
+
+
+def esegui_scrittura(conn: sqlite3.Connection, scrittore: Optional[ScrittoreRaggruppato], istruzione: str,
+                     parametri: Iterable = (), utente_id: Optional[int] = None):
+    """
+    Esegue una scrittura di un singolo elemento: tramite lo scrittore raggruppato se configurato,
+    altrimenti direttamente sulla connessione della richiesta con un commit dedicato.
+
+    Args:
+        conn: Connessione della richiesta
+        scrittore: Scrittore raggruppato, oppure None
+        istruzione: Istruzione SQL di scrittura
+        parametri: Parametri dell'istruzione
+        utente_id: Utente le cui raccomandazioni vanno ricalcolate dopo la scrittura
+    Raises:
+        sqlite3.Error: l'errore dell'istruzione o del commit
+        ErroreScritturaScaduta: se lo scrittore raggruppato non salva la scrittura entro l'attesa massima
+    """
+    parametri = tuple(parametri)
+    if scrittore is not None:
+        scrittore.scrivi(istruzione, parametri, utente_id)
+        return
+    conn.execute(istruzione, parametri)
+    if utente_id is not None:
+        segna_da_aggiornare(conn, utente_id)
+    conn.commit()
@@ -0,0 +1,102 @@
+import argparse
+import sqlite3
+import time
+from typing import Dict, Iterator, Tuple
+
+import migrazioni
+from matrice_rating import MatriceRating
+
+# Vicini salvati per ogni fumetto
+VICINI_PER_FUMETTO = 50
+
+
+def calcola_indice(matrice: MatriceRating, vicini_per_fumetto: int = VICINI_PER_FUMETTO) -> Iterator[Tuple[str, str, float]]:
+    """
+    Calcola l'indice di similarità tra fumetti a partire dalla matrice dei rating.
+
+    Args:
+        matrice: Matrice dei rating
+        vicini_per_fumetto: Numero massimo di vicini per fumetto
+    Returns:
+        Iteratore di righe (comic_id, vicino_id, similarita)
+    """
+    for colonna, vicini, similarita in matrice.vicini_fumetti(vicini_per_fumetto):
+        comic_id = str(matrice.fumetti[colonna])
+        for vicino_id, valore in zip(matrice.fumetti[vicini].tolist(), similarita.tolist()):
+            yield comic_id, vicino_id, valore
+
+
+def salva_indice(conn: sqlite3.Connection, righe: Iterator[Tuple[str, str, float]]) -> int:
+    """
+    Sostituisce il contenuto di similarita_fumetti in un'unica transazione: le richieste
+    concorrenti continuano a leggere l'indice precedente fino al commit.
+
+    Args:
+        conn: Connessione al database SQLite
+        righe: Righe (comic_id, vicino_id, similarita)
+    Returns:
+        Numero di righe salvate
+    """
+    try:
+        conn.execute('DELETE FROM similarita_fumetti')
+        cursor = conn.executemany('INSERT INTO similarita_fumetti (comic_id, vicino_id, similarita) VALUES (?, ?, ?)',
+                                  righe)
+        salvate = cursor.rowcount
+        conn.commit()
+        return salvate
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def indice_presente(conn: sqlite3.Connection) -> bool:
+    return conn.execute('SELECT 1 FROM similarita_fumetti LIMIT 1').fetchone() is not None
+
+
+def punteggi_per_fumetti(conn: sqlite3.Connection, utente_id: int, rating_minimo: float = 4) -> Dict[str, float]:
+    """
+    Genera raccomandazioni dai fumetti apprezzati dall'utente: lo score di un fumetto è la somma
+    di similarità * rating sui fumetti dell'utente con rating >= rating_minimo di cui è vicino.
+    Sono letti solo i rating dell'utente e i loro vicini nell'indice, senza confronti con gli altri utenti.
+
+    Args:
+        conn: Connessione al database SQLite
+        utente_id: ID dell'utente
+        rating_minimo: Rating minimo perché un fumetto dell'utente venga considerato
+    Returns:
+        Dizionario con comic_id come chiave e score di raccomandazione come valore
+    """
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT s.vicino_id, SUM(s.similarita * fl.rating)
+        FROM fumetti_letti fl
+        JOIN similarita_fumetti s ON s.comic_id = fl.comic_id
+        WHERE fl.utente_id = ? AND fl.rating >= ?
+        GROUP BY s.vicino_id
+    ''', (utente_id, rating_minimo))
+    return dict(cursor.fetchall())
+
+
+# Job batch: python similarita_fumetti.py [--vicini N]
+# Da rieseguire periodicamente (ad esempio da cron) per includere i nuovi rating
+def main():
+    from config import Config
+
+    parser = argparse.ArgumentParser(description="Ricostruisce l'indice di similarità tra fumetti")
+    parser.add_argument('--vicini', type=int, default=VICINI_PER_FUMETTO, help='Vicini salvati per ogni fumetto')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(Config.DATABASE_PATH, timeout=Config.DB_BUSY_TIMEOUT_SECONDS)
+    try:
+        migrazioni.applica_migrazioni(conn)
+        inizio = time.perf_counter()
+        matrice = MatriceRating.da_database(conn)
+        salvate = salva_indice(conn, calcola_indice(matrice, args.vicini))
+        print(f"Indice di similarità: {salvate} coppie per {len(matrice.fumetti)} fumetti "
+              f"in {time.perf_counter() - inizio:.1f}s")
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,147 @@
+import math
+import sqlite3
+import time
+from collections import defaultdict
+from typing import Dict
+
+import migrazioni
+
+# Vicini letti per ogni query, sotto il limite di parametri di SQLite (SQLITE_MAX_VARIABLE_NUMBER,
+# 999 nelle versioni precedenti alla 3.32)
+VICINI_PER_QUERY = 500
+
+
+def similarita_utente(conn: sqlite3.Connection, utente_id: int) -> Dict[int, float]:
+    """
+    Calcola la similarità coseno tra l'utente dato e gli utenti con cui ha fumetti in comune
+    dalle somme per coppia, che i trigger di fumetti_letti mantengono aggiornate ad ogni rating.
+    Il risultato coincide con MatriceRating.similarita_coseno senza leggere tutti i rating.
+
+    Args:
+        conn: Connessione al database SQLite
+        utente_id: ID dell'utente
+    Returns:
+        Dizionario con user_id come chiave e similarità coseno come valore
+    """
+    cursor = conn.cursor()
+    cursor.execute('''
+        SELECT utente_b, prodotto, norma_a, norma_b FROM somme_similarita_utenti WHERE utente_a = ?
+        UNION ALL
+        SELECT utente_a, prodotto, norma_b, norma_a FROM somme_similarita_utenti WHERE utente_b = ?
+    ''', (utente_id, utente_id))
+    similarita = {}
+    for altro, prodotto, norma_propria, norma_altro in cursor.fetchall():
+        denominatore = math.sqrt(norma_propria) * math.sqrt(norma_altro)
+        similarita[altro] = prodotto / denominatore if denominatore > 0 else 0.0
+    return similarita
+
+
+def punteggi_collaborativi(conn: sqlite3.Connection, similarita: Dict[int, float],
+                           rating_minimo: float = 4) -> Dict[str, float]:
+    """
+    Aggrega i rating dei vicini pesati per la loro similarità, leggendo solo le righe
+    dei vicini dall'indice su (utente_id, comic_id, rating), al massimo VICINI_PER_QUERY per query.
+    Il risultato coincide con MatriceRating.punteggi_collaborativi.
+
+    Args:
+        conn: Connessione al database SQLite
+        similarita: Dizionario con user_id dei vicini come chiave e similarità come valore
+        rating_minimo: Rating minimo perché un fumetto del vicino venga considerato
+    Returns:
+        Dizionario con comic_id come chiave e score di raccomandazione come valore
+    """
+    vicini = list(similarita)
+    punteggi = defaultdict(float)
+    for inizio in range(0, len(vicini), VICINI_PER_QUERY):
+        blocco = vicini[inizio:inizio + VICINI_PER_QUERY]
+        cursor = conn.execute(f'''
+            SELECT utente_id, comic_id, rating FROM fumetti_letti
+            WHERE utente_id IN ({','.join('?' * len(blocco))}) AND rating >= ?
+        ''', (*blocco, rating_minimo))
+        for vicino, comic_id, rating in cursor:
+            punteggi[str(comic_id)] += similarita[vicino] * rating
+    return dict(punteggi)
+
+
+def manutenzione_attiva(conn: sqlite3.Connection) -> bool:
+    """Indica se i trigger che aggiornano le somme ad ogni rating sono installati."""
+    installati = conn.execute(f'''
+        SELECT COUNT(*) FROM sqlite_master
+        WHERE type = 'trigger' AND name IN ({','.join('?' * len(migrazioni.TRIGGER_SOMME_SIMILARITA))})
+    ''', tuple(migrazioni.TRIGGER_SOMME_SIMILARITA)).fetchone()[0]
+    return installati == len(migrazioni.TRIGGER_SOMME_SIMILARITA)
+
+
+def attiva_manutenzione(conn: sqlite3.Connection):
+    """
+    Installa i trigger che aggiornano le somme ad ogni rating e, se non erano già installati,
+    ricalcola le somme dai rating esistenti (costo proporzionale alle coppie di utenti).
+
+    Args:
+        conn: Connessione al database SQLite
+    """
+    conn.commit()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        # Un altro processo può averli installati mentre si attendeva il lock
+        if not manutenzione_attiva(conn):
+            for istruzione in migrazioni.TRIGGER_SOMME_SIMILARITA.values():
+                conn.execute(istruzione)
+            conn.execute('DELETE FROM somme_similarita_utenti')
+            conn.execute(migrazioni.RICALCOLO_SOMME_SIMILARITA)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def disattiva_manutenzione(conn: sqlite3.Connection):
+    """
+    Rimuove i trigger delle somme e svuota la tabella, così le scritture dei rating non pagano
+    l'aggiornamento delle coppie quando la similarità incrementale non è in uso.
+
+    Args:
+        conn: Connessione al database SQLite
+    """
+    conn.commit()
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        for nome in migrazioni.TRIGGER_SOMME_SIMILARITA:
+            conn.execute(f'DROP TRIGGER IF EXISTS {nome}')
+        conn.execute('DELETE FROM somme_similarita_utenti')
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def ricostruisci_somme(conn: sqlite3.Connection):
+    """
+    Ricalcola da zero tutte le somme per coppia in un'unica transazione. Non serve durante il
+    normale funzionamento: va usata solo se fumetti_letti è stata modificata con i trigger sospesi.
+
+    Args:
+        conn: Connessione al database SQLite
+    """
+    try:
+        conn.execute('DELETE FROM somme_similarita_utenti')
+        conn.execute(migrazioni.RICALCOLO_SOMME_SIMILARITA)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+# Ricalcolo completo: python somme_similarita.py
+if __name__ == '__main__':
+    from config import Config
+
+    connessione = sqlite3.connect(Config.DATABASE_PATH, timeout=Config.DB_BUSY_TIMEOUT_SECONDS)
+    try:
+        migrazioni.applica_migrazioni(connessione)
+        inizio = time.perf_counter()
+        ricostruisci_somme(connessione)
+        coppie = connessione.execute('SELECT COUNT(*) FROM somme_similarita_utenti').fetchone()[0]
+        print(f"Somme ricalcolate per {coppie} coppie di utenti in {time.perf_counter() - inizio:.1f}s")
+    finally:
+        connessione.close()
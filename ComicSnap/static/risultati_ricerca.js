@@ -34,14 +34,14 @@ document.addEventListener('DOMContentLoaded', () => {
                         
                // Costruisce l'HTML della card con i dati del fumetto, usando operatori di fallback per gestire dati mancanti 
                         cardDiv.innerHTML = `
-                            <img src="${fumetto["Immagine di copertina"] || fumetto.image?.original_url || 'static/default_cover.jpg'}" 
-                                 alt="${fumetto["Nome del volume"] || fumetto.name || 'Fumetto'}"
+                            <img src="${fumetto.copertina || fumetto.image?.original_url || 'static/default_cover.jpg'}" 
+                                 alt="${fumetto.titolo || fumetto.name || 'Fumetto'}"
                                  data-comic-id="${comicId}"
                                  onerror="this.src='static/default_cover.jpg'"
                                  class="comic-image">
-                            <h4>${fumetto["Nome del volume"] || fumetto.name || 'Titolo non disponibile'}</h4>
-                            <p>Anno: ${fumetto["Anno di pubblicazione"] || fumetto.start_year || 'N/D'}</p>
-                            <p>Editore: ${fumetto["Editore"] || fumetto.publisher?.name || 'N/D'}</p>
+                            <h4>${fumetto.titolo || fumetto.name || 'Titolo non disponibile'}</h4>
+                            <p>Anno: ${fumetto.anno || fumetto.start_year || 'N/D'}</p>
+                            <p>Editore: ${fumetto.editore || fumetto.publisher?.name || 'N/D'}</p>
                         `;
                         risultatiContainer.appendChild(cardDiv);
                     });
@@ -120,12 +120,12 @@ document.addEventListener('DOMContentLoaded', () => {
                                 submitBtn.addEventListener('click', () => {
                                     // Trova i dati completi del fumetto selezionato
                                     const comicData = data.find(comic => comic.id === comicId || 
-                                        comic["Nome del volume"] === comicTitle);
+                                        comic.titolo === comicTitle);
                                     
                                     // Estrae i dati aggiuntivi con fallback per valori mancanti
                                     const autore = comicData?.autore || 'Non specificato';
                                     const genere = comicData?.genere || 'Non specificato';
-                                    const anno = comicData?.["Anno di pubblicazione"] || 'N/D';
+                                    const anno = comicData?.anno || 'N/D';
                                     
                                     // Invia i dati al backend per salvare il fumetto e la valutazione
                                     fetch('/aggiungi_fumetto_letto', {
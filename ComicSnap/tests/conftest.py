@@ -0,0 +1,15 @@
+import sqlite3
+
+import pytest
+
+import migrazioni
+
+
+@pytest.fixture
+def conn(tmp_path):
+    """Database temporaneo con lo schema all'ultima versione, letto come dall'applicazione (sqlite3.Row)."""
+    connessione = sqlite3.connect(str(tmp_path / 'comicsnap.db'))
+    connessione.row_factory = sqlite3.Row
+    migrazioni.applica_migrazioni(connessione)
+    yield connessione
+    connessione.close()
@@ -0,0 +1,138 @@
+import asyncio
+import threading
+import time
+
+import pytest
+
+from cache_ricerche import CacheRicerche
+
+
+@pytest.fixture
+def percorso(tmp_path):
+    return str(tmp_path / 'cache.db')
+
+
+def _cache(percorso, ttl=60.0, ttl_obsoleto=60.0, dimensione_max=100):
+    return CacheRicerche(percorso, ttl, ttl_obsoleto, dimensione_max)
+
+
+def _attendi(condizione, timeout=5.0):
+    scadenza = time.monotonic() + timeout
+    while not condizione():
+        assert time.monotonic() < scadenza, 'condizione non verificata in tempo'
+        time.sleep(0.01)
+
+
+def test_memoria_e_disco(percorso):
+    cache = _cache(percorso)
+    assert cache.ottieni('a', lambda: [1]) == [1]
+    assert cache.ottieni('a', lambda: pytest.fail('valore già in memoria')) == [1]
+    assert cache.statistiche()['miss'] == 1
+    assert cache.statistiche()['hit'] == 1
+
+    # Un altro processo (qui un'altra istanza) trova il valore su disco
+    altra = _cache(percorso)
+    assert altra.ottieni('a', lambda: pytest.fail('valore già su disco')) == [1]
+    assert altra.statistiche()['hit_disco'] == 1
+
+
+def test_evizione_lru(percorso):
+    cache = _cache(percorso, dimensione_max=2)
+    for chiave in ('a', 'b', 'c'):
+        cache.ottieni(chiave, lambda: chiave)
+    statistiche = cache.statistiche()
+    assert statistiche['evizioni'] == 1
+    assert statistiche['voci_in_memoria'] == 2
+    # La voce uscita dalla memoria viene riletta dal disco
+    assert cache.ottieni('a', lambda: pytest.fail('valore già su disco')) == 'a'
+    assert cache.statistiche()['hit_disco'] == 1
+
+
+def test_voce_scaduta_servita_e_aggiornata_in_background(percorso):
+    cache = _cache(percorso, ttl=0.05)
+    cache.ottieni('a', lambda: 'vecchio')
+    time.sleep(0.1)
+
+    sblocca = threading.Event()
+    chiamate = []
+
+    def calcola():
+        chiamate.append(1)
+        sblocca.wait(5)
+        return 'nuovo'
+
+    # La risposta non attende l'aggiornamento, che parte una sola volta
+    assert cache.ottieni('a', calcola) == 'vecchio'
+    assert cache.ottieni('a', calcola) == 'vecchio'
+    sblocca.set()
+    _attendi(lambda: cache.leggi('a') == 'nuovo')
+    assert len(chiamate) == 1
+    assert cache.statistiche()['hit_obsoleti'] == 2
+
+
+def test_voce_troppo_vecchia_ricalcolata(percorso):
+    cache = _cache(percorso, ttl=0.01, ttl_obsoleto=0.01)
+    cache.ottieni('a', lambda: 'vecchio')
+    time.sleep(0.05)
+    assert cache.leggi('a') is None
+    assert cache.ottieni('a', lambda: 'nuovo') == 'nuovo'
+    assert cache.statistiche()['miss'] == 2
+
+
+def test_errore_upstream(percorso):
+    cache = _cache(percorso, ttl=0.01, ttl_obsoleto=0.01)
+
+    def errore():
+        raise RuntimeError('ComicVine non raggiungibile')
+
+    with pytest.raises(RuntimeError):
+        cache.ottieni('a', errore)
+    # Con un valore salvato, anche troppo vecchio, si serve quello
+    cache.ottieni('a', lambda: 'vecchio')
+    time.sleep(0.05)
+    assert cache.ottieni('a', errore) == 'vecchio'
+    assert cache.statistiche()['errori_upstream'] == 2
+
+
+def test_richieste_concorrenti_condividono_il_calcolo(percorso):
+    cache = _cache(percorso)
+    chiamate = []
+
+    def calcola():
+        chiamate.append(1)
+        time.sleep(0.2)
+        return 'valore'
+
+    risultati = []
+    thread = [threading.Thread(target=lambda: risultati.append(cache.ottieni('a', calcola))) for _ in range(5)]
+    for t in thread:
+        t.start()
+    for t in thread:
+        t.join()
+    assert risultati == ['valore'] * 5
+    assert len(chiamate) == 1
+
+
+def test_versione_asincrona(percorso):
+    cache = _cache(percorso, ttl=0.05)
+
+    async def scenario():
+        async def vecchio():
+            return 'vecchio'
+
+        async def nuovo():
+            return 'nuovo'
+
+        assert await cache.ottieni_asincrono('a', vecchio) == 'vecchio'
+        assert await cache.ottieni_asincrono('a', nuovo) == 'vecchio'
+        await asyncio.sleep(0.1)
+        assert await cache.ottieni_asincrono('a', nuovo) == 'vecchio'
+        # L'aggiornamento gira come task dell'event loop
+        for _ in range(100):
+            if cache.leggi('a') == 'nuovo':
+                break
+            await asyncio.sleep(0.01)
+        assert cache.leggi('a') == 'nuovo'
+
+    asyncio.run(scenario())
+    assert cache.statistiche()['hit_obsoleti'] == 1
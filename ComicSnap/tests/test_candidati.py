@@ -0,0 +1,51 @@
+import sqlite3
+
+import pytest
+
+from candidati import ArricchimentoComicVine, CandidatiEditoriPreferiti, GeneratoreCandidati, ProfiloUtente
+from comicvine import Volume
+
+
+class _ClientFinto:
+    def elenca_volumi(self, filtro, limit):
+        ids = filtro[3:].split('|')
+        return len(ids), [Volume(id=i, titolo=f'Volume {i}', editore='Bonelli') for i in ids[:limit]]
+
+
+def test_candidati_degli_editori_preferiti(conn):
+    conn.executemany('INSERT INTO fumetti (id, titolo, editore) VALUES (?, ?, ?)', [
+        ('1', 'Tex', 'Bonelli'), ('2', 'Zagor', 'Bonelli'), ('3', 'Dylan Dog', 'Bonelli'),
+        ('4', 'Batman', 'DC Comics'), ('5', 'Diabolik', 'Astorina'),
+    ])
+    conn.executemany('INSERT INTO fumetti_letti (utente_id, comic_id, rating) VALUES (?, ?, ?)', [
+        (1, '1', 5), (2, '3', 4), (3, '3', 2), (2, '2', 3), (2, '4', 5),
+    ])
+    profilo = ProfiloUtente(utente_id=1, editori_preferiti=[('Bonelli', 5.0), ('DC Comics', 4.0)],
+                            fumetti_letti={'1'}, punteggi_collaborativi={})
+
+    # Esclusi il fumetto già letto e gli editori non preferiti, dal più letto
+    volumi = CandidatiEditoriPreferiti(conn).genera(profilo, 10)
+    assert [v.id for v in volumi] == ['3', '2', '4']
+    assert volumi[0].titolo == 'Dylan Dog' and volumi[0].editore == 'Bonelli'
+    assert [v.id for v in CandidatiEditoriPreferiti(conn).genera(profilo, 1)] == ['3']
+
+
+def test_generatore_senza_genera_non_istanziabile():
+    class Incompleto(GeneratoreCandidati):
+        pass
+
+    with pytest.raises(TypeError):
+        Incompleto()
+
+
+def test_arricchimento_annullato_in_caso_di_errore(conn):
+    arricchimento = ArricchimentoComicVine(lambda: conn, client=_ClientFinto)
+    arricchimento._scarica_metadati(['1', '2'])
+    assert [riga[0] for riga in conn.execute('SELECT id FROM fumetti ORDER BY id')] == ['1', '2']
+
+    conn.execute("CREATE TRIGGER rifiuta BEFORE INSERT ON fumetti WHEN new.id = '4' BEGIN SELECT RAISE(ABORT, 'rifiutato'); END")
+    with pytest.raises(sqlite3.IntegrityError):
+        arricchimento._scarica_metadati(['3', '4'])
+    # Nessuna transazione resta aperta con il lock di scrittura
+    assert not conn.in_transaction
+    assert [riga[0] for riga in conn.execute('SELECT id FROM fumetti ORDER BY id')] == ['1', '2']
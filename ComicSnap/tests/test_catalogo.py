@@ -0,0 +1,65 @@
+import pytest
+
+import catalogo
+from comicvine import Volume
+
+
+@pytest.fixture
+def conn_catalogo(conn):
+    catalogo.aggiungi_volumi(conn, [
+        Volume(id='1', titolo='Detective Stories', autore='Batman Writer', editore='DC'),
+        Volume(id='2', titolo='Batman Year One', autore='Frank Miller', editore='DC'),
+        Volume(id='3', titolo='Watchmen', autore='Alan Moore', editore='DC'),
+        Volume(id='4', titolo='Dylan Dog', autore='Autore non specificato', editore='Bonelli', anno='N/D'),
+        Volume(id='5', titolo='Zagor', autore='Guido Nolitta', editore='Batman Edizioni'),
+    ])
+    conn.commit()
+    return conn
+
+
+def _ids(volumi):
+    return [volume.id for volume in volumi]
+
+
+def test_titolo_pesa_piu_di_autore_ed_editore(conn_catalogo):
+    corrispondenze, simili = catalogo.cerca(conn_catalogo, 'batman', 10)
+    assert _ids(corrispondenze) == ['2', '1', '5']
+    assert simili == []
+
+
+def test_parole_come_prefissi_in_qualsiasi_ordine(conn_catalogo):
+    assert _ids(catalogo.cerca(conn_catalogo, 'bat year', 10)[0]) == ['2']
+    assert _ids(catalogo.cerca(conn_catalogo, 'DOG dylan', 10)[0]) == ['4']
+
+
+def test_segnaposto_restituiti_come_campi_mancanti(conn_catalogo):
+    volume, = catalogo.cerca(conn_catalogo, 'dylan', 10)[0]
+    assert (volume.autore, volume.anno, volume.editore) == (None, None, 'Bonelli')
+
+
+@pytest.mark.parametrize('query', ['watchmne', 'wathcmen', 'Watchman'])
+def test_titoli_simili_con_errori_di_battitura(conn_catalogo, query):
+    corrispondenze, simili = catalogo.cerca(conn_catalogo, query, 10)
+    assert corrispondenze == []
+    assert _ids(simili) == ['3']
+
+
+def test_nessun_risultato(conn_catalogo):
+    assert catalogo.cerca(conn_catalogo, 'xyz', 10) == ([], [])
+    assert catalogo.cerca(conn_catalogo, '  !? ', 10) == ([], [])
+
+
+def test_editore_aggiornato_senza_perdere_i_campi_salvati(conn_catalogo):
+    catalogo.aggiungi_volumi(conn_catalogo, [Volume(id='3', titolo='Watchmen', editore='Vertigo')])
+    volume = catalogo.volumi_per_id(conn_catalogo, ['3', '99'])
+    assert list(volume) == ['3']
+    assert (volume['3'].autore, volume['3'].editore) == ('Alan Moore', 'Vertigo')
+    assert _ids(catalogo.cerca(conn_catalogo, 'vertigo', 10)[0]) == ['3']
+
+
+def test_unisci_senza_duplicati():
+    locali = [Volume(id='1', titolo='A'), Volume(id='2', titolo='B')]
+    remoti = [Volume(id='2', titolo='B'), Volume(id='3', titolo='C')]
+    simili = [Volume(id='3', titolo='C'), Volume(id='4', titolo='D')]
+    assert _ids(catalogo.unisci(locali, remoti, simili, 10)) == ['1', '2', '3', '4']
+    assert _ids(catalogo.unisci(locali, remoti, simili, 2)) == ['1', '2']
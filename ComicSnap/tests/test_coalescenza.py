@@ -0,0 +1,163 @@
+import asyncio
+import threading
+import time
+
+from coalescenza import LeaseSQLite, SingoloVolo
+
+
+def _non_chiamare():
+    raise AssertionError('Il calcolo doveva essere condiviso')
+
+
+async def _non_chiamare_asincrono():
+    _non_chiamare()
+
+
+def test_richieste_concorrenti_condividono_un_calcolo():
+    volo = SingoloVolo()
+    sblocca = threading.Event()
+    chiamate = []
+
+    def calcola():
+        chiamate.append(1)
+        sblocca.wait(5)
+        return 'risultato'
+
+    risultati = []
+    thread = [threading.Thread(target=lambda: risultati.append(volo.esegui('chiave', calcola))) for _ in range(5)]
+    for t in thread:
+        t.start()
+    time.sleep(0.1)
+    sblocca.set()
+    for t in thread:
+        t.join(5)
+
+    assert risultati == ['risultato'] * 5
+    assert len(chiamate) == 1
+    assert volo.statistiche()['condivise'] == 4
+    assert volo.statistiche()['in_corso'] == 0
+
+
+def test_errore_propagato_a_chi_attende():
+    volo = SingoloVolo()
+    iniziato, sblocca = threading.Event(), threading.Event()
+
+    def calcola():
+        iniziato.set()
+        sblocca.wait(5)
+        raise ValueError('ComicVine non raggiungibile')
+
+    errori = []
+
+    def esegui(funzione):
+        try:
+            volo.esegui('chiave', funzione)
+        except ValueError as e:
+            errori.append(str(e))
+
+    primo = threading.Thread(target=esegui, args=(calcola,))
+    primo.start()
+    iniziato.wait(5)
+    secondo = threading.Thread(target=esegui, args=(_non_chiamare,))
+    secondo.start()
+    time.sleep(0.05)
+    sblocca.set()
+    primo.join(5)
+    secondo.join(5)
+    assert errori == ['ComicVine non raggiungibile'] * 2
+
+
+def test_coroutine_attende_il_calcolo_di_un_thread():
+    volo = SingoloVolo()
+    iniziato, sblocca = threading.Event(), threading.Event()
+
+    def calcola():
+        iniziato.set()
+        sblocca.wait(5)
+        return 'dal thread'
+
+    risultati = []
+    thread = threading.Thread(target=lambda: risultati.append(volo.esegui('chiave', calcola)))
+    thread.start()
+    iniziato.wait(5)
+
+    async def principale():
+        attesa = asyncio.ensure_future(volo.esegui_asincrono('chiave', _non_chiamare_asincrono))
+        await asyncio.sleep(0.05)
+        # L'event loop non è bloccato mentre la coroutine attende il thread
+        assert not attesa.done()
+        sblocca.set()
+        return await attesa
+
+    assert asyncio.run(principale()) == 'dal thread'
+    thread.join(5)
+    assert risultati == ['dal thread']
+    assert volo.statistiche()['calcoli'] == 1
+
+
+def test_thread_attende_il_calcolo_di_una_coroutine():
+    volo = SingoloVolo()
+
+    async def principale():
+        sblocca = asyncio.Event()
+
+        async def calcola():
+            await sblocca.wait()
+            return "dall'event loop"
+
+        proprietario = asyncio.ensure_future(volo.esegui_asincrono('chiave', calcola))
+        await asyncio.sleep(0)
+        attesa = asyncio.ensure_future(asyncio.to_thread(volo.esegui, 'chiave', _non_chiamare))
+        await asyncio.sleep(0.05)
+        sblocca.set()
+        return await proprietario, await attesa
+
+    assert asyncio.run(principale()) == ("dall'event loop", "dall'event loop")
+    assert volo.statistiche() == dict(calcoli=1, condivise=1, attese_processi=0, riusi_processi=0, in_corso=0)
+
+
+def test_lease_tra_processi_riusa_il_risultato_salvato(tmp_path):
+    # Due istanze con lease sullo stesso database simulano due processi worker
+    percorso = str(tmp_path / 'lease.db')
+    primo, secondo = SingoloVolo(LeaseSQLite(percorso)), SingoloVolo(LeaseSQLite(percorso))
+    salvato = {}
+    iniziato, sblocca = threading.Event(), threading.Event()
+
+    def calcola():
+        iniziato.set()
+        sblocca.wait(5)
+        salvato['chiave'] = 'calcolato'
+        return 'calcolato'
+
+    thread = threading.Thread(target=primo.esegui, args=('chiave', calcola))
+    thread.start()
+    iniziato.wait(5)
+    threading.Timer(0.1, sblocca.set).start()
+
+    assert secondo.esegui('chiave', _non_chiamare, lambda: salvato.get('chiave')) == 'calcolato'
+    thread.join(5)
+    assert secondo.statistiche()['attese_processi'] == 1
+    assert secondo.statistiche()['riusi_processi'] == 1
+
+
+def test_lease_ricalcola_se_il_risultato_non_e_stato_salvato(tmp_path):
+    percorso = str(tmp_path / 'lease.db')
+    lease = LeaseSQLite(percorso)
+    lease.acquisisci('chiave')
+    threading.Timer(0.1, lease.rilascia, args=('chiave',)).start()
+
+    volo = SingoloVolo(LeaseSQLite(percorso))
+    assert volo.esegui('chiave', lambda: 'ricalcolato', lambda: None) == 'ricalcolato'
+    assert volo.statistiche()['attese_processi'] == 1
+    assert volo.statistiche()['riusi_processi'] == 0
+
+
+def test_lease_scaduto_ignorato(tmp_path):
+    lease = LeaseSQLite(str(tmp_path / 'lease.db'), durata_max_secondi=0.1)
+    # Lease di un worker terminato senza rilasciarlo
+    lease._connessione().execute("INSERT INTO lease VALUES ('chiave', 'altro', ?)", (time.time() - 1,))
+    inizio = time.perf_counter()
+    assert lease.acquisisci('chiave') is False
+    assert time.perf_counter() - inizio < 0.1
+    lease.rilascia('chiave')
+    assert lease._connessione().execute('SELECT COUNT(*) FROM lease').fetchone()[0] == 0
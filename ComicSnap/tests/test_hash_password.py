@@ -0,0 +1,47 @@
+import os
+
+import pytest
+from werkzeug.security import generate_password_hash
+
+from hash_password import ErroreSovraccarico, HashPassword, metodo_completo
+
+
+@pytest.fixture
+def hash_password():
+    # pbkdf2 con poche iterazioni, per non rallentare i test
+    hash_password = HashPassword('pbkdf2:sha256:1000', processi=1)
+    yield hash_password
+    hash_password.chiudi()
+
+
+@pytest.mark.parametrize('metodo', ['scrypt', 'scrypt:16384:8:1', 'pbkdf2', 'pbkdf2:sha512', 'pbkdf2:sha256:1000'])
+def test_metodo_uguale_al_prefisso_degli_hash(metodo):
+    assert metodo_completo(metodo) == generate_password_hash('x', metodo).split('$', 1)[0]
+
+
+@pytest.mark.parametrize('metodo', ['md5', 'scrypt:16384', 'pbkdf2:sha256:molte'])
+def test_metodo_non_valido(metodo):
+    with pytest.raises(ValueError):
+        metodo_completo(metodo)
+
+
+def test_verifica_e_rehash(hash_password):
+    hash_salvato = hash_password.genera('segreta')
+    assert hash_password.verifica(hash_salvato, 'segreta') == (True, None)
+    assert hash_password.verifica(hash_salvato, 'sbagliata') == (False, None)
+
+    valida, nuovo_hash = hash_password.verifica(generate_password_hash('segreta', 'pbkdf2:sha256:500'), 'segreta')
+    assert valida and nuovo_hash.startswith('pbkdf2:sha256:1000$')
+
+
+def test_pool_ricreato_dopo_un_processo_terminato(hash_password):
+    hash_password.genera('segreta')
+    # Un processo del pool che termina rende il pool inutilizzabile
+    with pytest.raises(ErroreSovraccarico):
+        hash_password._esegui(os._exit, 1)
+
+    hash_salvato = hash_password.genera('segreta')
+    assert hash_password.verifica(hash_salvato, 'segreta') == (True, None)
+    statistiche = hash_password.statistiche()
+    assert statistiche['pool_ricreati'] == 1
+    assert statistiche['in_coda'] == 0
@@ -0,0 +1,39 @@
+import pytest
+
+import ingestione
+from comicvine import ErroreComicVine, Volume
+
+
+class _ClientFinto:
+    def __init__(self, volumi_extra=0):
+        self.richieste = []
+        self.volumi_extra = volumi_extra
+
+    def volumi_editore(self, editore_id):
+        return [str(i) for i in range(250, 0, -1)]
+
+    def elenca_volumi(self, filtro, limit=100, offset=0):
+        ids = filtro[3:].split('|')
+        self.richieste.append((len(ids), limit, offset))
+        # I volumi senza titolo (ID multipli di 10) vengono scartati come fa crea_volume
+        volumi = [Volume(id=i, titolo=f'Volume {i}') for i in ids[:limit] if int(i) % 10]
+        volumi += [Volume(id=f'x{i}', titolo='Extra') for i in range(self.volumi_extra)]
+        return len(ids), volumi
+
+
+def test_importazione_per_editore_a_blocchi(conn):
+    client = _ClientFinto()
+    assert ingestione.importa(conn, 'editore:31', ingestione.pagine_per_editore(client, 31, 0)) == 225
+    assert client.richieste == [(100, 100, 0), (100, 100, 0), (50, 50, 0)]
+    assert conn.execute('SELECT COUNT(*) FROM fumetti').fetchone()[0] == 225
+    assert ingestione.leggi_stato(conn, 'editore:31') == (250, 250)
+
+    # Ripresa da metà: solo i blocchi mancanti
+    client = _ClientFinto()
+    assert ingestione.importa(conn, 'editore:31', ingestione.pagine_per_editore(client, 31, 200)) == 45
+    assert client.richieste == [(50, 50, 0)]
+
+
+def test_blocco_con_troppi_volumi(conn):
+    with pytest.raises(ErroreComicVine):
+        list(ingestione.pagine_per_editore(_ClientFinto(volumi_extra=20), 31, 0))
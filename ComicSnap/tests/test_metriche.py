@@ -0,0 +1,30 @@
+from metriche import RegistroMetriche
+
+
+def test_contatori_con_suffisso_total():
+    metriche = RegistroMetriche()
+    metriche.registra_contatore('richieste_lente', 'Richieste lente')
+    metriche.registra_contatore('errori_total', 'Errori')
+    metriche.incrementa('richieste_lente', route='/search')
+    metriche.incrementa('richieste_lente', 2, route='/search')
+    metriche.incrementa('errori_total')
+
+    righe = metriche.testo_prometheus().splitlines()
+    assert '# TYPE comicsnap_richieste_lente_total counter' in righe
+    assert 'comicsnap_richieste_lente_total{route="/search"} 3' in righe
+    assert 'comicsnap_errori_total 1' in righe
+
+
+def test_istogramma_e_statistiche():
+    metriche = RegistroMetriche()
+    metriche.registra_istogramma('durata_secondi', 'Durata', (0.1, 1))
+    metriche.osserva('durata_secondi', 0.5, route='/')
+    metriche.registra_statistiche('cache', lambda: {'hit': 4, 'attiva': True})
+    metriche.registra_statistiche('spento', lambda: None)
+
+    righe = metriche.testo_prometheus().splitlines()
+    assert 'comicsnap_durata_secondi_bucket{route="/",le="0.1"} 0' in righe
+    assert 'comicsnap_durata_secondi_bucket{route="/",le="1"} 1' in righe
+    assert 'comicsnap_durata_secondi_count{route="/"} 1' in righe
+    assert 'comicsnap_cache_hit 4' in righe
+    assert not any('attiva' in riga or 'spento' in riga for riga in righe)
@@ -0,0 +1,82 @@
+import os
+import shutil
+import sqlite3
+
+import pytest
+
+import migrazioni
+import somme_similarita
+
+DATABASE_DISTRIBUITO = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'comicsnap.db')
+
+
+@pytest.fixture
+def database_con_duplicati(tmp_path):
+    # Schema delle tabelle come nel database distribuito, senza indici unici su (utente_id, comic_id)
+    conn = sqlite3.connect(str(tmp_path / 'vecchio.db'))
+    conn.executescript('''
+        CREATE TABLE utenti (id INTEGER PRIMARY KEY, username TEXT NOT NULL UNIQUE, password_hash TEXT NOT NULL);
+        CREATE TABLE fumetti (id TEXT PRIMARY KEY, titolo TEXT NOT NULL, autore TEXT NOT NULL,
+                              url_copertina TEXT, prezzo REAL, genere TEXT, descrizione TEXT,
+                              data_aggiunta DATETIME DEFAULT CURRENT_TIMESTAMP, editore TEXT, anno INTEGER);
+        CREATE TABLE fumetti_letti (id INTEGER PRIMARY KEY, utente_id INTEGER, comic_id TEXT NOT NULL,
+                                    rating INTEGER, data_lettura DATETIME DEFAULT CURRENT_TIMESTAMP);
+        CREATE TABLE preferenze_utente (id INTEGER PRIMARY KEY, utente_id INTEGER, genere TEXT NOT NULL,
+                                        peso REAL DEFAULT 1.0, comic_id TEXT NOT NULL DEFAULT 'unknown');
+        INSERT INTO utenti VALUES (1, 'anna', 'x'), (2, 'bruno', 'x');
+        INSERT INTO fumetti (id, titolo, autore, editore) VALUES ('10', 'Dylan Dog', 'Sclavi', 'Bonelli');
+        INSERT INTO fumetti_letti (id, utente_id, comic_id, rating) VALUES
+            (1, 1, '10', 2), (2, 1, '10', 4), (3, 2, '10', 5), (4, 1, '10', 3), (5, 1, '11', 1);
+        INSERT INTO preferenze_utente (id, utente_id, genere, peso, comic_id) VALUES
+            (1, 1, 'horror', 0.2, '10'), (2, 1, 'horror', 0.9, '10'), (3, 2, 'horror', 1.0, '10');
+    ''')
+    yield conn
+    conn.close()
+
+
+def test_duplicati_spostati_nella_tabella_di_backup(database_con_duplicati):
+    conn = database_con_duplicati
+    assert migrazioni.applica_migrazioni(conn) == len(migrazioni.MIGRAZIONI)
+
+    # Resta l'ultima riga inserita per ogni coppia, le altre sono nel backup
+    assert conn.execute('SELECT id, rating FROM fumetti_letti ORDER BY id').fetchall() == [(3, 5), (4, 3), (5, 1)]
+    assert conn.execute('SELECT id, rating FROM fumetti_letti_duplicati ORDER BY id').fetchall() == [(1, 2), (2, 4)]
+    assert conn.execute('SELECT id, peso FROM preferenze_utente ORDER BY id').fetchall() == [(2, 0.9), (3, 1.0)]
+    assert conn.execute('SELECT id, peso FROM preferenze_utente_duplicati').fetchall() == [(1, 0.2)]
+
+    with pytest.raises(sqlite3.IntegrityError):
+        conn.execute("INSERT INTO fumetti_letti (utente_id, comic_id, rating) VALUES (1, '10', 1)")
+
+
+def test_statistiche_derivate_calcolate_dopo_la_deduplicazione(database_con_duplicati):
+    conn = database_con_duplicati
+    migrazioni.applica_migrazioni(conn)
+    assert conn.execute('SELECT COUNT(*) FROM somme_similarita_utenti').fetchone()[0] == 0
+    somme_similarita.attiva_manutenzione(conn)
+
+    assert conn.execute('SELECT utente_a, utente_b, prodotto FROM somme_similarita_utenti').fetchall() == [(1, 2, 15)]
+    assert conn.execute('SELECT utente_id, editore, letture, somma_rating FROM profilo_utente_editori '
+                        'ORDER BY utente_id').fetchall() == [(1, 'Bonelli', 1, 3), (2, 'Bonelli', 1, 5)]
+
+
+def test_migrazioni_ripetute_non_cambiano_nulla(conn):
+    tabelle = conn.execute("SELECT name FROM sqlite_master ORDER BY name").fetchall()
+    assert migrazioni.applica_migrazioni(conn) == len(migrazioni.MIGRAZIONI)
+    assert conn.execute("SELECT name FROM sqlite_master ORDER BY name").fetchall() == tabelle
+    # Senza duplicati non vengono create tabelle di backup
+    assert not [riga for riga in tabelle if riga[0].endswith('_duplicati')]
+
+
+def test_migrazione_del_database_distribuito(tmp_path):
+    percorso = str(tmp_path / 'comicsnap.db')
+    shutil.copyfile(DATABASE_DISTRIBUITO, percorso)
+    conn = sqlite3.connect(percorso)
+    letture = conn.execute('SELECT COUNT(*) FROM fumetti_letti').fetchone()[0]
+    coppie = conn.execute('SELECT COUNT(DISTINCT utente_id || ? || comic_id) FROM fumetti_letti', ('|',)).fetchone()[0]
+
+    assert migrazioni.applica_migrazioni(conn) == len(migrazioni.MIGRAZIONI)
+    assert conn.execute('SELECT COUNT(*) FROM fumetti_letti').fetchone()[0] == coppie
+    spostate = conn.execute("SELECT name FROM sqlite_master WHERE name = 'fumetti_letti_duplicati'").fetchone()
+    if spostate:
+        assert conn.execute('SELECT COUNT(*) FROM fumetti_letti_duplicati').fetchone()[0] == letture - coppie
+    conn.close()
@@ -0,0 +1,105 @@
+import random
+
+import pytest
+
+import catalogo
+import migrazioni
+from comicvine import Volume
+from profili import CacheProfili, carica_profilo
+
+UTENTI = range(1, 7)
+FUMETTI = [str(i) for i in range(1, 11)]
+EDITORI = ['Marvel', 'DC', 'Bonelli', None]
+
+# Stessa scrittura di /fumetti-letti: inserimento o modifica del rating
+REGISTRA_LETTURA = '''
+    INSERT INTO fumetti_letti (utente_id, comic_id, rating) VALUES (?, ?, ?)
+    ON CONFLICT (utente_id, comic_id) DO UPDATE SET rating = excluded.rating
+'''
+
+# Statistiche per editore ricalcolate dalle tabelle di base, con la stessa query della migrazione
+RICALCOLO = migrazioni.RICALCOLO_PROFILO_EDITORI.split('\n', 1)[1]
+
+
+def _profili(conn):
+    return sorted(tuple(riga) for riga in conn.execute(
+        'SELECT utente_id, editore, letture, somma_rating, somma_quadrati FROM profilo_utente_editori'))
+
+
+def _ricalcolati(conn):
+    return sorted(tuple(riga) for riga in conn.execute(RICALCOLO))
+
+
+def test_profilo_editori_coincide_con_il_ricalcolo(conn):
+    rng = random.Random(11)
+    for passo in range(500):
+        operazione = rng.random()
+        letture = conn.execute('SELECT id FROM fumetti_letti').fetchall()
+        fumetti = conn.execute('SELECT id FROM fumetti').fetchall()
+        if operazione < 0.4 or not letture:
+            # Anche letture di fumetti non ancora nel catalogo
+            conn.execute(REGISTRA_LETTURA, (rng.choice(UTENTI), rng.choice(FUMETTI),
+                                            rng.choice([1, 2, 3, 4, 5, None])))
+        elif operazione < 0.55:
+            conn.execute('UPDATE fumetti_letti SET rating = ? WHERE id = ?',
+                         (rng.choice([1, 2, 3, 4, 5, None]), rng.choice(letture)[0]))
+        elif operazione < 0.65:
+            conn.execute('DELETE FROM fumetti_letti WHERE id = ?', (rng.choice(letture)[0],))
+        elif operazione < 0.8:
+            # Fumetto aggiunto al catalogo dopo le letture, o con l'editore aggiornato da ComicVine
+            comic_id = rng.choice(FUMETTI)
+            catalogo.aggiungi_volumi(conn, [Volume(id=comic_id, titolo=f'Fumetto {comic_id}',
+                                                   editore=rng.choice(EDITORI))])
+        elif operazione < 0.93 or not fumetti:
+            if fumetti:
+                conn.execute('UPDATE fumetti SET editore = ? WHERE id = ?',
+                             (rng.choice(EDITORI), rng.choice(fumetti)[0]))
+        else:
+            conn.execute('DELETE FROM fumetti WHERE id = ?', (rng.choice(fumetti)[0],))
+        conn.commit()
+        if passo % 25 == 24:
+            assert _profili(conn) == _ricalcolati(conn)
+    assert _profili(conn) == _ricalcolati(conn)
+
+
+def test_cache_invalidata_quando_cambia_la_versione(conn):
+    catalogo.aggiungi_volumi(conn, [Volume(id='1', titolo='Tex 1', editore='Bonelli'),
+                                    Volume(id='2', titolo='Batman 1', editore='DC')])
+    conn.executemany(REGISTRA_LETTURA, [(1, '1', 5), (2, '2', 3)])
+    conn.commit()
+    cache = CacheProfili()
+
+    profilo = cache.ottieni(conn, 1)
+    assert cache.ottieni(conn, 1) is profilo
+    assert cache.statistiche()['hit'] == 1
+
+    # Una nuova lettura dell'utente
+    conn.execute(REGISTRA_LETTURA, (1, '2', 4))
+    conn.commit()
+    profilo = cache.ottieni(conn, 1)
+    assert profilo.editori == {'Bonelli': (1, 5, 25), 'DC': (1, 4, 16)}
+
+    # Una nuova preferenza
+    conn.execute("INSERT INTO preferenze_utente (utente_id, comic_id, genere, peso) VALUES (1, '1', 'western', 0.8)")
+    conn.commit()
+    profilo = cache.ottieni(conn, 1)
+    assert profilo.preferenze == {'1': 0.8}
+
+    # L'editore di un fumetto letto cambia: il profilo di un altro utente non viene ricaricato
+    altro = cache.ottieni(conn, 2)
+    conn.execute("UPDATE fumetti SET editore = 'Marvel' WHERE id = '1'")
+    conn.commit()
+    assert cache.ottieni(conn, 1).editori == {'Marvel': (1, 5, 25), 'DC': (1, 4, 16)}
+    assert cache.ottieni(conn, 2) is altro
+    assert cache.statistiche()['miss'] == 5
+
+
+def test_profilo_in_sola_lettura(conn):
+    catalogo.aggiungi_volumi(conn, [Volume(id='1', titolo='Tex 1', editore='Bonelli')])
+    conn.execute(REGISTRA_LETTURA, (1, '1', 5))
+    conn.execute("INSERT INTO preferenze_utente (utente_id, comic_id, genere, peso) VALUES (1, '1', 'western', 0.8)")
+    profilo = carica_profilo(conn, 1)
+    with pytest.raises(TypeError):
+        profilo.editori['DC'] = (1, 1, 1)
+    with pytest.raises(TypeError):
+        profilo.preferenze['2'] = 1.0
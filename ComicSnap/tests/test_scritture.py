@@ -0,0 +1,112 @@
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from scritture import ErroreScritturaScaduta, ScrittoreRaggruppato, importa_letture, normalizza_lettura
+
+AGGIUNGI_PREFERITO = '''
+    INSERT INTO preferenze_utente (utente_id, comic_id, genere, peso) VALUES (?, ?, 'non_specificato', 0.5)
+'''
+
+
+@pytest.fixture
+def percorso(conn, tmp_path):
+    return str(tmp_path / 'comicsnap.db')
+
+
+def _letture(conn, utente_id):
+    return sorted(tuple(riga) for riga in conn.execute(
+        'SELECT comic_id, rating FROM fumetti_letti WHERE utente_id = ?', (utente_id,)))
+
+
+def test_normalizza_lettura():
+    lettura = normalizza_lettura({'comic_id': 42, 'titolo': ' Tex ', 'rating': 4})
+    assert lettura == {'comic_id': '42', 'titolo': 'Tex', 'autore': 'Autore non specificato',
+                       'url_copertina': '/static/comic-placeholder.png', 'editore': 'Non specificato',
+                       'anno': 'N/D', 'rating': 4}
+    for dati in (['42'], {'comic_id': '42'}, {'comic_id': '42', 'titolo': 'Tex', 'rating': 6},
+                 {'comic_id': '42', 'titolo': 'Tex', 'rating': True}):
+        with pytest.raises(ValueError):
+            normalizza_lettura(dati)
+
+
+def test_importazione_in_una_transazione(conn):
+    conn.execute("INSERT INTO fumetti_letti (utente_id, comic_id, rating) VALUES (1, '1', 2)")
+    conn.commit()
+    letture = [normalizza_lettura(dati) for dati in (
+        {'comic_id': '1', 'titolo': 'Tex 1', 'rating': 5},
+        {'comic_id': '2', 'titolo': 'Tex 2', 'rating': 3},
+        {'comic_id': '3', 'titolo': 'Tex 3'},
+        # A parità di comic_id vale l'ultimo
+        {'comic_id': '2', 'titolo': 'Tex 2', 'rating': 4},
+    )]
+    assert importa_letture(conn, 1, letture) == {'importati': 2, 'gia_presenti': 1}
+
+    # Le letture già presenti restano invariate
+    assert _letture(conn, 1) == [('1', 2), ('2', 4), ('3', None)]
+    assert conn.execute('SELECT COUNT(*) FROM fumetti').fetchone()[0] == 2
+    assert [riga[0] for riga in conn.execute('SELECT utente_id FROM stato_raccomandazioni')] == [1]
+    assert importa_letture(conn, 1, letture) == {'importati': 0, 'gia_presenti': 3}
+
+
+def test_importazione_annullata_in_caso_di_errore(conn):
+    letture = [normalizza_lettura({'comic_id': '1', 'titolo': 'Tex 1', 'rating': 5})]
+    conn.execute('CREATE TRIGGER rifiuta BEFORE INSERT ON fumetti_letti BEGIN SELECT RAISE(ABORT, \'rifiutata\'); END')
+    with pytest.raises(sqlite3.IntegrityError):
+        importa_letture(conn, 1, letture)
+    assert conn.execute('SELECT COUNT(*) FROM fumetti').fetchone()[0] == 0
+
+
+def _preferiti(conn):
+    return sorted(tuple(riga) for riga in conn.execute('SELECT utente_id, comic_id FROM preferenze_utente'))
+
+
+def test_errore_di_una_scrittura_non_annulla_le_altre(conn, percorso):
+    conn.execute(AGGIUNGI_PREFERITO, (1, '1'))
+    conn.commit()
+    scrittore = ScrittoreRaggruppato(lambda: sqlite3.connect(percorso), intervallo_secondi=0.5)
+    try:
+        with ThreadPoolExecutor(max_workers=3) as pool:
+            # Il secondo preferito esiste già e viola l'indice univoco
+            futuri = [pool.submit(scrittore.scrivi, AGGIUNGI_PREFERITO, parametri, utente)
+                      for utente, parametri in ((2, (2, '1')), (1, (1, '1')), (3, (3, '1')))]
+        with pytest.raises(sqlite3.IntegrityError):
+            futuri[1].result()
+        futuri[0].result()
+        futuri[2].result()
+        statistiche = scrittore.statistiche()
+    finally:
+        scrittore.chiudi()
+
+    assert _preferiti(conn) == [(1, '1'), (2, '1'), (3, '1')]
+    assert statistiche['transazioni'] == 1
+    assert statistiche['scritture'] == 2
+    assert statistiche['errori'] == 1
+
+
+def test_scrittura_scaduta(conn, percorso):
+    scrittore = ScrittoreRaggruppato(lambda: sqlite3.connect(percorso, timeout=1), intervallo_secondi=0,
+                                     attesa_secondi=0.1)
+    bloccante = sqlite3.connect(percorso)
+    bloccante.execute('BEGIN IMMEDIATE')
+    try:
+        # La prima scrittura è già in corso quando scade, la seconda è ancora in coda e viene annullata
+        with pytest.raises(ErroreScritturaScaduta, match='sconosciuto'):
+            scrittore.scrivi(AGGIUNGI_PREFERITO, (1, '1'))
+        with pytest.raises(ErroreScritturaScaduta, match='annullata'):
+            scrittore.scrivi(AGGIUNGI_PREFERITO, (2, '1'))
+        bloccante.rollback()
+
+        scrittore.attesa = 5
+        scrittore.scrivi(AGGIUNGI_PREFERITO, (3, '1'))
+        statistiche = scrittore.statistiche()
+    finally:
+        bloccante.close()
+        scrittore.chiudi()
+
+    # La prima scrittura è stata salvata appena il database si è sbloccato, la seconda mai eseguita
+    assert _preferiti(conn) == [(1, '1'), (3, '1')]
+    assert statistiche['scadute'] == 2
+    assert statistiche['errori'] == 0
+    assert statistiche['scritture'] == 2
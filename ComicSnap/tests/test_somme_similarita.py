@@ -0,0 +1,119 @@
+import random
+
+import pytest
+
+from matrice_rating import MatriceRating
+from somme_similarita import (VICINI_PER_QUERY, attiva_manutenzione, disattiva_manutenzione, manutenzione_attiva,
+                              punteggi_collaborativi, ricostruisci_somme, similarita_utente)
+
+UTENTI = range(1, 9)
+FUMETTI = [str(i) for i in range(1, 13)]
+
+# Stessa scrittura di /fumetti-letti: inserimento o modifica del rating
+REGISTRA_LETTURA = '''
+    INSERT INTO fumetti_letti (utente_id, comic_id, rating) VALUES (?, ?, ?)
+    ON CONFLICT (utente_id, comic_id) DO UPDATE SET rating = excluded.rating
+'''
+
+
+@pytest.fixture(autouse=True)
+def manutenzione(conn):
+    attiva_manutenzione(conn)
+
+
+def _somme(conn):
+    return [tuple(riga) for riga in conn.execute(
+        'SELECT utente_a, utente_b, prodotto, norma_a, norma_b FROM somme_similarita_utenti ORDER BY 1, 2')]
+
+
+def _controlla_coseno(conn):
+    matrice = MatriceRating.da_database(conn)
+    for utente in UTENTI:
+        attesa = matrice.similarita_coseno(utente)
+        calcolata = similarita_utente(conn, utente)
+        assert calcolata.keys() == attesa.keys(), utente
+        for altro, valore in attesa.items():
+            assert calcolata[altro] == pytest.approx(valore)
+
+
+def test_somme_coincidono_con_il_coseno_esatto(conn):
+    rng = random.Random(7)
+    for passo in range(400):
+        operazione = rng.random()
+        letture = conn.execute('SELECT id FROM fumetti_letti').fetchall()
+        if operazione < 0.55 or not letture:
+            rating = rng.choice([1, 2, 3, 4, 5, None])
+            conn.execute(REGISTRA_LETTURA, (rng.choice(UTENTI), rng.choice(FUMETTI), rating))
+        elif operazione < 0.8:
+            conn.execute('UPDATE fumetti_letti SET rating = ? WHERE id = ?',
+                         (rng.choice([1, 2, 3, 4, 5, None]), rng.choice(letture)[0]))
+        else:
+            conn.execute('DELETE FROM fumetti_letti WHERE id = ?', (rng.choice(letture)[0],))
+        conn.commit()
+        if passo % 20 == 19:
+            _controlla_coseno(conn)
+
+    # Le somme mantenute dai trigger coincidono con il ricalcolo completo
+    incrementali = _somme(conn)
+    ricostruisci_somme(conn)
+    assert incrementali == _somme(conn)
+
+
+def test_coppia_rimossa_quando_non_ci_sono_piu_fumetti_in_comune(conn):
+    conn.executemany(REGISTRA_LETTURA, [(1, '1', 4), (2, '1', 2), (2, '2', 5), (1, '3', 1)])
+    assert _somme(conn) == [(1, 2, 8, 16, 4)]
+
+    conn.execute("UPDATE fumetti_letti SET rating = 3 WHERE utente_id = 2 AND comic_id = '1'")
+    assert _somme(conn) == [(1, 2, 12, 16, 9)]
+    assert similarita_utente(conn, 1) == {2: pytest.approx(1.0)}
+
+    conn.execute("DELETE FROM fumetti_letti WHERE utente_id = 1 AND comic_id = '1'")
+    assert _somme(conn) == []
+    assert similarita_utente(conn, 2) == {}
+
+
+def test_letture_senza_rating_ignorate(conn):
+    conn.executemany(REGISTRA_LETTURA, [(1, '1', None), (2, '1', 4)])
+    assert _somme(conn) == []
+    conn.execute(REGISTRA_LETTURA, (1, '1', 2))
+    assert _somme(conn) == [(1, 2, 8, 4, 16)]
+    conn.execute("UPDATE fumetti_letti SET rating = NULL WHERE utente_id = 2")
+    assert _somme(conn) == []
+
+
+def test_trigger_installati_solo_con_la_manutenzione_attiva(conn):
+    conn.executemany(REGISTRA_LETTURA, [(1, '1', 4), (2, '1', 2)])
+    conn.commit()
+    disattiva_manutenzione(conn)
+    assert not manutenzione_attiva(conn)
+    assert _somme(conn) == []
+
+    # Senza trigger i rating non aggiornano le somme
+    conn.execute(REGISTRA_LETTURA, (3, '1', 5))
+    conn.commit()
+    assert _somme(conn) == []
+
+    # Alla riattivazione le somme vengono ricalcolate dai rating esistenti
+    attiva_manutenzione(conn)
+    assert manutenzione_attiva(conn)
+    assert _somme(conn) == [(1, 2, 8, 16, 4), (1, 3, 20, 16, 25), (2, 3, 10, 4, 25)]
+    attiva_manutenzione(conn)
+    assert _somme(conn) == [(1, 2, 8, 16, 4), (1, 3, 20, 16, 25), (2, 3, 10, 4, 25)]
+
+
+def test_punteggi_con_piu_vicini_dei_parametri_di_una_query(conn):
+    vicini = 2 * VICINI_PER_QUERY + 10
+    letture = [(1, '1', 5)]
+    for utente in range(2, vicini + 2):
+        letture += [(utente, '1', utente % 5 + 1), (utente, str(utente % 7 + 2), utente % 3 + 3)]
+    conn.executemany(REGISTRA_LETTURA, letture)
+    conn.commit()
+
+    matrice = MatriceRating.da_database(conn)
+    similarita = similarita_utente(conn, 1)
+    assert len(similarita) == vicini
+    attesi = matrice.punteggi_collaborativi(similarita, rating_minimo=4)
+    calcolati = punteggi_collaborativi(conn, similarita, rating_minimo=4)
+    assert calcolati.keys() == attesi.keys()
+    for comic_id, valore in attesi.items():
+        assert calcolati[comic_id] == pytest.approx(valore)
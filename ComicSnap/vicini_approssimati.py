@@ -0,0 +1,158 @@
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+import numpy as np
+
+from matrice_rating import MatriceRating
+
+# Primo di Mersenne 2^31 - 1: con coefficienti e indici minori di 2^31 i prodotti stanno in un uint64
+_PRIMO = np.uint64((1 << 31) - 1)
+
+# Funzioni di hash elaborate insieme durante la costruzione, per limitare la memoria usata
+_HASH_PER_BLOCCO = 8
+
+
+class IndiceMinHash:
+    """
+    Indice approssimato (LSH con MinHash) per trovare gli utenti simili senza confrontare
+    l'utente con tutti gli altri. Ogni utente è rappresentato dall'insieme dei fumetti che ha
+    valutato almeno rating_minimo, esclusi i più popolari (o da tutti i suoi fumetti se non ne
+    restano): due utenti finiscono nello stesso bucket di una banda con probabilità pari alla
+    similarità di Jaccard dei loro insiemi elevata a righe_per_banda.
+
+    Gli utenti che condividono almeno un bucket sono i candidati, su cui viene poi calcolata la
+    similarità coseno esatta. Più bande aumentano la recall (e i candidati da confrontare), più
+    righe per banda la riducono rendendo i bucket più selettivi.
+    """
+    def __init__(self, matrice: MatriceRating, bande: int = 64, righe_per_banda: int = 1,
+                 rating_minimo: float = 4, popolarita_max: float = 0.05, seed: int = 0):
+        """
+        Costruisce l'indice dalla matrice dei rating.
+
+        Args:
+            matrice: Matrice dei rating, usata anche per la similarità esatta dei candidati
+            bande: Numero di bande: il parametro che bilancia precisione e velocità
+            righe_per_banda: Valori MinHash per banda
+            rating_minimo: Rating minimo perché un fumetto entri nell'insieme dell'utente
+            popolarita_max: Quota massima di utenti che possono aver letto un fumetto dell'insieme
+            seed: Seme delle funzioni di hash
+        """
+        self.matrice = matrice
+        self.bande = bande
+        self.righe_per_banda = righe_per_banda
+        firme = self._firme(matrice, bande * righe_per_banda, rating_minimo, popolarita_max, seed)
+
+        # Per ogni banda: bucket di ogni utente e utenti raggruppati per bucket
+        self._bucket: List[np.ndarray] = []
+        self._ordine: List[np.ndarray] = []
+        self._indptr: List[np.ndarray] = []
+        for banda in range(bande):
+            valori = firme[:, banda * righe_per_banda:(banda + 1) * righe_per_banda]
+            _, bucket = np.unique(valori, axis=0, return_inverse=True)
+            bucket = bucket.reshape(-1)
+            indptr = np.zeros(bucket.max(initial=-1) + 2, dtype=np.int64)
+            np.cumsum(np.bincount(bucket), out=indptr[1:])
+            self._bucket.append(bucket)
+            self._ordine.append(np.argsort(bucket, kind='stable'))
+            self._indptr.append(indptr)
+
+    @staticmethod
+    def _firme(matrice: MatriceRating, n_hash: int, rating_minimo: float, popolarita_max: float,
+               seed: int) -> np.ndarray:
+        # Insieme di ogni utente: i fumetti con rating alto, oppure tutti se non ne ha. I fumetti letti
+        # quasi da tutti non distinguono i gusti e metterebbero gran parte degli utenti negli stessi bucket
+        righe = np.repeat(np.arange(len(matrice.utenti)), np.diff(matrice.indptr))
+        lettori = np.diff(matrice.indptr_colonne)
+        alti = (matrice.valori >= rating_minimo) & (lettori[matrice.indici] <= popolarita_max * len(matrice.utenti))
+        senza_alti = np.bincount(righe[alti], minlength=len(matrice.utenti)) == 0
+        selezionati = alti | senza_alti[righe]
+        colonne = matrice.indici[selezionati].astype(np.uint64)
+        inizi = np.zeros(len(matrice.utenti) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(righe[selezionati], minlength=len(matrice.utenti)), out=inizi[1:])
+
+        rng = np.random.default_rng(seed)
+        a = rng.integers(1, int(_PRIMO), n_hash, dtype=np.uint64)
+        b = rng.integers(0, int(_PRIMO), n_hash, dtype=np.uint64)
+        firme = np.full((len(matrice.utenti), n_hash), _PRIMO, dtype=np.uint64)
+        non_vuoti = inizi[:-1] < inizi[1:]
+        if not non_vuoti.any():
+            return firme
+
+        # Minimo per utente di ogni funzione di hash (a * fumetto + b) mod p, a blocchi di funzioni
+        for inizio in range(0, n_hash, _HASH_PER_BLOCCO):
+            fine = min(inizio + _HASH_PER_BLOCCO, n_hash)
+            valori = (a[inizio:fine, None] * colonne[None, :] + b[inizio:fine, None]) % _PRIMO
+            firme[non_vuoti, inizio:fine] = np.minimum.reduceat(valori, inizi[:-1][non_vuoti], axis=1).T
+        return firme
+
+    def candidati(self, utente_id: int) -> np.ndarray:
+        """
+        Restituisce gli indici di riga degli utenti che condividono almeno un bucket con l'utente.
+
+        Args:
+            utente_id: ID dell'utente
+        Returns:
+            Array vuoto se l'utente non era presente quando l'indice è stato costruito
+        """
+        riga = self.matrice.indice_utente(utente_id)
+        if riga is None:
+            return np.zeros(0, dtype=np.int64)
+        gruppi = []
+        for bucket, ordine, indptr in zip(self._bucket, self._ordine, self._indptr):
+            b = bucket[riga]
+            gruppi.append(ordine[indptr[b]:indptr[b + 1]])
+        return np.unique(np.concatenate(gruppi))
+
+    def contiene(self, utente_id: int) -> bool:
+        return self.matrice.indice_utente(utente_id) is not None
+
+    def similarita_coseno(self, utente_id: int) -> Dict[int, float]:
+        """
+        Similarità coseno esatta tra l'utente e i soli candidati dell'indice.
+
+        Args:
+            utente_id: ID dell'utente
+        Returns:
+            Dizionario con user_id come chiave e similarità coseno come valore
+        """
+        return self.matrice.similarita_coseno_candidati(utente_id, self.candidati(utente_id))
+
+
+class IndiceCondiviso:
+    """
+    Indice condiviso tra le richieste: viene costruito al primo utilizzo e, quando è più vecchio
+    di ttl_secondi, ricostruito in background mentre le richieste continuano a usare quello attuale.
+    """
+    def __init__(self, costruisci: Callable[[], IndiceMinHash], ttl_secondi: float):
+        """
+        Args:
+            costruisci: Costruisce un nuovo indice dai rating correnti
+            ttl_secondi: Età oltre la quale l'indice viene ricostruito
+        """
+        self.costruisci = costruisci
+        self.ttl = ttl_secondi
+        self._indice: Optional[IndiceMinHash] = None
+        self._creato_il = 0.0
+        self._lock = threading.Lock()
+        self._in_aggiornamento = False
+
+    def ottieni(self) -> IndiceMinHash:
+        with self._lock:
+            if self._indice is None:
+                self._indice, self._creato_il = self.costruisci(), time.time()
+            elif time.time() - self._creato_il >= self.ttl and not self._in_aggiornamento:
+                self._in_aggiornamento = True
+                threading.Thread(target=self._aggiorna, daemon=True).start()
+            return self._indice
+
+    def _aggiorna(self):
+        try:
+            indice = self.costruisci()
+            with self._lock:
+                self._indice, self._creato_il = indice, time.time()
+        except Exception as e:
+            print(f"Errore nella ricostruzione dell'indice degli utenti simili: {e}")
+        finally:
+            with self._lock:
+                self._in_aggiornamento = False